@@ -1,10 +1,208 @@
 ﻿from abc import ABC, abstractmethod
-from typing import Dict, Optional, List
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, List, Tuple
+import asyncio
+import contextvars
+import copy
+import functools
+import importlib.util
+import json
 import logging
-from dataclasses import dataclass
-from datetime import datetime
+import pickle
+import random
+import struct
+import threading
+import time
+from dataclasses import dataclass, replace
+from datetime import datetime, date, timedelta
 
-@dataclass
+import numpy as np
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+from exceptions.weather_exceptions import LocationNotSupportedError, ProviderUnavailableError
+from utils.deadline import fetch_deadline, fetch_time_left
+from utils.gazetteer import get_gazetteer
+from utils.instrumentation import get_tracer
+from utils.singleflight import get_async_singleflight, get_singleflight
+
+# Wspolny, znormalizowany zestaw kolumn dziennych zwracanych przez klientow
+DAILY_FIELDS = ["avg_temp", "max_temp", "min_temp", "humidity", "pressure", "wind_speed", "precipitation"]
+
+# Kolumny godzinowe oraz sposob ich agregacji do kolumn dziennych
+HOURLY_FIELDS = ["temperature", "humidity", "pressure", "wind_speed", "precipitation"]
+DAILY_FROM_HOURLY = {
+    "avg_temp": ("temperature", "mean"),
+    "max_temp": ("temperature", "max"),
+    "min_temp": ("temperature", "min"),
+    "humidity": ("humidity", "mean"),
+    "pressure": ("pressure", "mean"),
+    "wind_speed": ("wind_speed", "mean"),
+    "precipitation": ("precipitation", "sum"),
+}
+
+SECONDS_PER_DAY = 86400
+
+
+def empty_daily_frame() -> pd.DataFrame:
+    return pd.DataFrame({"date": pd.Series(dtype="datetime64[ns]"),
+                         **{field: pd.Series(dtype="float64") for field in DAILY_FIELDS}})
+
+
+def day_to_epoch(day: date) -> int:
+    """Poczatek dnia jako sekundy od epoki w czasie lokalnym dostawcy"""
+    return (day - date(1970, 1, 1)).days * SECONDS_PER_DAY
+
+
+class HourlySeries:
+    """Obserwacje godzinowe w zwartych tablicach: czas int64 (sekundy od epoki) i wartosci float32"""
+    __slots__ = ("timestamps", "values")
+
+    def __init__(self, timestamps, values: Dict[str, np.ndarray]):
+        # np.asarray nie kopiuje tablic o zgodnym typie, np. mapowanych z pliku Arrow
+        self.timestamps = np.asarray(timestamps, dtype=np.int64)
+        self.values = {
+            field: np.asarray(values[field], dtype=np.float32) if field in values
+            else np.full(len(self.timestamps), np.nan, dtype=np.float32)
+            for field in HOURLY_FIELDS
+        }
+
+    @classmethod
+    def empty(cls) -> "HourlySeries":
+        return cls(np.empty(0, dtype=np.int64), {})
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def __getstate__(self):
+        return self.timestamps, self.values
+
+    def __setstate__(self, state):
+        self.timestamps, self.values = state
+
+    @property
+    def nbytes(self) -> int:
+        return self.timestamps.nbytes + sum(values.nbytes for values in self.values.values())
+
+    def first_day(self) -> Optional[date]:
+        return None if len(self) == 0 else date(1970, 1, 1) + timedelta(days=int(self.timestamps[0] // SECONDS_PER_DAY))
+
+    def last_day(self) -> Optional[date]:
+        return None if len(self) == 0 else date(1970, 1, 1) + timedelta(days=int(self.timestamps[-1] // SECONDS_PER_DAY))
+
+    def between(self, start: date, end: date) -> "HourlySeries":
+        """Widok (bez kopiowania) na godziny z dni [start, end]"""
+        lo, hi = np.searchsorted(self.timestamps, [day_to_epoch(start), day_to_epoch(end) + SECONDS_PER_DAY])
+        return HourlySeries(self.timestamps[lo:hi], {field: values[lo:hi] for field, values in self.values.items()})
+
+    def combine(self, fresh: "HourlySeries") -> "HourlySeries":
+        """Laczy z nowszymi danymi - dla powtorzonych godzin wygrywa fresh"""
+        if len(self) == 0:
+            return fresh
+        keep = ~np.isin(self.timestamps, fresh.timestamps)
+        timestamps = np.concatenate([self.timestamps[keep], fresh.timestamps])
+        order = np.argsort(timestamps, kind="stable")
+        return HourlySeries(timestamps[order], {
+            field: np.concatenate([self.values[field][keep], fresh.values[field]])[order] for field in HOURLY_FIELDS
+        })
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame({"time": self.timestamps.astype("datetime64[s]"), **self.values})
+
+    def to_daily(self) -> pd.DataFrame:
+        """Agregacja do ramki dziennej ('date' + DAILY_FIELDS) bez tworzenia ramki godzinowej"""
+        if len(self) == 0:
+            return empty_daily_frame()
+
+        days = self.timestamps // SECONDS_PER_DAY
+        starts = np.flatnonzero(np.r_[True, days[1:] != days[:-1]])
+
+        columns = {"date": days[starts].astype("datetime64[D]").astype("datetime64[ns]")}
+        for daily_field, (field, how) in DAILY_FROM_HOURLY.items():
+            columns[daily_field] = self._reduce(self.values[field], starts, how)
+        return pd.DataFrame(columns, columns=["date"] + DAILY_FIELDS)
+
+    @staticmethod
+    def _reduce(values: np.ndarray, starts: np.ndarray, how: str) -> np.ndarray:
+        values = values.astype(np.float64)
+        valid = ~np.isnan(values)
+        count = np.add.reduceat(valid.astype(np.int64), starts)
+
+        if how == "max":
+            result = np.maximum.reduceat(np.where(valid, values, -np.inf), starts)
+        elif how == "min":
+            result = np.minimum.reduceat(np.where(valid, values, np.inf), starts)
+        else:
+            result = np.add.reduceat(np.where(valid, values, 0.0), starts)
+            if how == "mean":
+                result = result / np.maximum(count, 1)
+
+        result[count == 0] = np.nan
+        return result
+
+
+# Zmienne szeregu dziennego i odpowiadajace im kolumny DAILY_FIELDS; temperature musi byc pierwsza
+SERIES_VARIABLES = {
+    "temperature": "avg_temp",
+    "max_temp": "max_temp",
+    "min_temp": "min_temp",
+    "humidity": "humidity",
+    "pressure": "pressure",
+    "wind_speed": "wind_speed",
+    "precipitation": "precipitation",
+}
+
+# Szereg dzienny jako jeden ciagly bufor: dzien od epoki + kolumna na kazda zmienna
+SERIES_DTYPE = np.dtype([("day", "<i4")] + [(variable, "<f8") for variable in SERIES_VARIABLES])
+
+# Naglowek to_bytes: znacznik, dlugosci napisow, 7 wartosci podsumowania, liczba dni i godzin
+_HEADER = struct.Struct("<4sHHH7dII")
+_MAGIC = b"WWD2"
+# Liczba dni w naglowku dla series=None (pusty bufor to 0)
+_NO_SERIES = 0xFFFFFFFF
+_SUMMARY_FIELDS = ("avg_temp", "max_temp", "min_temp", "humidity", "pressure", "wind_speed", "precipitation")
+
+
+def series_buffer(dates, temperatures, variables: Optional[Dict[str, np.ndarray]] = None) -> np.ndarray:
+    """Bufor SERIES_DTYPE; brakujace zmienne wypelnione NaN"""
+    dates = np.asarray(dates)
+    variables = variables or {}
+    series = np.empty(len(dates), dtype=SERIES_DTYPE)
+    series["day"] = dates.astype("datetime64[D]").astype(np.int64)
+    series["temperature"] = temperatures
+    for variable in list(SERIES_VARIABLES)[1:]:
+        series[variable] = variables[variable] if variable in variables else np.nan
+    return series
+
+
+def as_series_buffer(series) -> Optional[np.ndarray]:
+    """Bufor SERIES_DTYPE z bufora, ramki (date, temperature, ...) lub listy slownikow"""
+    if series is None:
+        return None
+    if isinstance(series, np.ndarray) and series.dtype == SERIES_DTYPE:
+        return series
+    if isinstance(series, np.ndarray) and series.dtype.names:
+        # Bufor z innym zestawem zmiennych (np. tylko day + temperature)
+        return series_buffer(series["day"].astype("datetime64[D]"), series["temperature"],
+                             {name: series[name] for name in series.dtype.names if name in SERIES_VARIABLES})
+    df = series if isinstance(series, pd.DataFrame) else pd.DataFrame(series)
+    dates = df["date"] if pd.api.types.is_datetime64_any_dtype(df["date"]) else pd.to_datetime(df["date"])
+    variables = {
+        variable: df[variable].to_numpy(dtype=np.float64, na_value=np.nan)
+        for variable in SERIES_VARIABLES if variable in df.columns
+    }
+    return series_buffer(dates.to_numpy(), variables.pop("temperature"), variables)
+
+
+def _aligned(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+# eq=False: wygenerowane __eq__ porownywaloby tablice numpy element po elemencie (ValueError)
+@dataclass(slots=True, eq=False)
 class WeatherData:
     source: str
     location: str
@@ -16,7 +214,27 @@ class WeatherData:
     pressure: Optional[float] = None
     wind_speed: Optional[float] = None
     precipitation: Optional[float] = None
-    series: Optional[List[Dict]] = None
+    # Bufor SERIES_DTYPE; konstruktor przyjmuje tez ramke (date, temperature, ...) lub liste slownikow
+    series: Optional[np.ndarray] = None
+    # Tylko w trybie RESOLUTION = "hourly"
+    hourly: Optional[HourlySeries] = None
+
+    def __post_init__(self):
+        self.series = as_series_buffer(self.series)
+
+    def __eq__(self, other):
+        # Porownanie zapisu binarnego: wszystkie pola naraz, NaN w buforach rowne NaN
+        if not isinstance(other, WeatherData):
+            return NotImplemented
+        return self.to_bytes() == other.to_bytes()
+
+    def series_frame(self) -> Optional[pd.DataFrame]:
+        if self.series is None:
+            return None
+        return pd.DataFrame({
+            "date": self.series["day"].astype("datetime64[D]").astype("datetime64[ns]"),
+            **{variable: self.series[variable] for variable in SERIES_VARIABLES},
+        })
 
     def to_dict(self) -> Dict:
         return {
@@ -30,13 +248,465 @@ class WeatherData:
             'pressure': self.pressure,
             'wind_speed': self.wind_speed,
             'precipitation': self.precipitation,
-            'series': self.series
+            'series': self.series_records()
         }
 
+    def series_records(self) -> Optional[List[Dict]]:
+        if self.series is None:
+            return None
+        days = self.series["day"].astype("datetime64[D]").astype(str).tolist()
+        columns = {variable: self.series[variable].tolist() for variable in SERIES_VARIABLES}
+        return [
+            {"date": day, **{variable: None if values[i] != values[i] else values[i]
+                             for variable, values in columns.items()}}
+            for i, day in enumerate(days)
+        ]
+
+    def to_bytes(self) -> bytes:
+        """Zwarty zapis binarny: naglowek, napisy, bufor szeregu i (opcjonalnie) kolumny godzinowe"""
+        source = self.source.encode("utf-8")
+        location = self.location.encode("utf-8")
+        timestamp = self.timestamp.isoformat().encode("ascii")
+        series = self.series if self.series is not None else np.empty(0, dtype=SERIES_DTYPE)
+        hourly = self.hourly if self.hourly is not None else HourlySeries.empty()
+
+        summary = [float("nan") if value is None else value for value in (getattr(self, f) for f in _SUMMARY_FIELDS)]
+        n_series = _NO_SERIES if self.series is None else len(series)
+        header = _HEADER.pack(_MAGIC, len(source), len(location), len(timestamp), *summary, n_series, len(hourly))
+
+        strings = source + location + timestamp
+        padding = b"\0" * (_aligned(len(header) + len(strings)) - len(header) - len(strings))
+        parts = [header, strings, padding, np.ascontiguousarray(series).tobytes()]
+        if len(hourly):
+            parts.append(hourly.timestamps.tobytes())
+            parts.extend(hourly.values[field].tobytes() for field in HOURLY_FIELDS)
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data) -> "WeatherData":
+        """Odtworzenie z to_bytes - tablice sa widokami na przekazany bufor, bez kopiowania"""
+        view = memoryview(data)
+        magic, n_source, n_location, n_timestamp, *summary, n_series, n_hourly = _HEADER.unpack_from(view)
+        if magic != _MAGIC:
+            raise ValueError("Nieprawidlowy format WeatherData")
+
+        offset = _HEADER.size
+        source = bytes(view[offset:offset + n_source]).decode("utf-8")
+        offset += n_source
+        location = bytes(view[offset:offset + n_location]).decode("utf-8")
+        offset += n_location
+        timestamp = datetime.fromisoformat(bytes(view[offset:offset + n_timestamp]).decode("ascii"))
+        offset = _aligned(offset + n_timestamp)
+
+        series = None
+        if n_series != _NO_SERIES:
+            series = np.frombuffer(view, dtype=SERIES_DTYPE, count=n_series, offset=offset)
+            offset += series.nbytes
+
+        hourly = None
+        if n_hourly:
+            timestamps = np.frombuffer(view, dtype=np.int64, count=n_hourly, offset=offset)
+            offset += timestamps.nbytes
+            values = {}
+            for field in HOURLY_FIELDS:
+                values[field] = np.frombuffer(view, dtype=np.float32, count=n_hourly, offset=offset)
+                offset += values[field].nbytes
+            hourly = HourlySeries(timestamps, values)
+
+        return cls(source, location, timestamp,
+                   *[None if value != value else value for value in summary],
+                   series=series, hourly=hourly)
+
+    def __reduce_ex__(self, protocol):
+        # Jeden ciagly bufor zamiast drzewa obiektow; od protokolu 5 moze byc przekazany poza strumieniem
+        payload = self.to_bytes()
+        if protocol >= 5:
+            return WeatherData.from_bytes, (pickle.PickleBuffer(payload),)
+        return WeatherData.from_bytes, (payload,)
+
+
+# Odpowiedzi, po ktorych warto ponowic zapytanie
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class TokenBucket:
+    """Limit zapytan: rate tokenow na sekunde, maksymalnie capacity naraz"""
+
+    def __init__(self, rate: Optional[float], capacity: int = 1):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Zajmuje token bez czekania; zwraca czas (s), po ktorym wolno wyslac zapytanie"""
+        if not self.rate:
+            return 0.0
+
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Ujemny stan to kolejka rezerwacji - kazda czeka na swoj token
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.rate)
+
+    def acquire(self) -> float:
+        """Czeka na wolny token; zwraca czas oczekiwania w sekundach"""
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+
+class CircuitBreaker:
+    """Po threshold kolejnych bledach odcina dostawce na reset_timeout s, potem przepuszcza jedna probe;
+    proba bez wyniku po reset_timeout s (zgubiona, anulowana) zwalnia miejsce dla nastepnej"""
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, threshold: int = 5, reset_timeout: float = 60):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_at = 0.0
+        self._state = self.CLOSED
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            now = time.monotonic()
+            if self._state == self.OPEN and now - self._opened_at >= self.reset_timeout:
+                # Jedna proba; kolejne zapytania czekaja na jej wynik
+                self._state = self.HALF_OPEN
+                self._probe_at = now
+                return True
+            if self._state == self.HALF_OPEN and now - self._probe_at >= self.reset_timeout:
+                self._probe_at = now
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._state = self.CLOSED
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+class HttpTransport:
+    """Wspolny transport HTTP dostawcy: pula polaczen keep-alive, gzip, ponowienia z jitterem,
+    limit zapytan, bezpiecznik i zapytania warunkowe (ETag / Last-Modified)"""
+
+    def __init__(self, provider: str, config):
+        self.provider = provider
+        self.retries = config.HTTP_RETRIES
+        self.backoff_base = config.HTTP_BACKOFF_BASE
+        self.backoff_max = config.HTTP_BACKOFF_MAX
+        self.connect_timeout = config.HTTP_CONNECT_TIMEOUT
+        self.read_timeout = config.FETCH_SOURCE_TIMEOUTS.get(provider, config.FETCH_TIMEOUT)
+        self.conditional_cache_size = config.HTTP_CONDITIONAL_CACHE_SIZE
+
+        rate, burst = config.HTTP_RATE_LIMITS.get(provider, (None, 1))
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(config.HTTP_BREAKER_THRESHOLD, config.HTTP_BREAKER_RESET_S)
+        self.logger = logging.getLogger(f"{__name__}.transport.{provider}")
+
+        self.session = requests.Session()
+        self.session.headers["Accept-Encoding"] = "gzip, deflate"
+        # Ponowienia obslugujemy sami (jitter, bezpiecznik), adapter tylko trzyma polaczenia
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=config.FETCH_MAX_WORKERS, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._conditional = OrderedDict()
+        self._conditional_lock = threading.Lock()
+
+        # Sesje aiohttp sa zwiazane z petla zdarzen, wiec trzymamy jedna na petle
+        self._async_connections = config.ASYNC_MAX_CONNECTIONS
+        self._async_sessions: Dict[asyncio.AbstractEventLoop, Any] = {}
+
+    def available(self) -> bool:
+        return self.breaker.state != CircuitBreaker.OPEN
+
+    def backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        # Pelny jitter: losowo z [0, min(max, base * 2^proba)], chyba ze serwer podal Retry-After
+        if retry_after is not None:
+            try:
+                return min(self.backoff_max, float(retry_after))
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    @contextmanager
+    def guarded(self):
+        """Bezpiecznik i limit dla wywolan przez biblioteki z wlasnym klientem HTTP; termin pobrania jest
+        sprawdzany tylko przed wywolaniem - biblioteka sama decyduje o timeoutach"""
+        left = fetch_time_left()
+        if left is not None and left <= 0:
+            raise requests.Timeout(f"Przekroczono termin pobrania z {self.provider}")
+        if not self.breaker.allow():
+            raise ProviderUnavailableError(f"{self.provider} chwilowo wylaczony po serii bledow")
+        try:
+            self.bucket.acquire()
+            yield
+        except BaseException:
+            # Kazdy blad (takze anulowanie) zamyka probe HALF_OPEN - inaczej bezpiecznik zostalby w niej na zawsze
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+
+    def get_json(self, url: str, params: Dict[str, Any] = None, timeout: Optional[float] = None,
+                 **span_attributes) -> Any:
+        if not self.breaker.allow():
+            raise ProviderUnavailableError(f"{self.provider} chwilowo wylaczony po serii bledow")
+
+        key = (url, tuple(sorted((params or {}).items())))
+        read_timeout = timeout or self.read_timeout
+
+        settled = False
+        try:
+            with get_tracer().span("http.request", source=self.provider, **span_attributes) as span:
+                for attempt in range(self.retries + 1):
+                    span.set("attempts", attempt + 1)
+                    span.add("throttled_s", self.bucket.acquire())
+
+                    # Timeouty nie dluzsze niz czas do terminu pobrania (ConcurrentFetchEngine)
+                    left = fetch_time_left()
+                    if left is not None and left <= 0:
+                        if attempt == 0:
+                            # Nie doszlo do zapytania - to nie jest blad dostawcy
+                            settled = True
+                            raise requests.Timeout(f"Przekroczono termin pobrania z {self.provider}")
+                        break
+                    timeout = (self.connect_timeout, read_timeout) if left is None else \
+                        (min(self.connect_timeout, left), min(read_timeout, left))
+
+                    headers = {}
+                    with self._conditional_lock:
+                        cached = self._conditional.get(key)
+                    if cached is not None:
+                        validators, _ = cached
+                        if validators.get("ETag"):
+                            headers["If-None-Match"] = validators["ETag"]
+                        if validators.get("Last-Modified"):
+                            headers["If-Modified-Since"] = validators["Last-Modified"]
+
+                    retry_after = None
+                    try:
+                        response = self.session.get(url, params=params, headers=headers, timeout=timeout)
+                    except (requests.ConnectionError, requests.Timeout) as e:
+                        error = e
+                    else:
+                        span.set("status", response.status_code)
+                        span.add("bytes", len(response.content))
+
+                        if response.status_code == 304 and cached is not None:
+                            settled = True
+                            self.breaker.record_success()
+                            span.set("conditional_hit", True)
+                            with self._conditional_lock:
+                                self._conditional.move_to_end(key)
+                            return cached[1]
+
+                        if response.status_code not in RETRY_STATUSES:
+                            # Bledy 4xx dotycza zapytania, nie stanu dostawcy
+                            settled = True
+                            self.breaker.record_success()
+                            response.raise_for_status()
+                            data = response.json()
+                            self._remember(key, response.headers, data)
+                            return data
+
+                        error = requests.HTTPError(f"{response.status_code} dla {self.provider}", response=response)
+                        retry_after = response.headers.get("Retry-After")
+
+                    if attempt < self.retries:
+                        delay = self.backoff(attempt, retry_after)
+                        left = fetch_time_left()
+                        if left is not None and left <= delay:
+                            self.logger.warning(f"Proba {attempt + 1} nieudana ({error}), brak czasu na ponowienie")
+                            break
+                        self.logger.warning(f"Proba {attempt + 1} nieudana ({error}), ponowienie za {delay:.2f}s")
+                        time.sleep(delay)
+
+                settled = True
+                self.breaker.record_failure()
+                raise error
+        except BaseException:
+            # Blad spoza obslugiwanych (np. ChunkedEncodingError, anulowanie) tez liczy sie jako porazka
+            if not settled:
+                self.breaker.record_failure()
+            raise
+
+    def _async_session(self):
+        import aiohttp
+
+        loop = asyncio.get_running_loop()
+        session = self._async_sessions.get(loop)
+        if session is None or session.closed:
+            session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self._async_connections),
+                timeout=aiohttp.ClientTimeout(sock_connect=self.connect_timeout, sock_read=self.read_timeout),
+                auto_decompress=True,
+            )
+            self._async_sessions[loop] = session
+        return session
+
+    async def aget_json(self, url: str, params: Dict[str, Any] = None, timeout: Optional[float] = None,
+                        **span_attributes) -> Any:
+        """get_json bez blokowania petli zdarzen (aiohttp): te same ponowienia, limit, bezpiecznik i ETag"""
+        import aiohttp
+
+        if not self.breaker.allow():
+            raise ProviderUnavailableError(f"{self.provider} chwilowo wylaczony po serii bledow")
+
+        session = self._async_session()
+        key = (url, tuple(sorted((params or {}).items())))
+        request_timeout = aiohttp.ClientTimeout(sock_connect=self.connect_timeout,
+                                                sock_read=timeout or self.read_timeout)
+
+        settled = False
+        try:
+            with get_tracer().span("http.request", source=self.provider, mode="async", **span_attributes) as span:
+                for attempt in range(self.retries + 1):
+                    span.set("attempts", attempt + 1)
+                    delay = self.bucket.reserve()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    span.add("throttled_s", delay)
+
+                    headers = {}
+                    with self._conditional_lock:
+                        cached = self._conditional.get(key)
+                    if cached is not None:
+                        validators, _ = cached
+                        if validators.get("ETag"):
+                            headers["If-None-Match"] = validators["ETag"]
+                        if validators.get("Last-Modified"):
+                            headers["If-Modified-Since"] = validators["Last-Modified"]
+
+                    retry_after = None
+                    try:
+                        async with session.get(url, params=params, headers=headers,
+                                               timeout=request_timeout) as response:
+                            body = await response.read()
+                            status, response_headers = response.status, response.headers
+                    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                        # Te same typy bledow co sciezka synchroniczna - klienci obsluguja je jednakowo
+                        error = requests.ConnectionError(f"{type(e).__name__}: {e}")
+                    else:
+                        span.set("status", status)
+                        span.add("bytes", len(body))
+
+                        if status == 304 and cached is not None:
+                            settled = True
+                            self.breaker.record_success()
+                            span.set("conditional_hit", True)
+                            with self._conditional_lock:
+                                self._conditional.move_to_end(key)
+                            return cached[1]
+
+                        if status not in RETRY_STATUSES:
+                            settled = True
+                            self.breaker.record_success()
+                            if status >= 400:
+                                raise requests.HTTPError(f"{status} dla {self.provider}")
+                            data = json.loads(body)
+                            self._remember(key, response_headers, data)
+                            return data
+
+                        error = requests.HTTPError(f"{status} dla {self.provider}")
+                        retry_after = response_headers.get("Retry-After")
+
+                    if attempt < self.retries:
+                        delay = self.backoff(attempt, retry_after)
+                        self.logger.warning(f"Proba {attempt + 1} nieudana ({error}), ponowienie za {delay:.2f}s")
+                        await asyncio.sleep(delay)
+
+                settled = True
+                self.breaker.record_failure()
+                raise error
+        except BaseException:
+            # Blad spoza obslugiwanych (np. ChunkedEncodingError, anulowanie) tez liczy sie jako porazka
+            if not settled:
+                self.breaker.record_failure()
+            raise
+
+    async def aclose(self) -> None:
+        """Zamyka sesje aiohttp biezacej petli zdarzen"""
+        session = self._async_sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None:
+            await session.close()
+
+    def _remember(self, key, headers, data: Any) -> None:
+        validators = {name: headers[name] for name in ("ETag", "Last-Modified") if name in headers}
+        if not validators or self.conditional_cache_size <= 0:
+            return
+        with self._conditional_lock:
+            self._conditional[key] = (validators, data)
+            self._conditional.move_to_end(key)
+            while len(self._conditional) > self.conditional_cache_size:
+                self._conditional.popitem(last=False)
+
+
+_transports: Dict[str, HttpTransport] = {}
+_transports_lock = threading.Lock()
+
+
+def get_transport(provider: str, config) -> HttpTransport:
+    """Jeden transport na dostawce w procesie - wspolna pula polaczen, limit i bezpiecznik"""
+    with _transports_lock:
+        if provider not in _transports:
+            _transports[provider] = HttpTransport(provider, config)
+        return _transports[provider]
+
+
+def async_http_available() -> bool:
+    """Czy jest aiohttp - bez niego sciezki async korzystaja z puli watkow"""
+    return importlib.util.find_spec("aiohttp") is not None
+
+
+async def close_async_transports() -> None:
+    with _transports_lock:
+        transports = list(_transports.values())
+    for transport in transports:
+        await transport.aclose()
+
+
+_blocking_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_blocking_executor(config) -> ThreadPoolExecutor:
+    """Pula dla bibliotek blokujacych wywolywanych z korutyn (afetch klientow bez natywnego HTTP)"""
+    global _blocking_executor
+    with _transports_lock:
+        if _blocking_executor is None:
+            _blocking_executor = ThreadPoolExecutor(max_workers=config.ASYNC_BLOCKING_WORKERS,
+                                                    thread_name_prefix="weather-blocking")
+        return _blocking_executor
+
 
 class WeatherAPIClient(ABC):
-    def __init__(self, name: str):
+    def __init__(self, name: str, cache=None, hourly_store=None):
         self.name = name
+        self.cache = cache
+        self.hourly_store = hourly_store
         self.logger = logging.getLogger(f"{__name__}.{name}")
 
     @abstractmethod
@@ -47,10 +717,205 @@ class WeatherAPIClient(ABC):
     def is_available(self) -> bool:
         pass
 
+    @property
+    def transport(self) -> HttpTransport:
+        # Transport nie jest atrybutem instancji, wiec klient pozostaje serializowalny dla puli procesow
+        return get_transport(self.name, self.config)
+
+    def fetch_coalesced(self, location: str) -> WeatherData:
+        """fetch() laczacy rownoczesne zapytania o to samo zrodlo, lokalizacje i zakres dat"""
+        if not self.config.SINGLE_FLIGHT_ENABLED:
+            return self.fetch(location)
+
+        try:
+            loc_key = self.resolve_location(location)[0]
+        except LocationNotSupportedError:
+            return self.fetch(location)
+
+        start, end = self.history_range()
+        key = (self.name, loc_key, start, end, self.config.RESOLUTION)
+        data, shared = get_singleflight("fetch").do(key, self.fetch, location)
+        if shared and data.location != location:
+            # Ta sama komorka siatki pod inna nazwa - dane wspolne, nazwa wolajacego
+            data = replace(data, location=location)
+        return data
+
+    async def afetch(self, location: str) -> WeatherData:
+        """Asynchroniczny fetch; domyslnie blokujacy fetch w puli watkow (np. biblioteka meteostat)"""
+        loop = asyncio.get_running_loop()
+        # Kopia kontekstu - spany z puli podpinaja sie pod span wolajacej korutyny
+        call = functools.partial(contextvars.copy_context().run, self.fetch, location)
+        return await loop.run_in_executor(get_blocking_executor(self.config), call)
+
+    async def afetch_coalesced(self, location: str) -> WeatherData:
+        """afetch() laczacy rownoczesne zapytania tak jak fetch_coalesced"""
+        if not self.config.SINGLE_FLIGHT_ENABLED:
+            return await self.afetch(location)
+
+        try:
+            loc_key = self.resolve_location(location)[0]
+        except LocationNotSupportedError:
+            return await self.afetch(location)
+
+        start, end = self.history_range()
+        key = (self.name, loc_key, start, end, self.config.RESOLUTION)
+        data, shared = await get_async_singleflight("fetch").do(key, self.afetch, location)
+        if shared and data.location != location:
+            data = replace(data, location=location)
+        return data
+
+    def fetch_many(self, locations: List[str]) -> Iterator[WeatherData]:
+        """Domyslnie pobiera lokalizacje po kolei; klienci z API wsadowym nadpisuja te metode"""
+        for location in locations:
+            try:
+                yield self.fetch(location)
+            except Exception as e:
+                self.logger.error(f"Nie udalo sie pobrac danych dla {location}: {e}")
+
+    def resolve_location(self, location: str) -> Tuple[str, float, float]:
+        """Klucz cache i wspolrzedne: z LOCATIONS, z gazetera albo podane jako 'lat,lon'"""
+        gazetteer = get_gazetteer(self.config)
+
+        loc_key = location.lower()
+        if loc_key in self.config.LOCATIONS:
+            lat, lon = self.config.LOCATIONS[loc_key]
+            if gazetteer is not None:
+                # Bliskie punkty trafiaja do tej samej komorki, wiec dziela cache i zapytania wsadowe
+                return gazetteer.snap(lat, lon)
+            return loc_key, lat, lon
+
+        resolved = gazetteer.resolve(location) if gazetteer is not None else None
+        if resolved is None:
+            raise LocationNotSupportedError(f"Lokalizacja o nazwie: '{location}' nie jest wspierane.")
+        return resolved.key, resolved.lat, resolved.lon
+
+    @abstractmethod
+    def _fetch_range(self, lat: float, lon: float, start: date, end: date) -> pd.DataFrame:
+        """Pobiera dane dzienne z zakresu [start, end] jako ramke z kolumnami 'date' + DAILY_FIELDS"""
+
+    @abstractmethod
+    def _fetch_hourly_range(self, lat: float, lon: float, start: date, end: date) -> HourlySeries:
+        """Pobiera dane godzinowe z zakresu dni [start, end]"""
+
+    def history_range(self) -> Tuple[date, date]:
+        today = datetime.now().date()
+        return today - timedelta(days=self.config.HISTORICAL_DAYS), today
+
+    def with_history_days(self, days: int) -> "WeatherAPIClient":
+        """Klient pobierajacy co najmniej days dni historii - kopia z wlasna konfiguracja; klient wspoldzielony
+        w procesie zostaje bez zmian, a cache, magazyny i transport pozostaja wspolne"""
+        if days <= self.config.HISTORICAL_DAYS:
+            return self
+        client = copy.copy(self)
+        client.config = replace(self.config, HISTORICAL_DAYS=days)
+        return client
+
+    def load_history(self, loc_key: str, lat: float, lon: float, start: date, end: date) -> pd.DataFrame:
+        """Zwraca historie z cache, dociagajac z API tylko brakujace zakresy dat"""
+        if self.cache is None:
+            return self._fetch_range(lat, lon, start, end)
+
+        cached, missing = self.cache.lookup(self.name, loc_key, start, end)
+        if not missing:
+            self.logger.info(f"Dane {self.name} dla {loc_key} w calosci z cache")
+            return cached
+
+        df = cached
+        for first, last in missing:
+            self.logger.info(f"Pobieranie brakujacego zakresu {first} - {last} z {self.name}")
+            fresh = self._fetch_range(lat, lon, first, last)
+            self.cache.store(self.name, loc_key, fresh)
+            df = self.combine_history(df, fresh)
+        return df
+
+    def load_hourly(self, loc_key: str, lat: float, lon: float, start: date, end: date) -> HourlySeries:
+        """Zwraca historie godzinowa z magazynu na dysku, dociagajac z API tylko brakujace dni"""
+        if self.hourly_store is None:
+            return self._fetch_hourly_range(lat, lon, start, end)
+
+        stored = self.hourly_store.read(self.name, loc_key)
+        first_day, last_day = stored.first_day(), stored.last_day()
+
+        if first_day is None or first_day > start:
+            missing = (start, end)
+        elif last_day >= end and self.hourly_store.is_fresh(self.name, loc_key, self.config.CACHE_RECENT_TTL_HOURS):
+            self.logger.info(f"Dane godzinowe {self.name} dla {loc_key} w calosci z magazynu")
+            return stored.between(start, end)
+        else:
+            # Ostatnie dni sa poprawiane przez dostawcow, wiec pobieramy je ponownie
+            missing = (max(start, min(last_day, end) - timedelta(days=self.config.CACHE_RECENT_DAYS)), end)
+
+        self.logger.info(f"Pobieranie godzin z zakresu {missing[0]} - {missing[1]} z {self.name}")
+        fresh = self._fetch_hourly_range(lat, lon, missing[0], missing[1])
+        self.hourly_store.write(self.name, loc_key, stored.combine(fresh))
+
+        # Ponowny odczyt daje tablice mapowane z pliku zamiast kopii w pamieci procesu
+        return self.hourly_store.read(self.name, loc_key).between(start, end)
+
+    def load_observations(self, loc_key: str, lat: float, lon: float, start: date,
+                          end: date) -> Tuple[pd.DataFrame, Optional[HourlySeries]]:
+        """Ramka dzienna dla prognoz oraz (w trybie godzinowym) zrodlowe dane godzinowe"""
+        if self.config.RESOLUTION == "hourly":
+            hourly = self.load_hourly(loc_key, lat, lon, start, end)
+            return hourly.to_daily(), hourly
+        return self.load_history(loc_key, lat, lon, start, end), None
+
+    @staticmethod
+    def combine_history(cached: pd.DataFrame, fresh: pd.DataFrame) -> pd.DataFrame:
+        if cached.empty:
+            return fresh
+        cached = cached[~cached["date"].isin(fresh["date"])]
+        return pd.concat([cached, fresh]).sort_values("date").reset_index(drop=True)
+
+    @staticmethod
+    def normalize_daily(df: pd.DataFrame, column_map: Dict[str, str], date_column: str) -> pd.DataFrame:
+        if df.empty or date_column not in df.columns:
+            return empty_daily_frame()
+
+        df = df.rename(columns={date_column: "date", **column_map})
+        df["date"] = pd.to_datetime(df["date"]).dt.normalize()
+
+        for field in DAILY_FIELDS:
+            if field not in df.columns:
+                df[field] = float("nan")
+
+        return df[["date"] + DAILY_FIELDS].sort_values("date").reset_index(drop=True)
+
+    def build_weather_data(self, location: str, df: pd.DataFrame, hourly: Optional[HourlySeries] = None) -> WeatherData:
+        avg_temp = self.safe_round(df["avg_temp"].mean())
+        if avg_temp is None:
+            avg_temp = self.safe_round(((df["min_temp"] + df["max_temp"]) / 2).mean())
+
+        # Wiersze bez temperatury pomijamy - pozostale zmienne sa wyrownane do jej osi czasu
+        temperatures = df["avg_temp"].to_numpy(dtype=np.float64, na_value=np.nan)
+        valid = ~np.isnan(temperatures)
+        series_data = series_buffer(df["date"].to_numpy()[valid], np.round(temperatures[valid], 2), {
+            variable: np.round(df[field].to_numpy(dtype=np.float64, na_value=np.nan)[valid], 2)
+            for variable, field in SERIES_VARIABLES.items() if variable != "temperature"
+        })
+
+        return WeatherData(
+            source=self.name,
+            location=location,
+            timestamp=datetime.now(),
+            avg_temp=avg_temp,
+            max_temp=self.safe_round(df["max_temp"].max()),
+            min_temp=self.safe_round(df["min_temp"].min()),
+            humidity=self.safe_round(df["humidity"].mean()),
+            pressure=self.safe_round(df["pressure"].mean()),
+            wind_speed=self.safe_round(df["wind_speed"].mean()),
+            precipitation=self.safe_round(df["precipitation"].sum(min_count=1)),
+            series=series_data,
+            hourly=hourly
+        )
+
     def safe_round(self, value, digits: int = 2) -> Optional[float]:
         if value is None or (hasattr(value, 'isna') and value.isna()):
             return None
         try:
-            return round(float(value), digits)
+            value = float(value)
         except (ValueError, TypeError):
-            return None
\ No newline at end of file
+            return None
+        if value != value:
+            return None
+        return round(value, digits)
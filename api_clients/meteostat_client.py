@@ -1,66 +1,89 @@
-﻿from meteostat import Point, Daily
-from datetime import datetime, timedelta
-from .base import WeatherAPIClient, WeatherData
+﻿from datetime import datetime, date
+from .base import WeatherAPIClient, WeatherData, HourlySeries
 from config.settings import WeatherConfig
-from exceptions.weather_exceptions import LocationNotSupportedError, DataFetchError
+from exceptions.weather_exceptions import DataFetchError
+from utils.history_cache import get_history_cache
+from utils.hourly_store import get_hourly_store
+from utils.instrumentation import get_tracer
+import numpy as np
 import pandas as pd
 
 
 class MeteostatClient(WeatherAPIClient):
+    COLUMN_MAP = {
+        "tavg": "avg_temp",
+        "tmax": "max_temp",
+        "tmin": "min_temp",
+        "rhum": "humidity",
+        "pres": "pressure",
+        "wspd": "wind_speed",
+        "prcp": "precipitation"
+    }
+    HOURLY_COLUMN_MAP = {
+        "temp": "temperature",
+        "rhum": "humidity",
+        "pres": "pressure",
+        "wspd": "wind_speed",
+        "prcp": "precipitation"
+    }
+
     def __init__(self):
-        super().__init__("Meteostat")
         self.config = WeatherConfig()
+        super().__init__("Meteostat", cache=get_history_cache(self.config),
+                         hourly_store=get_hourly_store(self.config))
 
     def is_available(self) -> bool:
-        return True
+        return self.transport.available()
 
-    def fetch(self, location: str) -> WeatherData:
-        self.logger.info(f"Pozyskanie danych pogodowych z Meteostat dla {location}")
+    def _fetch_range(self, lat: float, lon: float, start: date, end: date) -> pd.DataFrame:
+        from meteostat import Point, Daily
+
+        point = Point(lat, lon)
+        with self.transport.guarded(), get_tracer().span("meteostat.request", source=self.name) as span:
+            data = Daily(point, datetime.combine(start, datetime.min.time()),
+                         datetime.combine(end, datetime.min.time())).fetch()
+            span.set("rows", len(data))
+            span.set("bytes", int(data.memory_usage(deep=True).sum()))
+
+        return self.normalize_daily(data.reset_index(), self.COLUMN_MAP, "time")
 
-        loc_key = location.lower()
-        if loc_key not in self.config.LOCATIONS:
-            raise LocationNotSupportedError(f"Lokalizacja o nazwie: '{location}' nie jest wspierane.")
+    def _fetch_hourly_range(self, lat: float, lon: float, start: date, end: date) -> HourlySeries:
+        from meteostat import Point, Hourly
 
-        lat, lon = self.config.LOCATIONS[loc_key]
         point = Point(lat, lon)
+        with self.transport.guarded(), \
+                get_tracer().span("meteostat.request", source=self.name, resolution="hourly") as span:
+            data = Hourly(point, datetime.combine(start, datetime.min.time()),
+                          datetime.combine(end, datetime.max.time()), timezone="Europe/Warsaw").fetch()
+            span.set("rows", len(data))
+            span.set("bytes", int(data.memory_usage(deep=True).sum()))
+
+        if data.empty:
+            return HourlySeries.empty()
+
+        # Czas lokalny bez strefy - zgodnie z danymi Open-Meteo
+        times = data.index.tz_localize(None) if data.index.tz is not None else data.index
+        timestamps = times.to_numpy().astype("datetime64[s]").astype(np.int64)
+        return HourlySeries(timestamps, {
+            field: data[name].to_numpy(dtype=np.float32, na_value=np.nan)
+            for name, field in self.HOURLY_COLUMN_MAP.items() if name in data.columns
+        })
+
+    # Biblioteka meteostat jest blokujaca - afetch korzysta z domyslnej puli watkow WeatherAPIClient
+
+    def fetch(self, location: str) -> WeatherData:
+        self.logger.info(f"Pozyskanie danych pogodowych z Meteostat dla {location}")
 
-        today = datetime.now()
-        start = today - timedelta(days=self.config.HISTORICAL_DAYS)
+        loc_key, lat, lon = self.resolve_location(location)
+        start, today = self.history_range()
 
         try:
-            data = Daily(point, start, today).fetch()
+            data, hourly = self.load_observations(loc_key, lat, lon, start, today)
 
             if data.empty:
                 raise DataFetchError("Brak dostepnych danych z Meteostat")
 
-            avg_temp = None
-            if "tavg" in data.columns:
-                avg_temp = self.safe_round(data["tavg"].mean())
-            elif "tmin" in data.columns and "tmax" in data.columns:
-                avg_temp = self.safe_round(((data["tmin"] + data["tmax"]) / 2).mean())
-
-            series_data = []
-            if "tavg" in data.columns:
-                series_df = data[["tavg"]].reset_index()
-                series_data = [
-                    {"date": row["time"].strftime("%Y-%m-%d"), "temperature": self.safe_round(row["tavg"])}
-                    for _, row in series_df.iterrows()
-                    if pd.notna(row["tavg"])
-                ]
-
-            return WeatherData(
-                source=self.name,
-                location=location,
-                timestamp=datetime.now(),
-                avg_temp=avg_temp,
-                max_temp=self.safe_round(data["tmax"].max()) if "tmax" in data.columns else None,
-                min_temp=self.safe_round(data["tmin"].min()) if "tmin" in data.columns else None,
-                humidity=self.safe_round(data["rhum"].mean()) if "rhum" in data.columns else None,
-                pressure=self.safe_round(data["pres"].mean()) if "pres" in data.columns else None,
-                wind_speed=self.safe_round(data["wspd"].mean()) if "wspd" in data.columns else None,
-                precipitation=self.safe_round(data["prcp"].sum()) if "prcp" in data.columns else None,
-                series=series_data
-            )
+            return self.build_weather_data(location, data, hourly=hourly)
 
         except Exception as e:
             raise DataFetchError(f"Wystapil blad podczas pozyskiwania danych z Meteostat: {str(e)}")
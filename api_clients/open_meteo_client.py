@@ -1,82 +1,214 @@
 ﻿import requests
-from datetime import datetime, timedelta
-from .base import WeatherAPIClient, WeatherData
+from collections import defaultdict
+from datetime import date
+from typing import Iterator, List, Tuple
+from .base import WeatherAPIClient, WeatherData, HourlySeries, async_http_available
 from config.settings import WeatherConfig
-from exceptions.weather_exceptions import LocationNotSupportedError, DataFetchError
+from exceptions.weather_exceptions import LocationNotSupportedError, DataFetchError, ProviderUnavailableError
+from utils.history_cache import get_history_cache
+from utils.hourly_store import get_hourly_store
+import numpy as np
 import pandas as pd
 
 
 class OpenMeteoClient(WeatherAPIClient):
+    COLUMN_MAP = {
+        "temperature_2m_mean": "avg_temp",
+        "temperature_2m_max": "max_temp",
+        "temperature_2m_min": "min_temp",
+        "relative_humidity_2m_mean": "humidity",
+        "surface_pressure_mean": "pressure",
+        "wind_speed_10m_mean": "wind_speed",
+        "precipitation_sum": "precipitation"
+    }
+    HOURLY_COLUMN_MAP = {
+        "temperature_2m": "temperature",
+        "relative_humidity_2m": "humidity",
+        "surface_pressure": "pressure",
+        "wind_speed_10m": "wind_speed",
+        "precipitation": "precipitation"
+    }
+
     def __init__(self):
-        super().__init__("OpenMeteo")
         self.config = WeatherConfig()
-        self.base_url = "https://archive-api.open-meteo.com/v1/archive"
+        super().__init__("OpenMeteo", cache=get_history_cache(self.config),
+                         hourly_store=get_hourly_store(self.config))
+        self.base_url = self.config.OPEN_METEO_ARCHIVE_URL
 
     def is_available(self) -> bool:
-        return True
+        return self.transport.available()
+
+    @staticmethod
+    def _params(coords: List[Tuple[float, float]], start: date, end: date, resolution: str, variables) -> dict:
+        return {
+            "latitude": ",".join(str(lat) for lat, _ in coords),
+            "longitude": ",".join(str(lon) for _, lon in coords),
+            "start_date": start.isoformat(),
+            "end_date": end.isoformat(),
+            resolution: ",".join(variables),
+            "timezone": "Europe/Warsaw"
+        }
+
+    @staticmethod
+    def _payloads(data, coords: List[Tuple[float, float]]) -> List[dict]:
+        # Dla wielu wspolrzednych API zwraca liste obiektow w tej samej kolejnosci
+        payloads = data if isinstance(data, list) else [data]
+        if len(payloads) != len(coords):
+            raise DataFetchError(f"Open-Meteo zwrocilo {len(payloads)} odpowiedzi dla {len(coords)} lokalizacji")
+        return payloads
+
+    def _request(self, coords: List[Tuple[float, float]], start: date, end: date, resolution: str,
+                 variables) -> List[dict]:
+        params = self._params(coords, start, end, resolution, variables)
+        data = self.transport.get_json(self.base_url, params, locations=len(coords))
+        return self._payloads(data, coords)
+
+    def _daily_frames(self, payloads: List[dict]) -> List[pd.DataFrame]:
+        frames = []
+        for payload in payloads:
+            daily = payload.get("daily", {})
+            if not daily:
+                raise DataFetchError("Brak dostepnych danych z Open-Meteo")
+            frames.append(self.normalize_daily(pd.DataFrame(daily), self.COLUMN_MAP, "time"))
+        return frames
+
+    def _request_daily(self, coords: List[Tuple[float, float]], start: date, end: date) -> List[pd.DataFrame]:
+        return self._daily_frames(self._request(coords, start, end, "daily", self.COLUMN_MAP))
+
+    def _fetch_range(self, lat: float, lon: float, start: date, end: date) -> pd.DataFrame:
+        return self._request_daily([(lat, lon)], start, end)[0]
+
+    def _fetch_hourly_range(self, lat: float, lon: float, start: date, end: date) -> HourlySeries:
+        hourly = self._request([(lat, lon)], start, end, "hourly", self.HOURLY_COLUMN_MAP)[0].get("hourly", {})
+        if not hourly.get("time"):
+            raise DataFetchError("Brak dostepnych danych godzinowych z Open-Meteo")
+
+        # Czas lokalny "YYYY-MM-DDTHH:MM" zapisujemy jako sekundy od epoki bez przesuniecia strefy
+        timestamps = np.array(hourly["time"], dtype="datetime64[m]").astype("datetime64[s]").astype(np.int64)
+        return HourlySeries(timestamps, {
+            field: np.array(hourly[name], dtype=np.float32)
+            for name, field in self.HOURLY_COLUMN_MAP.items() if name in hourly
+        })
 
     def fetch(self, location: str) -> WeatherData:
         self.logger.info(f"Pozyskanie danych pogodowych z Open-Meteo dla {location}")
 
-        loc_key = location.lower()
-        if loc_key not in self.config.LOCATIONS:
-            raise LocationNotSupportedError(f"Lokalizacja o nazwie: '{location}' nie jest wspierane.")
+        loc_key, lat, lon = self.resolve_location(location)
+        start_date, today = self.history_range()
 
-        lat, lon = self.config.LOCATIONS[loc_key]
+        try:
+            df, hourly = self.load_observations(loc_key, lat, lon, start_date, today)
+            if df.empty:
+                raise DataFetchError("Brak dostepnych danych z Open-Meteo")
 
-        today = datetime.now().date()
-        start_date = today - timedelta(days=self.config.HISTORICAL_DAYS)
+            return self.build_weather_data(location, df, hourly=hourly)
 
-        params = {
-            "latitude": lat,
-            "longitude": lon,
-            "start_date": start_date.isoformat(),
-            "end_date": today.isoformat(),
-            "daily": "temperature_2m_mean,temperature_2m_max,temperature_2m_min,relative_humidity_2m_mean,surface_pressure_mean,wind_speed_10m_mean,precipitation_sum",
-            "timezone": "Europe/Warsaw"
-        }
+        except ProviderUnavailableError:
+            raise
+        except requests.RequestException as e:
+            raise DataFetchError(f"Wystapil blad podczas pozyskiwania danych z Open-Meteo: {str(e)}")
+        except Exception as e:
+            raise DataFetchError(f"Wystapil blad podczas procesowania danych z Open-Meteo : {str(e)}")
+
+    async def afetch(self, location: str) -> WeatherData:
+        """Natywnie asynchroniczny fetch (aiohttp) - tysiace lokalizacji w jednej petli bez watkow"""
+        if self.config.RESOLUTION == "hourly" or not async_http_available():
+            # Magazyn godzinowy zapisuje pliki synchronicznie - ta sciezka zostaje w puli watkow
+            return await super().afetch(location)
+
+        self.logger.info(f"Pozyskanie danych pogodowych z Open-Meteo dla {location} (async)")
+        loc_key, lat, lon = self.resolve_location(location)
+        start_date, today = self.history_range()
 
         try:
-            response = requests.get(self.base_url, params=params, timeout=30)
-            response.raise_for_status()
-            data = response.json()
+            if self.cache is None:
+                cached, missing = pd.DataFrame(), [(start_date, today)]
+            else:
+                cached, missing = self.cache.lookup(self.name, loc_key, start_date, today)
 
-            daily = data.get("daily", {})
-            if not daily:
-                raise DataFetchError("Brak dostepnych danych z Open-Meteo")
+            df = cached
+            coords = [(lat, lon)]
+            for first, last in missing:
+                params = self._params(coords, first, last, "daily", self.COLUMN_MAP)
+                data = await self.transport.aget_json(self.base_url, params, locations=1)
+                fresh = self._daily_frames(self._payloads(data, coords))[0]
+                if self.cache is not None:
+                    self.cache.store(self.name, loc_key, fresh)
+                df = self.combine_history(df, fresh)
 
-            df = pd.DataFrame(daily)
-
-            series_data = []
-            if "time" in df.columns and "temperature_2m_mean" in df.columns:
-                series_data = [
-                    {"date": row["time"], "temperature": self.safe_round(row["temperature_2m_mean"])}
-                    for _, row in df.iterrows()
-                    if pd.notna(row["temperature_2m_mean"])
-                ]
-
-            return WeatherData(
-                source=self.name,
-                location=location,
-                timestamp=datetime.now(),
-                avg_temp=self.safe_round(
-                    df["temperature_2m_mean"].mean()) if "temperature_2m_mean" in df.columns else None,
-                max_temp=self.safe_round(
-                    df["temperature_2m_max"].max()) if "temperature_2m_max" in df.columns else None,
-                min_temp=self.safe_round(
-                    df["temperature_2m_min"].min()) if "temperature_2m_min" in df.columns else None,
-                humidity=self.safe_round(
-                    df["relative_humidity_2m_mean"].mean()) if "relative_humidity_2m_mean" in df.columns else None,
-                pressure=self.safe_round(
-                    df["surface_pressure_mean"].mean()) if "surface_pressure_mean" in df.columns else None,
-                wind_speed=self.safe_round(
-                    df["wind_speed_10m_mean"].mean()) if "wind_speed_10m_mean" in df.columns else None,
-                precipitation=self.safe_round(
-                    df["precipitation_sum"].sum()) if "precipitation_sum" in df.columns else None,
-                series=series_data
-            )
+            if df.empty:
+                raise DataFetchError("Brak dostepnych danych z Open-Meteo")
+            return self.build_weather_data(location, df)
 
+        except ProviderUnavailableError:
+            raise
         except requests.RequestException as e:
             raise DataFetchError(f"Wystapil blad podczas pozyskiwania danych z Open-Meteo: {str(e)}")
         except Exception as e:
             raise DataFetchError(f"Wystapil blad podczas procesowania danych z Open-Meteo : {str(e)}")
+
+    def fetch_many(self, locations: List[str]) -> Iterator[WeatherData]:
+        """Pobiera wiele lokalizacji jednym zapytaniem na kazdy wspolny brakujacy zakres dat; lokalizacja
+        z kilkoma lukami w cache jest zwracana po pobraniu wszystkich"""
+        if self.config.RESOLUTION == "hourly":
+            # Zapytania wsadowe dotycza tylko cache dziennego
+            yield from super().fetch_many(locations)
+            return
+
+        self.logger.info(f"Pozyskanie danych pogodowych z Open-Meteo dla {len(locations)} lokalizacji")
+        start_date, today = self.history_range()
+
+        # Lokalizacje z tej samej komorki siatki maja wspolny klucz i sa pobierane raz
+        groups = defaultdict(list)
+        pending = {}
+        for location in locations:
+            try:
+                loc_key, lat, lon = self.resolve_location(location)
+            except LocationNotSupportedError as e:
+                self.logger.error(str(e))
+                continue
+
+            if loc_key in pending:
+                pending[loc_key]["locations"].append(location)
+                continue
+
+            if self.cache is None:
+                cached, missing = pd.DataFrame(), [(start_date, today)]
+            else:
+                cached, missing = self.cache.lookup(self.name, loc_key, start_date, today)
+
+            if not missing:
+                yield self.build_weather_data(location, cached)
+                continue
+            pending[loc_key] = {"coords": (lat, lon), "df": cached, "remaining": len(missing),
+                                "failed": False, "locations": [location]}
+            for missing_range in missing:
+                groups[missing_range].append(loc_key)
+
+        batch_size = self.config.OPEN_METEO_BATCH_SIZE
+        for (start, end), keys in groups.items():
+            for i in range(0, len(keys), batch_size):
+                chunk = keys[i:i + batch_size]
+                try:
+                    frames = self._request_daily([pending[key]["coords"] for key in chunk], start, end)
+                except (requests.RequestException, DataFetchError) as e:
+                    self.logger.error(f"Wystapil blad podczas pozyskiwania danych z Open-Meteo: {e}")
+                    frames = [None] * len(chunk)
+
+                for loc_key, fresh in zip(chunk, frames):
+                    entry = pending[loc_key]
+                    entry["remaining"] -= 1
+                    if fresh is None:
+                        entry["failed"] = True
+                    else:
+                        if self.cache is not None:
+                            self.cache.store(self.name, loc_key, fresh)
+                        entry["df"] = self.combine_history(entry["df"], fresh)
+                    if entry["remaining"] or entry["failed"]:
+                        continue
+
+                    if entry["df"].empty:
+                        self.logger.error(f"Brak dostepnych danych z Open-Meteo dla {', '.join(entry['locations'])}")
+                        continue
+                    for location in entry["locations"]:
+                        yield self.build_weather_data(location, entry["df"])
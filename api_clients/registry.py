@@ -0,0 +1,80 @@
+﻿import importlib
+import logging
+import pkgutil
+import threading
+from pathlib import Path
+from typing import List, Optional, Type
+
+from .base import WeatherAPIClient
+
+logger = logging.getLogger(__name__)
+
+# Moduly pakietu, ktore nie zawieraja klientow
+_SKIPPED_MODULES = ('base', 'registry', '__init__')
+
+
+class ClientRegistry:
+    """Jednorazowe wykrycie i utworzenie klientow API; kolejne wywolania korzystaja z gotowych instancji"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients: Optional[List[WeatherAPIClient]] = None
+
+    @staticmethod
+    def discover() -> List[Type[WeatherAPIClient]]:
+        classes = []
+
+        for _, modname, _ in pkgutil.iter_modules([str(Path(__file__).parent)]):
+            if modname in _SKIPPED_MODULES:
+                continue
+
+            try:
+                module = importlib.import_module(f'api_clients.{modname}')
+            except ImportError as e:
+                logger.error(f"Wystapil bląd z zaladowaniem modulu {modname}: {e}")
+                continue
+
+            for attr in dir(module):
+                obj = getattr(module, attr)
+                if (isinstance(obj, type) and
+                        issubclass(obj, WeatherAPIClient) and
+                        obj is not WeatherAPIClient and
+                        obj.__module__ == module.__name__):
+                    classes.append(obj)
+
+        return classes
+
+    def clients(self) -> List[WeatherAPIClient]:
+        with self._lock:
+            if self._clients is None:
+                self._clients = []
+                for client_class in self.discover():
+                    try:
+                        client = client_class()
+                    except Exception as e:
+                        logger.error(f"Nie udalo sie utworzyc klienta {client_class.__name__}: {e}")
+                        continue
+                    self._clients.append(client)
+                    logger.info(f"Zaladowano dla: {client.name}")
+            return list(self._clients)
+
+    def override(self, clients: List[WeatherAPIClient]) -> None:
+        """Podmienia wykryte instancje (benchmarki, testy z lokalnym serwerem)"""
+        with self._lock:
+            self._clients = list(clients)
+
+    def available_clients(self) -> List[WeatherAPIClient]:
+        available = []
+        for client in self.clients():
+            if client.is_available():
+                available.append(client)
+            else:
+                logger.warning(f"{client.name} nie jest chwilowo dostepny")
+        return available
+
+
+_registry = ClientRegistry()
+
+
+def get_client_registry() -> ClientRegistry:
+    return _registry
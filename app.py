@@ -1,23 +1,75 @@
 ﻿# dashboard/app.py
 import streamlit as st
 from main import WeatherWise
-from utils.series_merge import TimeSeriesMerger
-from models.prophet_model import WeatherForecaster
+from config.settings import WeatherConfig
+
+config = WeatherConfig()
 
 st.set_page_config(page_title="Prognoza pogody", layout="centered")
 
+
+# Wspoldzielone przez wszystkie sesje: rejestr klientow, pule watkow/procesow, silnik prognozy
+@st.cache_resource
+def get_weather_app() -> WeatherWise:
+    return WeatherWise()
+
+
+# Rownolegle sesje pytajace o to samo miasto czekaja na jedno wywolanie zamiast pobierac N razy
+@st.cache_data(ttl=config.APP_FETCH_TTL_SECONDS, show_spinner=False)
+def fetch_weather(location: str):
+    return get_weather_app().fetch_all_data(location)
+
+
+@st.cache_data(show_spinner=False)
+def merge_weather(_data, data_key: str):
+    weather = get_weather_app()
+    return weather.merger.merge_series(_data, weights=config.MERGE_SOURCE_WEIGHTS, quality=weather.source_quality)
+
+
+@st.cache_data(show_spinner=False)
+def forecast_weather(_series, series_key: str, periods: int, location: str):
+    weather = get_weather_app()
+    forecast = weather.forecaster.forecast_temperature(_series, periods=periods, location=location)
+    # Zapis wynikow raz na dane wejsciowe (cache_data), a nie przy kazdym kliknieciu
+    weather.save_results(location, _series, {"temperature": forecast})
+    return forecast
+
+
+# Renderer trzyma jedna figure-szablon i cache obrazow po skrocie prognozy - pamiec stala miedzy sesjami
+def render_forecast_plot(forecast, series, location: str, day: str) -> bytes:
+    from pathlib import Path
+    from models.plot_renderer import FILE_SUFFIXES
+
+    forecaster = get_weather_app().forecaster
+    forecast, history = forecast.tail(14), series.tail(30)
+    title = f"Prognoza temperatury - {location}"
+
+    # zapisanie wykresu - raz na dane wejsciowe, a nie przy kazdym kliknieciu
+    output_dir = Path(config.OUTPUT_DIR)
+    output_dir.mkdir(exist_ok=True)
+    plot_path = output_dir / f"forecast_{location.lower()}_{day}{FILE_SUFFIXES.get(config.PLOT_FORMAT, '.png')}"
+    if not plot_path.exists():
+        forecaster.plot_forecast(forecast, history, title=title, save_path=str(plot_path))
+
+    return forecaster.plot_forecast(forecast, history, title=title, fmt="png", dpi=config.APP_PLOT_DPI)
+
+
 st.title("Prognoza temperatury")
 location = st.selectbox("Wybierz lokalizację:", ["Warsaw", "Krakow", "Poznan", "Gdansk"])
+custom_location = st.text_input("Albo wpisz miejscowość lub współrzędne (lat,lon):")
+location = custom_location.strip() or location
 
 if st.button("Pobierz dane i pokaz prognoze"):
     with st.spinner("Pobieranie danych pogodowych..."):
         try:
-            weather = WeatherWise()
-            merger = TimeSeriesMerger()
-            prophet = WeatherForecaster()
-            data = weather.fetch_all_data(location)
-            combined_series = merger.merge_series(data)
-            forecast = prophet.forecast_temperature(combined_series, periods=7)
+            from datetime import datetime
+            from models.model_cache import ForecastModelCache
+
+            weather = get_weather_app()
+            data = fetch_weather(location)
+            combined_series = merge_weather(data, weather.merger.fingerprint(data))
+            series_key = ForecastModelCache.fingerprint(combined_series)
+            forecast = forecast_weather(combined_series, series_key, 7, location)
         except Exception as e:
             st.error(f"Coś poszło nie tak: {e}")
         else:
@@ -42,24 +94,8 @@ if st.button("Pobierz dane i pokaz prognoze"):
 
 
             st.subheader("Wykres prognozy")
-            fig = weather.forecaster.plot_forecast(
-                forecast.tail(14),
-                historical_df=combined_series.tail(30),
-                title=f"Prognoza temperatury - {location}"
-            )
-
-# zapisanie wykresu
-            from pathlib import Path
-            from datetime import datetime
-
-            output_dir = Path("output")
-            output_dir.mkdir(exist_ok=True)
-            plot_path = output_dir / f"forecast_{location.lower()}_{datetime.now().strftime('%Y%m%d')}.png"
-            fig.savefig(str(plot_path), dpi=300, bbox_inches='tight')
-
-
-
+            plot_png = render_forecast_plot(forecast, combined_series, location, datetime.now().strftime('%Y%m%d'))
 
 #pokazuje wykres na stronie
-            st.pyplot(fig)
+            st.image(plot_png)
 
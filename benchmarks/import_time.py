@@ -0,0 +1,72 @@
+﻿"""
+Pomiar czasu zimnego startu (python -X importtime) z progiem regresji.
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --module app --budget-ms 2000
+"""
+import argparse
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Moduly, ktore nie moga byc ladowane przy samym imporcie punktu wejscia
+HEAVY_MODULES = ("prophet", "cmdstanpy", "matplotlib", "pandas", "meteostat", "psutil")
+
+
+def measure_imports(module: str) -> Tuple[float, Dict[str, Tuple[int, int]]]:
+    """Zwraca (czas importu modulu w ms, {modul: (self us, cumulative us)})"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Import {module} nie powiodl sie:\n{result.stderr}")
+
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        timings[name.strip()] = (int(self_us), int(cumulative_us))
+
+    return timings[module][1] / 1000, timings
+
+
+def report(module: str, top: int) -> Tuple[float, List[str]]:
+    total_ms, timings = measure_imports(module)
+
+    print(f"Import '{module}': {total_ms:.1f} ms, {len(timings)} modulow")
+    print(f"{'cumulative [ms]':>16} {'self [ms]':>10}  modul")
+    for name, (self_us, cumulative_us) in sorted(timings.items(), key=lambda item: -item[1][1])[:top]:
+        print(f"{cumulative_us / 1000:>16.1f} {self_us / 1000:>10.1f}  {name}")
+
+    heavy = sorted({name for name in timings if name.split(".")[0] in HEAVY_MODULES and "." not in name})
+    return total_ms, heavy
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Raport czasu importu punktu wejscia WeatherWise")
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--budget-ms", type=float, default=150.0)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--allow-heavy", action="store_true", help="nie traktuj ciezkich modulow jako bledu")
+    args = parser.parse_args()
+
+    total_ms, heavy = report(args.module, args.top)
+
+    failed = False
+    if total_ms > args.budget_ms:
+        print(f"REGRESJA: import trwa {total_ms:.1f} ms (limit {args.budget_ms:.0f} ms)")
+        failed = True
+    if heavy and not args.allow_heavy:
+        print(f"REGRESJA: ciezkie moduly ladowane przy starcie: {', '.join(heavy)}")
+        failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
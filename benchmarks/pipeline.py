@@ -0,0 +1,234 @@
+﻿"""
+Benchmark potoku pobranie -> scalanie -> agregacja -> prognoza na lokalnych zastepcach dostawcow.
+
+    python benchmarks/pipeline.py --locations 1,10,100 --years 1,5
+    python benchmarks/pipeline.py --save-baseline          # zapis wynikow jako punkt odniesienia
+    python benchmarks/pipeline.py --tolerance 0.25         # blad, gdy wynik gorszy o > 25%
+    python benchmarks/pipeline.py --ci                     # jak wyzej; brak punktu odniesienia to tez blad
+"""
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from standin import OpenMeteoStandIn, FakeMeteostatClient  # noqa: E402
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baseline.json"
+STAGES = ("fetch", "merge", "aggregate", "forecast")
+# Etapy trwajace kilka ms roznia sie miedzy przebiegami o wiecej niz tolerancja - staly zapas dla p95
+P95_SLACK_MS = 2.0
+
+
+def percentile(samples: List[float], q: float) -> float:
+    ordered = sorted(samples)
+    if len(ordered) == 1:
+        return ordered[0]
+    position = (len(ordered) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(latencies: List[float], wall_s: float, peak_bytes: int) -> Dict[str, float]:
+    return {
+        "calls": len(latencies),
+        "throughput_per_s": round(len(latencies) / wall_s, 3) if wall_s > 0 else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3),
+        "peak_mb": round(peak_bytes / (1024 * 1024), 2),
+    }
+
+
+def run_stage(func: Callable, inputs: List) -> Dict[str, float]:
+    """Pomiar czasu bez tracemalloc, potem osobny przebieg dla szczytowej pamieci"""
+    latencies = []
+    outputs = []
+    started = time.perf_counter()
+    for item in inputs:
+        call_started = time.perf_counter()
+        outputs.append(func(item))
+        latencies.append(time.perf_counter() - call_started)
+    wall_s = time.perf_counter() - started
+
+    tracemalloc.start()
+    for item in inputs[:max(1, min(len(inputs), 20))]:
+        func(item)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"summary": summarize(latencies, wall_s, peak), "outputs": outputs}
+
+
+def build_app(standin: OpenMeteoStandIn, locations: Dict[str, tuple], years: int, latency_ms: float,
+              jitter_ms: float, seed: int):
+    from main import WeatherWise
+    from api_clients.open_meteo_client import OpenMeteoClient
+    from api_clients.registry import get_client_registry
+
+    clients = [OpenMeteoClient(), FakeMeteostatClient(latency_ms=latency_ms, jitter_ms=jitter_ms, seed=seed)]
+    for client in clients:
+        client.cache = None
+        client.base_url = standin.url
+        client.config.LOCATIONS = locations
+        client.config.HISTORICAL_DAYS = years * 365
+        # Limity zapytan chronia prawdziwych dostawcow - lokalny serwer mierzymy bez nich
+        client.config.HTTP_RATE_LIMITS = {}
+    get_client_registry().override(clients)
+
+    return WeatherWise()
+
+
+def run_scenario(n_locations: int, years: int, args) -> Dict[str, Dict[str, float]]:
+    from utils.aggregator import WeatherAggregator
+    from utils.quality import create_source_quality
+    from utils.series_merge import TimeSeriesMerger
+    from models.prophet_model import WeatherForecaster
+
+    locations = {
+        f"bench_{i:04d}": (round(49.0 + (i * 0.37) % 6, 4), round(14.1 + (i * 0.53) % 10, 4))
+        for i in range(n_locations)
+    }
+
+    standin = OpenMeteoStandIn(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                               recording=args.recording, seed=args.seed).start()
+    app = build_app(standin, locations, years, args.latency_ms, args.jitter_ms, args.seed)
+    forecaster = WeatherForecaster(engine=args.engine)
+    forecaster.cache = None
+
+    results = {}
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            fetched = run_stage(app.fetch_all_data, list(locations))
+        results["fetch"] = fetched["summary"]
+        results["fetch"]["requests"] = standin.requests
+        results["fetch"]["bytes"] = standin.bytes_sent
+
+        quality = create_source_quality(app.config)
+        merged = run_stage(lambda data: TimeSeriesMerger.merge_series(data, quality=quality), fetched["outputs"])
+        results["merge"] = merged["summary"]
+
+        results["aggregate"] = run_stage(WeatherAggregator.aggregate_weather_data, fetched["outputs"])["summary"]
+
+        forecast_inputs = merged["outputs"][:args.forecast_limit] if args.forecast_limit else merged["outputs"]
+        results["forecast"] = run_stage(forecaster.forecast_temperature, forecast_inputs)["summary"]
+    finally:
+        app.close()
+        standin.stop()
+
+    return results
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float, strict: bool = False) -> List[str]:
+    """Regresje wzgledem punktu odniesienia; strict: etap bez punktu odniesienia tez jest bledem"""
+    regressions = []
+    for scenario, stages in results.items():
+        for stage, current in stages.items():
+            reference = baseline.get(scenario, {}).get(stage)
+            if reference is None:
+                if strict:
+                    regressions.append(f"{scenario}/{stage}: brak w punkcie odniesienia")
+                continue
+            if current["p95_ms"] > reference["p95_ms"] * (1 + tolerance) + P95_SLACK_MS:
+                regressions.append(f"{scenario}/{stage}: p95 {current['p95_ms']} ms > {reference['p95_ms']} ms")
+            if current["throughput_per_s"] < reference["throughput_per_s"] / (1 + tolerance):
+                regressions.append(
+                    f"{scenario}/{stage}: throughput {current['throughput_per_s']}/s "
+                    f"< {reference['throughput_per_s']}/s"
+                )
+            if current["peak_mb"] > reference["peak_mb"] * (1 + tolerance) + 1:
+                regressions.append(f"{scenario}/{stage}: peak {current['peak_mb']} MB > {reference['peak_mb']} MB")
+    return regressions
+
+
+def print_table(results: Dict) -> None:
+    print(f"{'scenariusz':<16} {'etap':<10} {'calls':>6} {'op/s':>10} {'p50 ms':>9} "
+          f"{'p95 ms':>9} {'p99 ms':>9} {'peak MB':>8}")
+    for scenario, stages in results.items():
+        for stage in STAGES:
+            row = stages[stage]
+            print(f"{scenario:<16} {stage:<10} {row['calls']:>6} {row['throughput_per_s']:>10.2f} "
+                  f"{row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f} {row['peak_mb']:>8.2f}")
+
+
+def parse_ints(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark potoku WeatherWise na lokalnych zastepcach API")
+    parser.add_argument("--locations", type=parse_ints, default=[1, 10, 100], help="np. 1,10,100,1000")
+    parser.add_argument("--years", type=parse_ints, default=[1, 5], help="np. 1,5,30")
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--recording", help="nagrana odpowiedz Open-Meteo (JSON) zamiast danych syntetycznych")
+    parser.add_argument("--engine", default="harmonic", help="silnik prognozy (prophet jest wolny dla >10 lokalizacji)")
+    parser.add_argument("--forecast-limit", type=int, default=0, help="maks. liczba prognoz na scenariusz (0 = bez limitu)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--output", type=Path, help="zapis wynikow do pliku JSON")
+    parser.add_argument("--ci", action="store_true", default=bool(os.environ.get("CI")),
+                        help="brak punktu odniesienia lub scenariusza w nim to blad (domyslnie gdy ustawione CI)")
+    args = parser.parse_args()
+
+    # main konfiguruje logowanie na poziomie INFO przy imporcie - wyciszamy je przed pomiarami
+    importlib.import_module("main")
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = {}
+    for years in args.years:
+        for n_locations in args.locations:
+            scenario = f"{n_locations}loc_{years}y"
+            print(f"Scenariusz {scenario}...", flush=True)
+            results[scenario] = run_scenario(n_locations, years, args)
+
+    print_table(results)
+
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "settings": {"latency_ms": args.latency_ms, "jitter_ms": args.jitter_ms, "engine": args.engine},
+        "results": results,
+    }
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"Zapisano punkt odniesienia: {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        print(f"Brak punktu odniesienia ({args.baseline}) - uruchom z --save-baseline")
+        return 2 if args.ci else 0
+
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+    regressions = compare(results, baseline.get("results", {}), args.tolerance, strict=args.ci)
+    if regressions:
+        print("REGRESJA wzgledem punktu odniesienia:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+
+    print("Brak regresji wzgledem punktu odniesienia")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,236 @@
+﻿"""
+Lokalne zastepstwo dostawcow danych dla benchmarkow: serwer HTTP w formacie archiwum
+Open-Meteo oraz klient Meteostat bez sieci, oba z konfigurowalnym opoznieniem i jitterem.
+"""
+import gzip
+import hashlib
+import json
+import random
+import threading
+import time
+import zlib
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+import pandas as pd
+
+from api_clients.meteostat_client import MeteostatClient
+
+
+def synthetic_daily(lat: float, lon: float, start: str, end: str, variables) -> Dict[str, list]:
+    """Deterministyczne dane dzienne dla wspolrzednych - sezonowosc + szum zalezny od punktu"""
+    days = pd.date_range(start, end, freq="D")
+    doy = days.dayofyear.to_numpy()
+    rng = np.random.default_rng(zlib.crc32(f"{lat:.4f},{lon:.4f},{start}".encode("ascii")))
+    season = np.sin(2 * np.pi * (doy - 110) / 365.25)
+    noise = rng.normal(0, 2.5, len(days))
+
+    mean = 9 - (lat - 52) * 0.6 + 10 * season + noise
+    values = {
+        "temperature_2m_mean": mean,
+        "temperature_2m_max": mean + 4 + rng.normal(0, 1, len(days)),
+        "temperature_2m_min": mean - 4 + rng.normal(0, 1, len(days)),
+        "relative_humidity_2m_mean": 78 - 8 * season + rng.normal(0, 5, len(days)),
+        "surface_pressure_mean": 1000 + rng.normal(0, 6, len(days)),
+        "wind_speed_10m_mean": np.abs(12 + rng.normal(0, 4, len(days))),
+        "precipitation_sum": np.clip(rng.exponential(1.8, len(days)) - 1, 0, None),
+    }
+
+    daily = {"time": days.strftime("%Y-%m-%d").tolist()}
+    for name in variables:
+        if name in values:
+            daily[name] = np.round(values[name], 1).tolist()
+    return daily
+
+
+def synthetic_hourly(lat: float, lon: float, start: str, end: str, variables) -> Dict[str, list]:
+    """Deterministyczne dane godzinowe - sezonowosc, cykl dobowy i szum zalezny od punktu"""
+    hours = pd.date_range(start, pd.Timestamp(end) + pd.Timedelta(hours=23), freq="h")
+    doy = hours.dayofyear.to_numpy()
+    hour = hours.hour.to_numpy()
+    rng = np.random.default_rng(zlib.crc32(f"{lat:.4f},{lon:.4f},{start},h".encode("ascii")))
+    season = np.sin(2 * np.pi * (doy - 110) / 365.25)
+    diurnal = np.sin(2 * np.pi * (hour - 9) / 24)
+
+    temperature = 9 - (lat - 52) * 0.6 + 10 * season + 4 * diurnal + rng.normal(0, 1.5, len(hours))
+    values = {
+        "temperature_2m": temperature,
+        "relative_humidity_2m": 78 - 8 * season - 10 * diurnal + rng.normal(0, 4, len(hours)),
+        "surface_pressure": 1000 + rng.normal(0, 3, len(hours)),
+        "wind_speed_10m": np.abs(12 + 3 * diurnal + rng.normal(0, 3, len(hours))),
+        "precipitation": np.clip(rng.exponential(0.15, len(hours)) - 0.1, 0, None),
+    }
+
+    hourly = {"time": hours.strftime("%Y-%m-%dT%H:%M").tolist()}
+    for name in variables:
+        if name in values:
+            hourly[name] = np.round(values[name], 1).tolist()
+    return hourly
+
+
+def recorded_daily(recording: Dict, start: str, end: str, variables) -> Dict[str, list]:
+    """Rozciaga nagrana odpowiedz na zadany zakres, dopasowujac dni po dniu roku"""
+    recorded = pd.DataFrame(recording["daily"])
+    recorded["doy"] = pd.to_datetime(recorded["time"]).dt.dayofyear
+    by_doy = recorded.drop_duplicates("doy").set_index("doy")
+
+    days = pd.date_range(start, end, freq="D")
+    doy = np.minimum(days.dayofyear.to_numpy(), by_doy.index.max())
+    tiled = by_doy.reindex(doy)
+
+    daily = {"time": days.strftime("%Y-%m-%d").tolist()}
+    for name in variables:
+        if name in tiled.columns:
+            daily[name] = [None if pd.isna(v) else float(v) for v in tiled[name]]
+    return daily
+
+
+class OpenMeteoStandIn:
+    """Serwer HTTP odpowiadajacy jak archive-api.open-meteo.com/v1/archive"""
+
+    def __init__(self, latency_ms: float = 0, jitter_ms: float = 0, recording: Optional[str] = None,
+                 seed: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.recording = None
+        if recording:
+            with open(recording, encoding="utf-8") as handle:
+                self.recording = json.load(handle)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.bytes_sent = 0
+        self.not_modified = 0
+        self._failures = []
+        self._server = None
+
+    def fail_next(self, count: int, status: int = 503, retry_after: Optional[float] = None) -> None:
+        """Kolejne count zapytan dostanie blad - do testow ponowien i bezpiecznika"""
+        with self._lock:
+            self._failures.extend([(status, retry_after)] * count)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1/archive"
+
+    def delay(self) -> float:
+        return max(0.0, self.latency_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+
+    def payload(self, query: Dict[str, list]):
+        lats = [float(value) for value in query["latitude"][0].split(",")]
+        lons = [float(value) for value in query["longitude"][0].split(",")]
+        start, end = query["start_date"][0], query["end_date"][0]
+        variables = query.get("daily", [""])[0].split(",")
+
+        responses = []
+        for lat, lon in zip(lats, lons):
+            if "hourly" in query:
+                hourly = synthetic_hourly(lat, lon, start, end, query["hourly"][0].split(","))
+                responses.append({"latitude": lat, "longitude": lon, "hourly": hourly})
+                continue
+            if self.recording is not None:
+                daily = recorded_daily(self.recording, start, end, variables)
+            else:
+                daily = synthetic_daily(lat, lon, start, end, variables)
+            responses.append({"latitude": lat, "longitude": lon, "daily": daily})
+
+        return responses if len(responses) > 1 else responses[0]
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> "OpenMeteoStandIn":
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                if parsed.path != "/v1/archive":
+                    self.send_error(404)
+                    return
+
+                time.sleep(standin.delay())
+                with standin._lock:
+                    standin.requests += 1
+                    failure = standin._failures.pop(0) if standin._failures else None
+
+                if failure is not None:
+                    status, retry_after = failure
+                    self.send_response(status)
+                    if retry_after is not None:
+                        self.send_header("Retry-After", str(retry_after))
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                try:
+                    body = json.dumps(standin.payload(parse_qs(parsed.query))).encode("utf-8")
+                except (KeyError, ValueError) as e:
+                    body = json.dumps({"error": True, "reason": str(e)}).encode("utf-8")
+                    self.send_response(400)
+                    etag = None
+                else:
+                    etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+                    if self.headers.get("If-None-Match") == etag:
+                        with standin._lock:
+                            standin.not_modified += 1
+                        self.send_response(304)
+                        self.send_header("ETag", etag)
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                    self.send_response(200)
+
+                if "gzip" in self.headers.get("Accept-Encoding", ""):
+                    body = gzip.compress(body, compresslevel=1)
+                    self.send_header("Content-Encoding", "gzip")
+
+                with standin._lock:
+                    standin.bytes_sent += len(body)
+                if etag is not None:
+                    self.send_header("ETag", etag)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="open-meteo-standin", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+class FakeMeteostatClient(MeteostatClient):
+    """MeteostatClient bez sieci - dane syntetyczne po opoznieniu z jitterem"""
+
+    def __init__(self, latency_ms: float = 0, jitter_ms: float = 0, seed: int = 0):
+        super().__init__()
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self._random = random.Random(seed)
+
+    def _fetch_range(self, lat: float, lon: float, start: date, end: date) -> pd.DataFrame:
+        delay = max(0.0, self.latency_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+        time.sleep(delay)
+
+        daily = synthetic_daily(lat + 0.01, lon, start.isoformat(), end.isoformat(), [
+            "temperature_2m_mean", "temperature_2m_max", "temperature_2m_min",
+            "surface_pressure_mean", "wind_speed_10m_mean", "precipitation_sum"
+        ])
+        data = pd.DataFrame(daily).rename(columns={
+            "temperature_2m_mean": "tavg", "temperature_2m_max": "tmax", "temperature_2m_min": "tmin",
+            "surface_pressure_mean": "pres", "wind_speed_10m_mean": "wspd", "precipitation_sum": "prcp"
+        })
+        return self.normalize_daily(data, self.COLUMN_MAP, "time")
@@ -1,6 +1,6 @@
 ﻿# config/settings.py
 from dataclasses import dataclass, field
-from typing import Dict, Tuple
+from typing import Dict, List, Optional, Tuple
 import os
 
 
@@ -10,7 +10,7 @@ class WeatherConfig:
     OPENWEATHER_API_KEY: str = field(default_factory=lambda: os.getenv('OPENWEATHER_API_KEY', ''))
     WEATHERAPI_KEY: str = field(default_factory=lambda: os.getenv('WEATHERAPI_KEY', ''))
 
-    # Location mappings
+    # Location mappings (pozostale miejscowosci z gazetera lub jako "lat,lon")
     LOCATIONS: Dict[str, Tuple[float, float]] = field(default_factory=lambda: {
         "warsaw": (52.2297, 21.0122),
         "krakow": (50.0647, 19.9450),
@@ -20,11 +20,135 @@ class WeatherConfig:
         "lodz": (51.7592, 19.4559)
     })
 
+    # Gazeter w formacie GeoNames (np. cities500.txt, PL.txt) albo TSV z naglowkiem jak plik domyslny
+    GAZETTEER_PATH: str = "data/gazetteer_pl.tsv"
+    # Rozmiar komorki siatki w stopniach, do ktorej przyciagane sa wspolrzedne (0 = bez przyciagania)
+    LOCATION_SNAP_DEG: float = 0.1
+    # Wspolrzedne 'lat,lon' dostaja nazwe najblizszej miejscowosci z gazetera tylko w tej odleglosci (km)
+    LOCATION_NAME_MAX_KM: float = 25.0
+
     # Forecast settings
     FORECAST_DAYS: int = 7
+    FORECAST_ENGINE: str = "prophet"
+    # Pozostale zmienne dzienne prognozowane jednym przebiegiem; harmonic dzieli macierz planu miedzy nimi
+    FORECAST_VARIABLES: List[str] = field(default_factory=lambda: [
+        "max_temp", "min_temp", "humidity", "pressure", "wind_speed", "precipitation"
+    ])
+    FORECAST_VARIABLES_ENGINE: str = "harmonic"
     HISTORICAL_DAYS: int = 365
 
+    # History cache settings
+    CACHE_ENABLED: bool = True
+    CACHE_PATH: str = "cache/history.sqlite"
+    CACHE_RECENT_DAYS: int = 3
+    CACHE_RECENT_TTL_HOURS: float = 6
+
+    # Rozdzielczosc danych ("daily" albo "hourly") - godziny sa agregowane do dni na potrzeby prognoz
+    RESOLUTION: str = "daily"
+    HOURLY_STORE_ENABLED: bool = True
+    HOURLY_STORE_DIR: str = "cache/hourly"
+
+    # Batch forecasting (None = wszystkie rdzenie / brak limitu)
+    FORECAST_WORKERS: Optional[int] = None
+    FORECAST_WORKER_MEMORY_MB: Optional[int] = None
+    FORECAST_MAX_TASKS_PER_CHILD: int = 50
+
+    # Backtest (rolling origin): punkty odciecia co BACKTEST_STEP_DAYS wstecz, horyzont None = FORECAST_DAYS
+    BACKTEST_ENGINES: List[str] = field(default_factory=lambda: ["harmonic", "prophet"])
+    BACKTEST_ORIGINS: int = 12
+    BACKTEST_STEP_DAYS: int = 30
+    BACKTEST_HORIZON: Optional[int] = None
+    BACKTEST_MIN_TRAIN_DAYS: int = 365
+    # Liczba odciec w jednym zadaniu puli - szereg lokalizacji przesylany raz na paczke
+    BACKTEST_CHUNK_SIZE: int = 12
+    BACKTEST_MEASURE_MEMORY: bool = True
+
+    # Forecast model cache
+    MODEL_CACHE_ENABLED: bool = True
+    MODEL_CACHE_DIR: str = "cache/models"
+    MODEL_CACHE_SIZE: int = 32
+
+    # Fetch settings ("threads" albo "processes")
+    FETCH_MODE: str = "threads"
+    FETCH_MAX_WORKERS: int = 8
+    FETCH_TIMEOUT: float = 30
+    FETCH_SOURCE_TIMEOUTS: Dict[str, float] = field(default_factory=dict)
+    FETCH_DEADLINE: float = 45
+
+    # HTTP transport: ponowienia z jitterem, limity (zapytania/s, burst) i bezpiecznik na dostawce
+    HTTP_CONNECT_TIMEOUT: float = 3.05
+    HTTP_RETRIES: int = 3
+    HTTP_BACKOFF_BASE: float = 0.5
+    HTTP_BACKOFF_MAX: float = 8
+    HTTP_RATE_LIMITS: Dict[str, Tuple[float, int]] = field(default_factory=lambda: {
+        "OpenMeteo": (8, 16),
+        "Meteostat": (4, 8)
+    })
+    HTTP_BREAKER_THRESHOLD: int = 5
+    HTTP_BREAKER_RESET_S: float = 60
+    HTTP_CONDITIONAL_CACHE_SIZE: int = 64
+
+    OPEN_METEO_BATCH_SIZE: int = 50
+    OPEN_METEO_ARCHIVE_URL: str = "https://archive-api.open-meteo.com/v1/archive"
+
+    # Wagi zrodel przy scalaniu szeregow (brak wpisu = waga 1, waga <= 0 wylacza zrodlo)
+    MERGE_SOURCE_WEIGHTS: Dict[str, float] = field(default_factory=dict)
+
+    # Ocena jakosci zrodel przy scalaniu: dni z odporna z-wartoscia > Z_SOFT traca wage, > Z_REJECT sa odrzucane
+    QUALITY_ENABLED: bool = True
+    QUALITY_Z_SOFT: float = 3.5
+    QUALITY_Z_REJECT: float = 7.0
+    # Minimalna skala (°C) w mianowniku z - zgodne zrodla nie daja z-wartosci z szumu zaokraglen
+    QUALITY_MIN_SCALE: float = 0.3
+    QUALITY_MAX_LAG_DAYS: int = 3
+    # Ta sama wartosc przez tyle kolejnych dni = zamrozony pomiar (odrzucany poza pierwszym dniem)
+    QUALITY_FLATLINE_DAYS: int = 4
+    QUALITY_STALE_DAYS: int = 3
+    # Dni bez zadnego zrodla interpolowane liniowo (filled = True, temperature_count = 0, opad NaN) - prognoza
+    # dostaje ciagly szereg; braki w dniach z pomiarem zostaja NaN
+    QUALITY_FILL_GAPS: bool = True
+
+    # Potok asynchroniczny (WeatherWise.afetch_many): rownoczesne pobrania, pula dla bibliotek blokujacych,
+    # polaczenia aiohttp na dostawce
+    ASYNC_MAX_CONCURRENCY: int = 64
+    ASYNC_BLOCKING_WORKERS: int = 8
+    ASYNC_MAX_CONNECTIONS: int = 32
+
+    # Okna kroczace (dni) i kompresja t-digest biezacych podsumowan AggregationEngine
+    AGGREGATION_WINDOWS: Tuple[int, ...] = (7, 30, 365)
+    AGGREGATION_COMPRESSION: int = 100
+
+    # Laczenie rownoczesnych identycznych pobran i prognoz w jedno wywolanie
+    SINGLE_FLIGHT_ENABLED: bool = True
+
+    # Instrumentation exporters (None = wylaczone)
+    METRICS_JSONL_PATH: Optional[str] = None
+    METRICS_PROMETHEUS_PORT: Optional[int] = None
+
+    # Dashboard (Streamlit) cache
+    APP_FETCH_TTL_SECONDS: int = 3600
+    APP_PLOT_DPI: int = 120
+
+    # Usluga (service.py): harmonogram odswiezania i lokalne API JSON
+    SERVICE_HOST: str = "127.0.0.1"
+    SERVICE_PORT: int = 8765
+    SERVICE_LOCATIONS: Optional[List[str]] = None
+    SERVICE_REFRESH_MINUTES: float = 60
+    SERVICE_STAGGER_SECONDS: float = 10
+    SERVICE_STORE_DIR: str = "cache/service"
+
     # Output settings
     OUTPUT_DIR: str = "output"
     PLOT_STYLE: str = "default"
-    FIGURE_SIZE: Tuple[int, int] = field(default_factory=lambda: (12, 8))
\ No newline at end of file
+    FIGURE_SIZE: Tuple[int, int] = field(default_factory=lambda: (12, 8))
+    # png | svg | plotly (JSON dla plotly.io.from_json)
+    PLOT_FORMAT: str = "png"
+    PLOT_DPI: int = 150
+    PLOT_CACHE_SIZE: int = 32
+
+    # Wyniki przebiegow (prognozy + scalona historia) jako Parquet partycjonowany location/run_date
+    RESULTS_ENABLED: bool = True
+    RESULTS_DIR: str = "output/results"
+    RESULTS_COMPRESSION: str = "zstd"
+    # Dni historii zapisywane na przebieg (None = cala) - pelna historia i tak jest w cache historii
+    RESULTS_HISTORY_DAYS: Optional[int] = 60
\ No newline at end of file
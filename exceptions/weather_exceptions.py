@@ -9,4 +9,7 @@ class DataFetchError(WeatherAPIError):
     pass
 
 class InsufficientDataError(WeatherAPIError):
+    pass
+
+class ProviderUnavailableError(DataFetchError):
     pass
\ No newline at end of file
@@ -1,17 +1,16 @@
-﻿import importlib
-import pkgutil
+﻿import asyncio
+import contextlib
 import logging
 import sys
-from utils.parallel_processor import ParallelWeatherProcessor, fetch_single_client
+from utils.parallel_processor import ParallelWeatherProcessor, ConcurrentFetchEngine, fetch_single_client
 from datetime import datetime
 from pathlib import Path
-from typing import List
+from collections import defaultdict
+from functools import cached_property
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
 
-from api_clients.base import WeatherAPIClient
-from utils.aggregator import WeatherAggregator
-from utils.performance import measure_time, profile_function
-from utils.series_merge import TimeSeriesMerger
-from models.prophet_model import WeatherForecaster
+from utils.performance import traced
+from utils.instrumentation import configure_exporters, get_tracer
 from config.settings import WeatherConfig
 
 logging.basicConfig(
@@ -27,62 +26,220 @@ logger = logging.getLogger(__name__)
 
 
 class WeatherWise:
+    # Ciezkie zaleznosci (pandas, prophet, matplotlib) ladowane sa dopiero przy pierwszym uzyciu
     def __init__(self):
         self.config = WeatherConfig()
-        self.aggregator = WeatherAggregator()
-        self.merger = TimeSeriesMerger()
-        self.forecaster = WeatherForecaster()
+        configure_exporters(self.config)
+        self.fetch_engine = ConcurrentFetchEngine(
+            max_workers=self.config.FETCH_MAX_WORKERS,
+            source_timeouts=self.config.FETCH_SOURCE_TIMEOUTS,
+            default_timeout=self.config.FETCH_TIMEOUT,
+            deadline=self.config.FETCH_DEADLINE
+        )
+
+    @cached_property
+    def aggregator(self):
+        from utils.aggregator import WeatherAggregator
+        return WeatherAggregator()
+
+    @cached_property
+    def merger(self):
+        from utils.series_merge import TimeSeriesMerger
+        return TimeSeriesMerger()
+
+    @cached_property
+    def source_quality(self):
+        from utils.quality import create_source_quality
+        return create_source_quality(self.config)
+
+    @cached_property
+    def results_store(self):
+        from utils.results_store import get_results_store
+        return get_results_store(self.config)
+
+    @cached_property
+    def forecaster(self):
+        from models.prophet_model import WeatherForecaster
+        return WeatherForecaster()
+
+    @cached_property
+    def batch_forecaster(self):
+        from models.batch_forecaster import BatchForecaster
+        return BatchForecaster(
+            workers=self.config.FORECAST_WORKERS,
+            memory_limit_mb=self.config.FORECAST_WORKER_MEMORY_MB,
+            max_tasks_per_child=self.config.FORECAST_MAX_TASKS_PER_CHILD
+        )
+
+    def close(self):
+        self.fetch_engine.shutdown()
+        if "batch_forecaster" in self.__dict__:
+            self.batch_forecaster.shutdown()
+        if "forecaster" in self.__dict__:
+            from models.plot_renderer import close_plot_renderer
+            close_plot_renderer()
+
+    def get_all_clients(self) -> List:
+        """Klienci weather API wykryci raz na proces i wspoldzieleni miedzy wywolaniami"""
+        from api_clients.registry import get_client_registry
+        return get_client_registry().available_clients()
+
+    @traced("fetch_all_data")
+    def fetch_all_data(self, location: str):
+        clients = self.get_all_clients()
+        print(f"Rozpoczynanie rownoleglego pobierania danych z {len(clients)} zrodel...")
+
+        if self.config.FETCH_MODE == "processes":
+            args_list = [(client, location) for client in clients]
+            results = ParallelWeatherProcessor.run_parallel(fetch_single_client, args_list)
+            return [r for r in results if r is not None]
+
+        return self.fetch_engine.fetch(clients, location)
+
+    def iter_fetch_data(self, location: str, deadline: float = None) -> Iterator:
+        """Zwraca dane z kolejnych zrodel od razu po ich pobraniu (wyniki czesciowe)"""
+        for result in self.fetch_engine.iter_fetch(self.get_all_clients(), location, deadline):
+            if result is not None:
+                yield result
+
+    def fetch_many(self, locations: List[str], deadline: float = None, clients: List = None) -> Iterator:
+        """Pobiera wiele lokalizacji naraz - jedno zapytanie wsadowe na dostawce, wyniki strumieniowo"""
+        clients = self.get_all_clients() if clients is None else clients
+        print(f"Rozpoczynanie wsadowego pobierania {len(locations)} lokalizacji z {len(clients)} zrodel...")
+        yield from self.fetch_engine.iter_batch(clients, locations, deadline)
+
+    async def afetch_all_data(self, location: str, semaphore: asyncio.Semaphore = None,
+                              clients: List = None) -> List:
+        """Asynchroniczny odpowiednik fetch_all_data - wszystkie zrodla naraz w jednej petli zdarzen"""
+        clients = self.get_all_clients() if clients is None else clients
+        results = await asyncio.gather(*(self._afetch_client(client, location, semaphore) for client in clients))
+        return [result for result in results if result is not None]
+
+    async def _afetch_client(self, client, location: str, semaphore: asyncio.Semaphore = None):
+        async with semaphore if semaphore is not None else contextlib.nullcontext():
+            with get_tracer().span("fetch", source=client.name, location=location, mode="async"):
+                try:
+                    return await asyncio.wait_for(client.afetch_coalesced(location),
+                                                  self.fetch_engine.timeout_for(client.name))
+                except asyncio.TimeoutError:
+                    logger.warning(f"Przekroczono limit czasu dla {client.name} ({location})")
+                except Exception as e:
+                    logger.error(f"Błąd z {client.name}: {e}")
+                return None
+
+    async def afetch_many(self, locations: List[str], concurrency: int = None) -> AsyncIterator[Tuple[str, List]]:
+        """Wiele lokalizacji w jednej petli: najwyzej `concurrency` pobran naraz, wyniki w kolejnosci ukonczenia"""
+        semaphore = asyncio.Semaphore(concurrency or self.config.ASYNC_MAX_CONCURRENCY)
+        clients = self.get_all_clients()
+
+        async def fetch_location(location: str):
+            return location, await self.afetch_all_data(location, semaphore, clients)
 
-    def get_all_clients(self) -> List[WeatherAPIClient]:
-        """Dynamiczne pobieranie danych pogodowych weather API clients"""
-        clients = []
+        tasks = [asyncio.ensure_future(fetch_location(location)) for location in dict.fromkeys(locations)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
 
-        for _, modname, _ in pkgutil.iter_modules(['api_clients']):
-            if modname in ('base', '__init__'):
-                continue
+    def fetch_many_async(self, locations: List[str], concurrency: int = None) -> Dict[str, List]:
+        """Synchroniczne wejscie do potoku asynchronicznego (CLI, harmonogram, skrypty)"""
+        from api_clients.base import close_async_transports
 
+        async def collect():
             try:
-                module = importlib.import_module(f'api_clients.{modname}')
-                for attr in dir(module):
-                    obj = getattr(module, attr)
-                    if (isinstance(obj, type) and
-                            issubclass(obj, WeatherAPIClient) and
-                            obj is not WeatherAPIClient):
-
-                        client = obj()
-                        if client.is_available():
-                            clients.append(client)
-                            logger.info(f"Zaladowano dla: {client.name}")
-                        else:
-                            logger.warning(f"{client.name} nie jest chwilowo dostepny")
-
-            except ImportError as e:
-                logger.error(f"Wystapil bląd z zaladowaniem modulu {modname}: {e}")
-
-        return clients
-
-    @measure_time
-    @profile_function
-    def fetch_all_data(self, location: str):
-        clients = self.get_all_clients()
-        print(f"Rozpoczynanie rownoleglego pobierania danych z {len(clients)} zrodel...")
+                return {location: data async for location, data in self.afetch_many(locations, concurrency)}
+            finally:
+                await close_async_transports()
+
+        return asyncio.run(collect())
 
-        args_list = [(client, location) for client in clients]
+    def _fetch_merged(self, locations: List[str], clients: List = None) -> Tuple[Dict[str, List], Dict]:
+        grouped = defaultdict(list)
+        for data in self.fetch_many(locations, clients=clients):
+            grouped[data.location].append(data)
 
-        results = ParallelWeatherProcessor.run_parallel(fetch_single_client, args_list)
-        return [r for r in results if r is not None]
+        from exceptions.weather_exceptions import InsufficientDataError
+
+        merged = {}
+        for location, weather_data in grouped.items():
+            try:
+                merged[location] = self.merger.merge_series(weather_data, weights=self.config.MERGE_SOURCE_WEIGHTS,
+                                                            quality=self.source_quality)
+            except InsufficientDataError as e:
+                logger.error(f"{location}: {e}")
+        return grouped, merged
+
+    def backtest_series(self, locations: List[str], history_days: int = None) -> Dict:
+        """Scalone szeregi do backtestu - pobierane raz (przez cache historii) i wspolne dla wszystkich foldow;
+        domyslnie historia tak dluga, by zmiescily sie wszystkie punkty odciecia z konfiguracji"""
+        if history_days is None:
+            from models.backtest import Backtester
+            history_days = Backtester(self.config, workers=1).history_days()
+        # Kopie klientow z dluzsza historia - wspoldzielonej konfiguracji uzywaja rownolegle pobrania
+        clients = [client.with_history_days(history_days) for client in self.get_all_clients()]
+        return self._fetch_merged(locations, clients)[1]
+
+    def run_backtest(self, locations: List[str], engines: List[str] = None, **kwargs):
+        """Rolling-origin backtest silnikow; zwraca (foldy, podsumowanie na silnik)"""
+        from models.backtest import Backtester
+
+        backtester = Backtester(self.config)
+        window = {key: kwargs[key] for key in ("horizon", "origins", "step_days", "min_train_days") if key in kwargs}
+        try:
+            series = self.backtest_series(locations, backtester.history_days(**window))
+            folds = backtester.run(series, engines=engines, **kwargs)
+        finally:
+            backtester.shutdown()
+        return folds, Backtester.summarize(folds)
+
+    def run_batch(self, locations: List[str]) -> Dict:
+        """Analiza wielu lokalizacji: wsadowe pobranie danych i rownolegle prognozy w puli procesow"""
+        grouped, merged = self._fetch_merged(locations)
+
+        forecasts = {}
+        for location, forecast in self.batch_forecaster.iter_forecasts(merged):
+            forecasts[location] = self.run_analysis(location, weather_data=grouped[location], forecast=forecast,
+                                                    merged_series=merged[location])
+        return forecasts
+
+    def save_results(self, location: str, merged_series, forecasts: Dict) -> Optional[str]:
+        """Dopisuje prognozy i historie przebiegu do zbioru Parquet (RESULTS_DIR); zwraca id przebiegu"""
+        if self.results_store is None:
+            return None
+        engines = {variable: self.config.FORECAST_VARIABLES_ENGINE for variable in forecasts}
+        engines["temperature"] = self.forecaster.engine_name
+        try:
+            return self.results_store.write_run(location, merged_series, forecasts,
+                                                periods=self.config.FORECAST_DAYS, engines=engines)
+        except (OSError, ValueError) as e:
+            logger.error(f"Nie udalo sie zapisac wynikow dla {location}: {e}")
+            return None
+
+    def cache_stats(self) -> dict:
+        from utils.history_cache import get_history_cache
+        cache = get_history_cache(self.config)
+        return cache.stats() if cache is not None else {}
 
     #def run_analysis(self, location: str = "Warsaw"):
-    def run_analysis(self, location: str):
+    def run_analysis(self, location: str, weather_data: List = None, forecast=None, merged_series=None):
         """Run complete weather analysis"""
+        with get_tracer().span("analysis", location=location):
+            return self._run_analysis(location, weather_data, forecast, merged_series)
+
+    def _run_analysis(self, location: str, weather_data: List = None, forecast=None, merged_series=None):
         logger.info(f"Rozpoczecie analizy pogodowej dla:  {location}")
 
-        weather_data = self.fetch_all_data(location)
+        if weather_data is None:
+            weather_data = self.fetch_all_data(location)
 
         if not weather_data:
             logger.error("Brak dostepnych danych pogodowych")
             return
 
+        logger.info(f"Statystyki cache historii: {self.cache_stats()}")
+
         # Display raw data
         print(f"\n Dane pogodowe dla:  {location.title()}")
         print("=" * 50)
@@ -105,9 +262,25 @@ class WeatherWise:
             if not key.endswith(('_min', '_max', '_count')):
                 print(f"{key.replace('_', ' ').title()}: {value}")
 
+        # Biezace podsumowania: kolejne analizy tej lokalizacji dolaczaja tylko nowe dni
+        from utils.aggregator import get_aggregation_engine
+        engine = get_aggregation_engine(self.config)
+        engine.ingest_many(weather_data)
+        windows = engine.summary(location, "temperature").get("windows", {})
+        if windows:
+            print(f"\n Temperatura w oknach kroczacych")
+            print("=" * 50)
+            for name, stats in windows.items():
+                print(f"{name}: srednia {stats['mean']}°C, mediana {stats['median']}°C, "
+                      f"min {stats['min']}°C, max {stats['max']}°C ({stats['count']} dni)")
+
         try:
-            merged_series = self.merger.merge_series(weather_data)
-            forecast = self.forecaster.forecast_temperature(merged_series)
+            # run_batch przekazuje szereg scalony juz w _fetch_merged - bez drugiej oceny jakosci i scalania
+            if merged_series is None:
+                merged_series = self.merger.merge_series(weather_data, weights=self.config.MERGE_SOURCE_WEIGHTS,
+                                                         quality=self.source_quality)
+            if forecast is None:
+                forecast = self.forecaster.forecast_temperature(merged_series, location=location)
 
             print(f"\n 7-Dniowa Prognoza Pogody")
             print("=" * 50)
@@ -120,10 +293,27 @@ class WeatherWise:
                 upper = round(row['yhat_upper'], 1)
                 print(f"{date}: {temp}°C (range: {lower}°C - {upper}°C)")
 
+            variable_forecasts = self.forecaster.forecast_variables(merged_series, location=location)
+            if variable_forecasts:
+                import pandas as pd
+
+                print(f"\n Prognoza pozostalych zmiennych")
+                print("=" * 50)
+                table = pd.DataFrame({
+                    variable: frame.set_index("ds")["yhat"].tail(7).round(1)
+                    for variable, frame in variable_forecasts.items()
+                })
+                table.index = table.index.strftime('%Y-%m-%d').rename(None)
+                print(table.to_string())
+
+            self.save_results(location, merged_series, {"temperature": forecast, **variable_forecasts})
+
             output_dir = Path(self.config.OUTPUT_DIR)
             output_dir.mkdir(exist_ok=True)
 
-            plot_path = output_dir / f"forecast_{location.lower()}_{datetime.now().strftime('%Y%m%d')}.png"
+            from models.plot_renderer import FILE_SUFFIXES
+            suffix = FILE_SUFFIXES.get(self.config.PLOT_FORMAT, ".png")
+            plot_path = output_dir / f"forecast_{location.lower()}_{datetime.now().strftime('%Y%m%d')}{suffix}"
 
             self.forecaster.plot_forecast(
                 forecast.tail(14),
@@ -133,6 +323,7 @@ class WeatherWise:
             )
 
             logger.info(f"Wykres prognozy zostal zapsiany w lokalizacji: {plot_path}")
+            return forecast
 
         except Exception as e:
             logger.error(f"Nie udalo sie wygenerowac prognozy: {e}")
@@ -150,6 +341,8 @@ def main():
     except Exception as e:
         logger.error(f"Analiza nie udała się: {e}")
         raise
+    finally:
+        weather_app.close()
 
 
 if __name__ == "__main__":
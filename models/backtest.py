@@ -0,0 +1,280 @@
+﻿"""
+Ocena trafnosci prognoz na przesuwanych punktach odciecia (rolling origin).
+
+    python -m models.backtest --locations Krakow,Warszawa --engines harmonic,prophet --history-days 1095
+"""
+import argparse
+import logging
+import math
+import os
+import time
+import tracemalloc
+from multiprocessing import Pool
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from models.batch_forecaster import limit_worker_memory
+from models.forecast_engines import ENGINES
+
+logger = logging.getLogger(__name__)
+
+FOLD_COLUMNS = ["location", "engine", "cutoff", "train_days", "points", "sae", "sse", "covered",
+                "fit_s", "peak_mb", "error", "mae", "rmse", "coverage"]
+
+_worker_forecaster = None
+
+
+def rolling_origins(ds: np.ndarray, horizon: int, origins: int, step_days: int,
+                    min_train_days: int) -> List[np.datetime64]:
+    """Punkty odciecia od najpozniejszego wstecz co step_days; kazdy z pelnym horyzontem i min. historia"""
+    if len(ds) == 0:
+        return []
+    first, last = ds[0], ds[-1] - np.timedelta64(horizon, "D")
+    cutoffs = [last - np.timedelta64(k * step_days, "D") for k in range(origins)]
+    return sorted(cutoff for cutoff in cutoffs if (cutoff - first).astype(int) >= min_train_days)
+
+
+def _init_worker(memory_limit_mb: Optional[int]):
+    global _worker_forecaster
+
+    limit_worker_memory(memory_limit_mb)
+
+    from models.prophet_model import WeatherForecaster
+    _worker_forecaster = WeatherForecaster()
+
+
+def _score(forecast: pd.DataFrame, test_ds: np.ndarray, test_y: np.ndarray) -> Tuple[int, float, float, int]:
+    """Liczba punktow, suma |bledow|, suma kwadratow bledow i liczba trafien w przedzial"""
+    forecast_ds = forecast["ds"].to_numpy().astype("datetime64[D]")
+    position = np.minimum(np.searchsorted(forecast_ds, test_ds), len(forecast_ds) - 1)
+    found = forecast_ds[position] == test_ds
+    position, actual = position[found], test_y[found]
+
+    error = forecast["yhat"].to_numpy(dtype=float)[position] - actual
+    inside = (forecast["yhat_lower"].to_numpy(dtype=float)[position] <= actual) & \
+             (actual <= forecast["yhat_upper"].to_numpy(dtype=float)[position])
+    return len(actual), float(np.abs(error).sum()), float(np.square(error).sum()), int(inside.sum())
+
+
+def _backtest_worker(task: Tuple[str, str, np.ndarray, np.ndarray, np.ndarray, List[np.datetime64], int,
+                                  bool]) -> List[dict]:
+    location, engine_name, ds, y, observed, cutoffs, horizon, measure_memory = task
+    # Silnik bezposrednio, bez ForecastModelCache - kazdy fold to inny szereg, a czas dopasowania ma byc prawdziwy
+    engine = _worker_forecaster.get_engine(engine_name)
+    frame = pd.DataFrame({"ds": ds.astype("datetime64[ns]"), "y": y})
+
+    folds = []
+    for i, cutoff in enumerate(cutoffs):
+        train_end = int(np.searchsorted(ds, cutoff, side="right"))
+        test_end = int(np.searchsorted(ds, cutoff + np.timedelta64(horizon, "D"), side="right"))
+        train = frame.iloc[:train_end]
+        periods = int((cutoff - ds[train_end - 1]).astype(int)) + horizon
+        fold = {"location": location, "engine": engine_name, "cutoff": str(cutoff), "train_days": train_end,
+                "points": 0, "sae": 0.0, "sse": 0.0, "covered": 0, "fit_s": None, "peak_mb": None, "error": None}
+
+        try:
+            started = time.perf_counter()
+            forecast = engine.forecast(train, periods)
+            fold["fit_s"] = time.perf_counter() - started
+
+            # Pamiec mierzona osobnym przebiegiem (tracemalloc spowalnia dopasowanie) - raz na zadanie
+            if measure_memory and i == 0:
+                tracemalloc.start()
+                engine.forecast(train, periods)
+                fold["peak_mb"] = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+                tracemalloc.stop()
+
+            # Dni uzupelnione interpolacja (filled) sa w treningu jak w prognozie, ale nie sa punktami oceny
+            test = np.flatnonzero(observed[train_end:test_end]) + train_end
+            fold["points"], fold["sae"], fold["sse"], fold["covered"] = _score(forecast, ds[test], y[test])
+        except Exception as e:
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+            fold["error"] = f"{type(e).__name__}: {e}"
+        folds.append(fold)
+    return folds
+
+
+class Backtester:
+    """Rolling-origin backtest: lokalizacje x silniki x punkty odciecia w trwalej puli procesow"""
+
+    def __init__(self, config, workers: int = None, memory_limit_mb: int = None):
+        self.config = config
+        self.workers = workers if workers is not None else (config.FORECAST_WORKERS or os.cpu_count() or 1)
+        self.memory_limit_mb = memory_limit_mb if memory_limit_mb is not None else config.FORECAST_WORKER_MEMORY_MB
+        self._pool = None
+
+    def window(self, horizon: int = None, origins: int = None, step_days: int = None,
+               min_train_days: int = None) -> Tuple[int, int, int, int]:
+        """(horyzont, liczba odciec, krok, min. historia) - brakujace wartosci z konfiguracji"""
+        config = self.config
+        return (horizon or config.BACKTEST_HORIZON or config.FORECAST_DAYS,
+                origins or config.BACKTEST_ORIGINS,
+                step_days or config.BACKTEST_STEP_DAYS,
+                config.BACKTEST_MIN_TRAIN_DAYS if min_train_days is None else min_train_days)
+
+    def history_days(self, **window) -> int:
+        """Dlugosc historii, w ktorej mieszcza sie wszystkie punkty odciecia z pelnym horyzontem"""
+        horizon, origins, step_days, min_train_days = self.window(**window)
+        return min_train_days + origins * step_days + horizon
+
+    def _get_pool(self) -> Pool:
+        if self._pool is None:
+            self._pool = Pool(processes=self.workers, initializer=_init_worker, initargs=(self.memory_limit_mb,))
+        return self._pool
+
+    def tasks(self, series_by_location: Dict[str, pd.DataFrame], engines: List[str], horizon: int,
+              origins: int, step_days: int, min_train_days: int, chunk_size: int,
+              measure_memory: bool) -> List[tuple]:
+        """Jedno zadanie na lokalizacje x silnik x paczke odciec - szereg przesylany raz na paczke"""
+        unknown = [engine for engine in engines if engine not in ENGINES]
+        if unknown:
+            raise ValueError(f"Nieznany silnik prognozy: {', '.join(unknown)}. Dostepne: {', '.join(ENGINES)}")
+
+        tasks = []
+        for location, series in series_by_location.items():
+            series = series.dropna(subset=["y"]).sort_values("ds")
+            ds = series["ds"].to_numpy().astype("datetime64[D]")
+            y = series["y"].to_numpy(dtype=np.float64)
+            observed = ~series["filled"].to_numpy(dtype=bool) if "filled" in series.columns \
+                else np.ones(len(ds), dtype=bool)
+            cutoffs = rolling_origins(ds, horizon, origins, step_days, min_train_days)
+            if len(cutoffs) < origins:
+                logger.warning(f"{location}: {len(cutoffs)}/{origins} punktow odciecia miesci sie w historii "
+                               f"({len(ds)} dni)")
+            for engine in engines:
+                for start in range(0, len(cutoffs), chunk_size):
+                    tasks.append((location, engine, ds, y, observed, cutoffs[start:start + chunk_size], horizon,
+                                  measure_memory))
+        # Najpierw kosztowne silniki - krotkie zadania domykaja kolejke zamiast czekac na jeden dlugi fit
+        tasks.sort(key=lambda task: not ENGINES[task[1]].cacheable)
+        return tasks
+
+    def iter_folds(self, series_by_location: Dict[str, pd.DataFrame], engines: List[str] = None,
+                   horizon: int = None, origins: int = None, step_days: int = None,
+                   min_train_days: int = None, chunk_size: int = None,
+                   measure_memory: bool = None) -> Iterator[dict]:
+        """Wyniki foldow w kolejnosci ukonczenia; series_by_location to scalone szeregi ds/y"""
+        config = self.config
+        tasks = self.tasks(
+            series_by_location,
+            engines or config.BACKTEST_ENGINES,
+            *self.window(horizon, origins, step_days, min_train_days),
+            chunk_size or config.BACKTEST_CHUNK_SIZE,
+            config.BACKTEST_MEASURE_MEMORY if measure_memory is None else measure_memory,
+        )
+
+        if self.workers <= 1:
+            if _worker_forecaster is None:
+                _init_worker(None)
+            results = map(_backtest_worker, tasks)
+        else:
+            results = self._get_pool().imap_unordered(_backtest_worker, tasks)
+
+        for folds in results:
+            for fold in folds:
+                if fold["error"] is not None:
+                    logger.error(f"Backtest {fold['location']}/{fold['engine']} @ {fold['cutoff']}: {fold['error']}")
+                yield fold
+
+    def run(self, series_by_location: Dict[str, pd.DataFrame], **kwargs) -> pd.DataFrame:
+        folds = pd.DataFrame(list(self.iter_folds(series_by_location, **kwargs)))
+        if folds.empty:
+            return pd.DataFrame(columns=FOLD_COLUMNS)
+        points = folds["points"].where(folds["points"] > 0)
+        folds["mae"] = folds["sae"] / points
+        folds["rmse"] = np.sqrt(folds["sse"] / points)
+        folds["coverage"] = folds["covered"] / points
+        return folds[FOLD_COLUMNS]
+
+    @staticmethod
+    def summarize(folds: pd.DataFrame) -> pd.DataFrame:
+        """Metryki na silnik: bledy liczone z sum po wszystkich punktach, nie srednia z foldow"""
+        rows = []
+        for engine, group in folds.groupby("engine", sort=False):
+            ok = group[group["error"].isna()]
+            points = int(ok["points"].sum())
+            fit_ms = ok["fit_s"].dropna() * 1000
+            rows.append({
+                "engine": engine,
+                "folds": len(ok),
+                "failed": len(group) - len(ok),
+                "points": points,
+                "mae": ok["sae"].sum() / points if points else math.nan,
+                "rmse": math.sqrt(ok["sse"].sum() / points) if points else math.nan,
+                "coverage": ok["covered"].sum() / points if points else math.nan,
+                "fit_ms_mean": fit_ms.mean() if len(fit_ms) else math.nan,
+                "fit_ms_p95": fit_ms.quantile(0.95) if len(fit_ms) else math.nan,
+                "peak_mb": ok["peak_mb"].max() if ok["peak_mb"].notna().any() else math.nan,
+            })
+        return pd.DataFrame(rows).set_index("engine") if rows else pd.DataFrame()
+
+    @staticmethod
+    def select_engine(summary: pd.DataFrame, max_mae: float = None, max_rmse: float = None,
+                      min_coverage: float = None) -> Optional[str]:
+        """Najtanszy (sredni czas dopasowania) silnik spelniajacy progi trafnosci"""
+        if summary.empty:
+            return None
+        eligible = summary[summary["points"] > 0]
+        if max_mae is not None:
+            eligible = eligible[eligible["mae"] <= max_mae]
+        if max_rmse is not None:
+            eligible = eligible[eligible["rmse"] <= max_rmse]
+        if min_coverage is not None:
+            eligible = eligible[eligible["coverage"] >= min_coverage]
+        if eligible.empty:
+            return None
+        return eligible["fit_ms_mean"].idxmin()
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+
+def main() -> int:
+    from main import WeatherWise
+
+    parser = argparse.ArgumentParser(description="Backtest silnikow prognozy na historii z cache")
+    parser.add_argument("--locations", required=True, help="np. Krakow,Warszawa,Gdansk")
+    parser.add_argument("--engines", help="np. harmonic,prophet (domyslnie BACKTEST_ENGINES)")
+    parser.add_argument("--history-days", type=int,
+                        help="dlugosc pobieranej historii (domyslnie tyle, ile wymagaja punkty odciecia)")
+    parser.add_argument("--origins", type=int)
+    parser.add_argument("--step-days", type=int)
+    parser.add_argument("--horizon", type=int)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--max-mae", type=float, help="prog MAE dla wyboru silnika")
+    parser.add_argument("--min-coverage", type=float, help="minimalne pokrycie przedzialu dla wyboru silnika")
+    parser.add_argument("--output", help="zapis wszystkich foldow do CSV")
+    args = parser.parse_args()
+
+    app = WeatherWise()
+    backtester = Backtester(app.config, workers=args.workers)
+    history_days = args.history_days or backtester.history_days(horizon=args.horizon, origins=args.origins,
+                                                                step_days=args.step_days)
+    try:
+        series = app.backtest_series([item.strip() for item in args.locations.split(",") if item.strip()],
+                                     history_days)
+        engines = args.engines.split(",") if args.engines else None
+        folds = backtester.run(series, engines=engines, horizon=args.horizon, origins=args.origins,
+                               step_days=args.step_days)
+    finally:
+        backtester.shutdown()
+        app.close()
+
+    summary = Backtester.summarize(folds)
+    print(summary.round(3).to_string())
+    if args.max_mae is not None or args.min_coverage is not None:
+        chosen = Backtester.select_engine(summary, max_mae=args.max_mae, min_coverage=args.min_coverage)
+        print(f"Najtanszy silnik spelniajacy progi: {chosen or 'brak'}")
+    if args.output:
+        folds.to_csv(args.output, index=False)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,82 @@
+﻿import logging
+import os
+from multiprocessing import Pool
+from typing import Dict, Iterator, Optional, Tuple
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+_worker_forecaster = None
+
+
+def limit_worker_memory(memory_limit_mb: Optional[int]) -> None:
+    if memory_limit_mb:
+        try:
+            import resource
+            limit = memory_limit_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ImportError, ValueError, OSError) as e:
+            logger.warning(f"Nie udalo sie ustawic limitu pamieci procesu: {e}")
+
+
+def _init_worker(memory_limit_mb: Optional[int]):
+    global _worker_forecaster
+
+    limit_worker_memory(memory_limit_mb)
+
+    from models.prophet_model import WeatherForecaster
+    _worker_forecaster = WeatherForecaster()
+
+
+def _forecast_worker(task: Tuple[str, pd.DataFrame, Optional[int], Optional[str]]):
+    location, series, periods, engine = task
+    try:
+        forecast = _worker_forecaster.forecast_temperature(series, periods=periods, location=location, engine=engine)
+        return location, forecast, None
+    except Exception as e:
+        return location, None, f"{type(e).__name__}: {e}"
+
+
+class BatchForecaster:
+    """Trwala pula procesow do rownoleglego dopasowywania modeli dla wielu lokalizacji"""
+
+    def __init__(self, workers: int = None, memory_limit_mb: int = None, max_tasks_per_child: int = None):
+        self.workers = workers or max(1, os.cpu_count() or 1)
+        self.memory_limit_mb = memory_limit_mb
+        self.max_tasks_per_child = max_tasks_per_child
+        self._pool = None
+
+    def _get_pool(self) -> Pool:
+        if self._pool is None:
+            self._pool = Pool(
+                processes=self.workers,
+                initializer=_init_worker,
+                initargs=(self.memory_limit_mb,),
+                maxtasksperchild=self.max_tasks_per_child
+            )
+        return self._pool
+
+    def iter_forecasts(self, series_by_location: Dict[str, pd.DataFrame], periods: int = None,
+                       engine: str = None) -> Iterator[Tuple[str, pd.DataFrame]]:
+        """Zwraca (lokalizacja, prognoza) w kolejnosci ukonczenia dopasowania"""
+        tasks = [
+            (location, series[["ds", "y"]], periods, engine)
+            for location, series in series_by_location.items()
+        ]
+
+        for location, forecast, error in self._get_pool().imap_unordered(_forecast_worker, tasks):
+            if error is not None:
+                logger.error(f"Nie udalo sie wygenerowac prognozy dla {location}: {error}")
+                continue
+            yield location, forecast
+
+    def forecast_many(self, series_by_location: Dict[str, pd.DataFrame], periods: int = None,
+                      engine: str = None) -> Dict[str, pd.DataFrame]:
+        return dict(self.iter_forecasts(series_by_location, periods, engine))
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
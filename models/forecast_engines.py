@@ -0,0 +1,213 @@
+﻿import logging
+from abc import ABC, abstractmethod
+from statistics import NormalDist
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+import numpy as np
+import pandas as pd
+
+from exceptions.weather_exceptions import InsufficientDataError
+from utils.instrumentation import get_tracer
+
+logger = logging.getLogger(__name__)
+
+# Fizyczne granice zmiennych - prognozy i przedzialy przycinane do nich
+VARIABLE_BOUNDS: Dict[str, Tuple[Optional[float], Optional[float]]] = {
+    "humidity": (0.0, 100.0),
+    "pressure": (0.0, None),
+    "wind_speed": (0.0, None),
+    "precipitation": (0.0, None),
+}
+
+
+def warm_start_params(model) -> dict:
+    """Parametry poprzedniego modelu jako punkt startowy optymalizacji Stan"""
+    params = {}
+    for name in ["k", "m", "sigma_obs"]:
+        params[name] = model.params[name][0][0]
+    for name in ["delta", "beta"]:
+        params[name] = model.params[name][0]
+    return params
+
+
+class ForecastEngine(ABC):
+    """Silnik prognozy: przyjmuje ramke ds/y, zwraca historie + horyzont jako ds/yhat/yhat_lower/yhat_upper"""
+    name = ""
+    # Czy wynik warto trzymac w ForecastModelCache (dla szybkich silnikow zapis kosztuje wiecej niz fit)
+    cacheable = False
+
+    @abstractmethod
+    def fit_forecast(self, df: pd.DataFrame, periods: int, warm_start=None) -> Tuple[pd.DataFrame, Any]:
+        """Prognoza i dopasowany model; silnik nie trzyma stanu dopasowania - jedna instancja obsluguje
+        rownolegle sesje"""
+
+    def forecast(self, df: pd.DataFrame, periods: int, warm_start=None) -> pd.DataFrame:
+        return self.fit_forecast(df, periods, warm_start)[0]
+
+    def forecast_many(self, df: pd.DataFrame, columns: List[str], periods: int) -> Dict[str, pd.DataFrame]:
+        """Prognoza kilku kolumn ramki (ds + kolumny); domyslnie osobne dopasowanie dla kazdej"""
+        return {
+            column: self.forecast(df[["ds", column]].rename(columns={column: "y"}).dropna(), periods)
+            for column in columns
+        }
+
+
+class ProphetEngine(ForecastEngine):
+    name = "prophet"
+    cacheable = True
+
+    @staticmethod
+    def _build_model():
+        from prophet import Prophet
+
+        return Prophet(
+            yearly_seasonality=True,
+            weekly_seasonality=True,
+            daily_seasonality=False,
+            changepoint_prior_scale=0.05
+        )
+
+    def fit_forecast(self, df: pd.DataFrame, periods: int, warm_start=None) -> Tuple[pd.DataFrame, Any]:
+        tracer = get_tracer()
+        model = self._build_model()
+
+        with tracer.span("model.fit", engine=self.name, rows=len(df), warm_start=warm_start is not None):
+            if warm_start is not None:
+                try:
+                    model.fit(df, init=warm_start_params(warm_start))
+                except Exception as e:
+                    logger.warning(f"Rozgrzany start nie powiodl sie, pelne dopasowanie: {e}")
+                    model = self._build_model()
+                    model.fit(df)
+            else:
+                model.fit(df)
+
+        with tracer.span("model.predict", engine=self.name, periods=periods):
+            future = model.make_future_dataframe(periods=periods)
+            forecast = model.predict(future)
+        return forecast[["ds", "yhat", "yhat_lower", "yhat_upper"]], model
+
+
+class HarmonicEngine(ForecastEngine):
+    """Regresja harmoniczna (rok + tydzien + trend) z AR(1) na resztach, rozwiazywana w postaci zamknietej"""
+    name = "harmonic"
+
+    def __init__(self, yearly_order: int = 4, weekly_order: int = 3, interval_width: float = 0.8):
+        self.yearly_order = yearly_order
+        self.weekly_order = weekly_order
+        self.z = NormalDist().inv_cdf(0.5 + interval_width / 2)
+
+    def _design(self, days: np.ndarray, yearly_order: int) -> np.ndarray:
+        columns = [np.ones_like(days), days / 365.25]
+        for k in range(1, yearly_order + 1):
+            angle = 2 * np.pi * k * days / 365.25
+            columns += [np.sin(angle), np.cos(angle)]
+        for k in range(1, self.weekly_order + 1):
+            angle = 2 * np.pi * k * days / 7
+            columns += [np.sin(angle), np.cos(angle)]
+        return np.column_stack(columns)
+
+    def fit_forecast(self, df: pd.DataFrame, periods: int, warm_start=None) -> Tuple[pd.DataFrame, Any]:
+        with get_tracer().span("model.fit", engine=self.name, rows=len(df)):
+            return self._forecast(df, periods)
+
+    def forecast_many(self, df: pd.DataFrame, columns: List[str], periods: int) -> Dict[str, pd.DataFrame]:
+        """Jedno rozwiazanie lstsq z wieloma prawymi stronami dla kolumn o tym samym wzorcu brakow"""
+        values = df[columns].to_numpy(dtype=np.float64)
+        missing = np.isnan(values)
+
+        # Kolumny z identycznym wzorcem brakow dziela macierz planu, jej rozklad i wariancje parametrow
+        groups: Dict[bytes, List[int]] = {}
+        for i in range(len(columns)):
+            groups.setdefault(np.packbits(missing[:, i]).tobytes(), []).append(i)
+
+        results = {}
+        with get_tracer().span("model.fit", engine=self.name, rows=len(df), columns=len(columns), groups=len(groups)):
+            ds = df["ds"].to_numpy().astype("datetime64[D]")
+            for indices in groups.values():
+                valid = ~missing[:, indices[0]]
+                if valid.sum() < 2:
+                    logger.warning(f"Za malo danych do prognozy: {', '.join(columns[i] for i in indices)}")
+                    continue
+                all_ds, yhat, spread, _ = self._fit(ds[valid], values[valid][:, indices], periods)
+                for j, i in enumerate(indices):
+                    results[columns[i]] = self._frame(all_ds, yhat[:, j], spread[:, j])
+        return results
+
+    def _forecast(self, df: pd.DataFrame, periods: int) -> Tuple[pd.DataFrame, dict]:
+        y = df["y"].to_numpy(dtype=np.float64)
+        valid = ~np.isnan(y)
+        if valid.sum() < 2:
+            raise InsufficientDataError("Za malo danych do dopasowania modelu harmonicznego")
+
+        ds = df["ds"].to_numpy().astype("datetime64[D]")[valid]
+        all_ds, yhat, spread, model = self._fit(ds, y[valid][:, None], periods)
+        return self._frame(all_ds, yhat[:, 0], spread[:, 0]), model
+
+    def _fit(self, ds: np.ndarray, Y: np.ndarray, periods: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, dict]:
+        """Dopasowanie dla macierzy Y [dzien x kolumna]; zwraca daty, yhat, polszerokosc przedzialu i parametry"""
+        origin = ds[0]
+        days = (ds - origin).astype(np.float64)
+
+        # Sezonowosc roczna tylko gdy historia obejmuje pelny rok
+        yearly_order = self.yearly_order if days[-1] >= 365 else 0
+        X = self._design(days, yearly_order)
+        if len(Y) <= X.shape[1]:
+            X = X[:, :2]
+
+        beta, *_ = np.linalg.lstsq(X, Y, rcond=None)
+        fitted = X @ beta
+        resid = Y - fitted
+        dof = max(1, len(Y) - X.shape[1])
+        sigma = np.sqrt(np.einsum("ij,ij->j", resid, resid) / dof)
+
+        # AR(1) na resztach - anomalie pogodowe utrzymuja sie przez kilka dni
+        prev, curr = resid[:-1], resid[1:]
+        denom = np.einsum("ij,ij->j", prev, prev)
+        ratio = np.divide(np.einsum("ij,ij->j", prev, curr), denom, out=np.zeros_like(denom), where=denom > 0)
+        phi = np.clip(ratio, 0.0, 0.99)
+        innovation = np.sqrt(np.maximum(sigma ** 2 * (1 - phi ** 2), 1e-12))
+
+        last = ds[-1]
+        future_ds = last + np.arange(1, periods + 1).astype("timedelta64[D]")
+        future_days = (future_ds - origin).astype(np.float64)
+        X_future = self._design(future_days, yearly_order)[:, :X.shape[1]]
+
+        steps = np.arange(1, periods + 1)[:, None]
+        yhat_future = X_future @ beta + resid[-1] * phi ** steps
+        # Wariancja prognozy AR(h) + niepewnosc wspolczynnikow regresji (dzwignia wspolna dla kolumn)
+        ar_var = innovation ** 2 * np.cumsum(phi ** (2 * (steps - 1)), axis=0)
+        xtx_inv = np.linalg.pinv(X.T @ X)
+        leverage = np.einsum("ij,jk,ik->i", X_future, xtx_inv, X_future)
+        spread_future = self.z * np.sqrt(ar_var + sigma ** 2 * leverage[:, None])
+
+        model = {"beta": beta if beta.shape[1] > 1 else beta[:, 0],
+                 "phi": phi if len(phi) > 1 else float(phi[0]),
+                 "sigma": sigma if len(sigma) > 1 else float(sigma[0]),
+                 "origin": origin, "yearly_order": yearly_order}
+
+        all_ds = np.concatenate([ds, future_ds])
+        yhat = np.concatenate([fitted, yhat_future])
+        spread = np.concatenate([np.broadcast_to(self.z * sigma, fitted.shape), spread_future])
+        return all_ds, yhat, spread, model
+
+    @staticmethod
+    def _frame(all_ds: np.ndarray, yhat: np.ndarray, spread: np.ndarray) -> pd.DataFrame:
+        return pd.DataFrame({
+            "ds": all_ds.astype("datetime64[ns]"),
+            "yhat": yhat,
+            "yhat_lower": yhat - spread,
+            "yhat_upper": yhat + spread
+        })
+
+
+ENGINES: Dict[str, Type[ForecastEngine]] = {
+    ProphetEngine.name: ProphetEngine,
+    HarmonicEngine.name: HarmonicEngine,
+}
+
+
+def create_engine(name: str) -> ForecastEngine:
+    if name not in ENGINES:
+        raise ValueError(f"Nieznany silnik prognozy: '{name}'. Dostepne: {', '.join(ENGINES)}")
+    return ENGINES[name]()
@@ -0,0 +1,176 @@
+﻿import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from io import StringIO
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+def series_range(df: pd.DataFrame) -> Tuple[pd.Timestamp, pd.Timestamp]:
+    ds = pd.to_datetime(df["ds"])
+    return ds.min(), ds.max()
+
+
+def model_range(model) -> Optional[Tuple[pd.Timestamp, pd.Timestamp]]:
+    """Zakres ds szeregu, na ktorym dopasowano model (Prophet trzyma go w model.history)"""
+    history = getattr(model, "history", None)
+    if history is None or "ds" not in history or history.empty:
+        return None
+    return series_range(history)
+
+
+class ForecastModelCache:
+    """LRU w pamieci + magazyn na dysku dla prognoz i dopasowanych modeli; oba ograniczone do max_entries,
+    pliki wypadajace z LRU sa usuwane"""
+
+    def __init__(self, directory: str, max_entries: int = 32):
+        self.directory = Path(directory)
+        self.max_entries = max_entries
+        self._forecasts: "OrderedDict[str, pd.DataFrame]" = OrderedDict()
+        self._models: "OrderedDict[str, object]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Pliki z poprzednich uruchomien - zostaja tylko najnowsze
+        self._prune(self.directory / "forecasts")
+        self._prune(self.directory / "models")
+
+    @staticmethod
+    def fingerprint(df: pd.DataFrame) -> str:
+        hashed = pd.util.hash_pandas_object(df[["ds", "y"]], index=False).values
+        return hashlib.sha1(hashed.tobytes()).hexdigest()
+
+    @staticmethod
+    def _safe_name(value: str) -> str:
+        return "".join(ch if ch.isalnum() else "_" for ch in value.lower())
+
+    def _forecast_path(self, key: str) -> Path:
+        return self.directory / "forecasts" / f"{key}.json"
+
+    def _model_path(self, location: str) -> Path:
+        return self.directory / "models" / f"{self._safe_name(location)}.json"
+
+    def get_forecast(self, fingerprint: str, periods: int, engine: str = "prophet") -> Optional[pd.DataFrame]:
+        key = f"{engine}_{fingerprint}_{periods}"
+        with self._lock:
+            if key in self._forecasts:
+                self._forecasts.move_to_end(key)
+                return self._forecasts[key].copy()
+
+        path = self._forecast_path(key)
+        if not path.exists():
+            return None
+
+        try:
+            forecast = pd.read_json(StringIO(path.read_text(encoding="utf-8")), orient="split")
+        except (OSError, ValueError) as e:
+            # Plik mogl zostac usuniety przez inny proces przy wypadnieciu z jego LRU
+            logger.warning(f"Nie udalo sie wczytac prognozy {key}: {e}")
+            return None
+        forecast["ds"] = pd.to_datetime(forecast["ds"])
+        self._remember(key, forecast)
+        return forecast.copy()
+
+    def put_forecast(self, fingerprint: str, periods: int, forecast: pd.DataFrame, engine: str = "prophet") -> None:
+        key = f"{engine}_{fingerprint}_{periods}"
+        self._remember(key, forecast.copy())
+
+        self._write(self._forecast_path(key), forecast.to_json(orient="split", date_format="iso", index=False))
+
+    def _remember(self, key: str, forecast: pd.DataFrame) -> None:
+        with self._lock:
+            self._forecasts[key] = forecast
+            self._forecasts.move_to_end(key)
+            evicted = self._evict(self._forecasts)
+        for old_key in evicted:
+            self._forecast_path(old_key).unlink(missing_ok=True)
+
+    def _remember_model(self, location: str, model) -> None:
+        with self._lock:
+            self._models[location] = model
+            self._models.move_to_end(location)
+            evicted = self._evict(self._models)
+        for old_location in evicted:
+            self._model_path(old_location).unlink(missing_ok=True)
+
+    def _evict(self, entries: OrderedDict) -> list:
+        evicted = []
+        while len(entries) > self.max_entries:
+            evicted.append(entries.popitem(last=False)[0])
+        return evicted
+
+    def _prune(self, directory: Path) -> None:
+        if not directory.is_dir():
+            return
+        files = sorted(directory.glob("*.json"), key=lambda path: path.stat().st_mtime, reverse=True)
+        for path in files[self.max_entries:]:
+            path.unlink(missing_ok=True)
+
+    def get_model(self, location: str, df: pd.DataFrame = None):
+        """Ostatni dopasowany model dla lokalizacji - punkt startowy dla kolejnego dopasowania.
+
+        Z df model jest zwracany tylko, gdy nowy szereg zaczyna sie tam, gdzie szereg modelu, i go wydluza -
+        parametry dopasowane do innego okresu to zly punkt startowy."""
+        with self._lock:
+            model = self._models.get(location)
+            if model is not None:
+                self._models.move_to_end(location)
+
+        if model is None:
+            model = self._load_model(location)
+        if model is None or df is None:
+            return model
+
+        cached, new = model_range(model), series_range(df)
+        if cached is None or new[0] != cached[0] or new[1] < cached[1]:
+            logger.info(f"Szereg dla {location} nie jest przedluzeniem poprzedniego - dopasowanie od zera")
+            return None
+        return model
+
+    def _load_model(self, location: str):
+        path = self._model_path(location)
+        if not path.exists():
+            return None
+
+        from prophet.serialize import model_from_json
+        try:
+            model = model_from_json(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError, KeyError, json.JSONDecodeError) as e:
+            logger.warning(f"Nie udalo sie wczytac modelu dla {location}: {e}")
+            return None
+
+        self._remember_model(location, model)
+        return model
+
+    def put_model(self, location: str, model) -> None:
+        from prophet.serialize import model_to_json
+
+        self._remember_model(location, model)
+        self._write(self._model_path(location), model_to_json(model))
+
+    @staticmethod
+    def _write(path: Path, content: str) -> None:
+        # Zapis przez plik tymczasowy - z cache korzysta wiele procesow naraz
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp_path.write_text(content, encoding="utf-8")
+        os.replace(tmp_path, path)
+
+
+_shared_caches: Dict[str, ForecastModelCache] = {}
+
+
+def get_model_cache(config) -> Optional[ForecastModelCache]:
+    if not config.MODEL_CACHE_ENABLED:
+        return None
+    if config.MODEL_CACHE_DIR not in _shared_caches:
+        _shared_caches[config.MODEL_CACHE_DIR] = ForecastModelCache(
+            config.MODEL_CACHE_DIR, max_entries=config.MODEL_CACHE_SIZE
+        )
+    return _shared_caches[config.MODEL_CACHE_DIR]
@@ -0,0 +1,189 @@
+﻿import hashlib
+import io
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("png", "svg", "plotly")
+FILE_SUFFIXES = {"png": ".png", "svg": ".svg", "plotly": ".json"}
+
+
+def plot_fingerprint(forecast_df: pd.DataFrame, historical_df: Optional[pd.DataFrame], *extra) -> str:
+    """Skrot danych wykresu i parametrow renderowania - klucz cache gotowych obrazow"""
+    digest = hashlib.sha1(repr(extra).encode("utf-8"))
+    frames = [(forecast_df, ("ds", "yhat", "yhat_lower", "yhat_upper"))]
+    if historical_df is not None:
+        frames.append((historical_df, ("ds", "y")))
+    for frame, columns in frames:
+        digest.update(len(frame).to_bytes(8, "little"))
+        for column in columns:
+            values = frame[column].to_numpy()
+            if values.dtype.kind == "M":
+                values = values.astype("datetime64[ns]").view("i8")
+            digest.update(np.ascontiguousarray(values, dtype=values.dtype).tobytes())
+    return digest.hexdigest()
+
+
+class PlotRenderer:
+    """Jedna figura-szablon aktualizowana w miejscu, z cache gotowych obrazow po skrocie prognozy"""
+
+    def __init__(self, config, cache_size: int = None):
+        self.config = config
+        self.cache_size = config.PLOT_CACHE_SIZE if cache_size is None else cache_size
+        self._cache: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._figure = None
+        self._artists = {}
+        self.stats = {"renders": 0, "cache_hits": 0}
+
+    def _build_template(self) -> None:
+        # Figure bez pyplot: nie trafia do globalnego rejestru figur, wiec nie wycieka w dlugich procesach
+        from matplotlib import style
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        with style.context(self.config.PLOT_STYLE):
+            fig = Figure(figsize=self.config.FIGURE_SIZE)
+            FigureCanvasAgg(fig)
+            ax = fig.add_subplot()
+
+            history, = ax.plot([], [], label="Data Historyczna", color="gray", alpha=0.7, linewidth=1)
+            forecast, = ax.plot([], [], label="Prognoza", color="blue", linewidth=2)
+            band = ax.fill_between([], [], [], color="lightblue", alpha=0.4, label="Przedzial ufnosci")
+
+            ax.set_xlabel("Data")
+            ax.set_ylabel("Temperatura (°C)")
+            ax.legend(loc="upper left")
+            ax.grid(True, alpha=0.3)
+            ax.xaxis_date()
+            ax.tick_params(axis="x", labelrotation=45)
+
+        self._figure = fig
+        self._artists = {"ax": ax, "history": history, "forecast": forecast, "band": band, "laid_out": False}
+
+    def _update(self, forecast_df: pd.DataFrame, historical_df: Optional[pd.DataFrame], title: str):
+        if self._figure is None:
+            self._build_template()
+        artists = self._artists
+        ax = artists["ax"]
+
+        dates = forecast_df["ds"].to_numpy()
+        lower = forecast_df["yhat_lower"].to_numpy(dtype=float)
+        upper = forecast_df["yhat_upper"].to_numpy(dtype=float)
+        artists["forecast"].set_data(dates, forecast_df["yhat"].to_numpy(dtype=float))
+
+        if historical_df is not None:
+            artists["history"].set_data(historical_df["ds"].to_numpy(), historical_df["y"].to_numpy(dtype=float))
+            artists["history"].set_visible(True)
+        else:
+            artists["history"].set_data([], [])
+            artists["history"].set_visible(False)
+
+        band = artists["band"]
+        if hasattr(band, "set_data"):
+            band.set_data(dates, lower, upper)
+        else:
+            # Starsze matplotlib nie aktualizuja fill_between w miejscu - podmieniamy tylko ten jeden artysta
+            band.remove()
+            artists["band"] = ax.fill_between(dates, lower, upper, color=band.get_facecolor(),
+                                              label="Przedzial ufnosci")
+
+        ax.set_title(title)
+        ax.relim()
+        ax.autoscale_view()
+
+        # Uklad liczony raz - kolejne wykresy maja te same etykiety osi, bbox_inches='tight' niepotrzebne
+        if not artists["laid_out"]:
+            self._figure.tight_layout()
+            artists["laid_out"] = True
+        return self._figure
+
+    @staticmethod
+    def _plotly(forecast_df: pd.DataFrame, historical_df: Optional[pd.DataFrame], title: str) -> bytes:
+        import plotly.graph_objects as go
+
+        dates = forecast_df["ds"].dt.strftime("%Y-%m-%d").tolist()
+        fig = go.Figure()
+        if historical_df is not None:
+            fig.add_trace(go.Scatter(x=historical_df["ds"].dt.strftime("%Y-%m-%d").tolist(),
+                                     y=historical_df["y"].round(2).tolist(), name="Data Historyczna",
+                                     line={"color": "gray", "width": 1}, opacity=0.7))
+        fig.add_trace(go.Scatter(x=dates + dates[::-1],
+                                 y=forecast_df["yhat_upper"].round(2).tolist()
+                                 + forecast_df["yhat_lower"].round(2).tolist()[::-1],
+                                 fill="toself", fillcolor="rgba(173,216,230,0.4)", line={"width": 0},
+                                 name="Przedzial ufnosci", hoverinfo="skip"))
+        fig.add_trace(go.Scatter(x=dates, y=forecast_df["yhat"].round(2).tolist(), name="Prognoza",
+                                 line={"color": "blue", "width": 2}))
+        fig.update_layout(title=title, xaxis_title="Data", yaxis_title="Temperatura (°C)")
+        return fig.to_json().encode("utf-8")
+
+    def render(self, forecast_df: pd.DataFrame, historical_df: pd.DataFrame = None,
+               title: str = "Temperature Forecast", fmt: str = None, dpi: int = None) -> bytes:
+        """Wykres jako bajty PNG/SVG albo JSON plotly; identyczne dane i parametry zwracaja gotowy wynik"""
+        fmt = fmt or self.config.PLOT_FORMAT
+        if fmt not in FORMATS:
+            raise ValueError(f"Nieobslugiwany format wykresu: {fmt} (dostepne: {', '.join(FORMATS)})")
+        dpi = dpi or self.config.PLOT_DPI
+
+        key = plot_fingerprint(forecast_df, historical_df, title, fmt, dpi if fmt == "png" else None)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.stats["cache_hits"] += 1
+                return cached
+
+            if fmt == "plotly":
+                output = self._plotly(forecast_df, historical_df, title)
+            else:
+                fig = self._update(forecast_df, historical_df, title)
+                buffer = io.BytesIO()
+                fig.savefig(buffer, format=fmt, dpi=dpi)
+                output = buffer.getvalue()
+
+            self.stats["renders"] += 1
+            self._cache[key] = output
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return output
+
+    def save(self, path: str, forecast_df: pd.DataFrame, historical_df: pd.DataFrame = None,
+             title: str = "Temperature Forecast", fmt: str = None, dpi: int = None) -> bytes:
+        output = self.render(forecast_df, historical_df, title, fmt, dpi)
+        with open(path, "wb") as handle:
+            handle.write(output)
+        return output
+
+    def close(self) -> None:
+        """Zwalnia figure-szablon i gotowe obrazy; kolejny render zbuduje szablon od nowa"""
+        with self._lock:
+            if self._figure is not None:
+                self._figure.clear()
+            self._figure = None
+            self._artists = {}
+            self._cache.clear()
+
+
+_shared_renderer: Optional[PlotRenderer] = None
+_renderer_lock = threading.Lock()
+
+
+def get_plot_renderer(config) -> PlotRenderer:
+    global _shared_renderer
+    with _renderer_lock:
+        if _shared_renderer is None:
+            _shared_renderer = PlotRenderer(config)
+        return _shared_renderer
+
+
+def close_plot_renderer() -> None:
+    with _renderer_lock:
+        if _shared_renderer is not None:
+            _shared_renderer.close()
@@ -1,67 +1,124 @@
-﻿from prophet import Prophet
+﻿import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 from datetime import datetime, timedelta
 from config.settings import WeatherConfig
+from models.forecast_engines import VARIABLE_BOUNDS, ForecastEngine, create_engine
+from models.model_cache import ForecastModelCache, get_model_cache
+from models.plot_renderer import get_plot_renderer
+from utils.instrumentation import get_tracer
+from utils.performance import traced
+from utils.singleflight import get_singleflight
+import logging
 import os
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
 
 
 class WeatherForecaster:
-    def __init__(self):
+    def __init__(self, engine: str = None):
         self.config = WeatherConfig()
         self.model = None
-
-    def forecast_temperature(self, df: pd.DataFrame, periods: int = None) -> pd.DataFrame:
+        self.engine_name = engine or self.config.FORECAST_ENGINE
+        self.cache = get_model_cache(self.config)
+        self._engines = {}
+
+    def get_engine(self, name: str = None) -> ForecastEngine:
+        name = name or self.engine_name
+        if name not in self._engines:
+            self._engines[name] = create_engine(name)
+        return self._engines[name]
+
+    def forecast_temperature(self, df: pd.DataFrame, periods: int = None, location: str = None,
+                             engine: str = None) -> pd.DataFrame:
         if periods is None:
             periods = self.config.FORECAST_DAYS
 
         if "date" in df.columns:
             df = df.rename(columns={"date": "ds", "temperature": "y"})
 
-        self.model = Prophet(
-            yearly_seasonality=True,
-            weekly_seasonality=True,
-            daily_seasonality=False,
-            changepoint_prior_scale=0.05
-        )
-
-        self.model.fit(df)
-
-        future = self.model.make_future_dataframe(periods=periods)
-        forecast = self.model.predict(future)
-
-        return forecast[["ds", "yhat", "yhat_lower", "yhat_upper"]]
+        forecast_engine = self.get_engine(engine)
+        with get_tracer().span("forecast", engine=forecast_engine.name, location=location) as span:
+            fingerprint = ForecastModelCache.fingerprint(df)
+            if not self.config.SINGLE_FLIGHT_ENABLED:
+                return self._forecast(forecast_engine, df, periods, location, span, fingerprint)
+
+            # Ten sam szereg i horyzont liczony rownolegle przez kilka sesji - jedno dopasowanie modelu
+            forecast, shared = get_singleflight("forecast").do(
+                (forecast_engine.name, fingerprint, periods),
+                self._forecast, forecast_engine, df, periods, location, span, fingerprint
+            )
+            span.set("coalesced", shared)
+            return forecast
+
+    def _forecast(self, forecast_engine: ForecastEngine, df: pd.DataFrame, periods: int, location: str,
+                  span, fingerprint: str) -> pd.DataFrame:
+        cache = self.cache if forecast_engine.cacheable else None
+
+        if cache is not None:
+            cached = cache.get_forecast(fingerprint, periods, engine=forecast_engine.name)
+            span.set("cache_hit", cached is not None)
+            if cached is not None:
+                logger.info(f"Prognoza z cache ({forecast_engine.name}, {fingerprint[:8]})")
+                return cached
+
+        previous = cache.get_model(location, df) if cache is not None and location else None
+        # Model z wyniku wywolania, nie z atrybutu wspoldzielonego silnika - rownolegle sesje go nie podmienia
+        forecast, model = forecast_engine.fit_forecast(df[["ds", "y"]], periods, warm_start=previous)
+        self.model = model
+
+        if cache is not None:
+            cache.put_forecast(fingerprint, periods, forecast, engine=forecast_engine.name)
+            if location:
+                cache.put_model(location, model)
+
+        return forecast
+
+
+    def forecast_variables(self, df: pd.DataFrame, variables: List[str] = None, periods: int = None,
+                           location: str = None, engine: str = None) -> Dict[str, pd.DataFrame]:
+        """Prognozy kolumn scalonego szeregu (humidity, pressure, ...) w jednym przebiegu silnika"""
+        if periods is None:
+            periods = self.config.FORECAST_DAYS
+        if variables is None:
+            variables = self.config.FORECAST_VARIABLES
+
+        # "temperature" to kolumna y scalonego szeregu
+        columns = {}
+        for variable in variables:
+            column = "y" if variable == "temperature" else variable
+            if column in df.columns:
+                columns[column] = variable
+        if not columns:
+            return {}
+
+        forecast_engine = self.get_engine(engine or self.config.FORECAST_VARIABLES_ENGINE)
+        with get_tracer().span("forecast.variables", engine=forecast_engine.name, location=location,
+                               variables=len(columns)):
+            forecasts = forecast_engine.forecast_many(df[["ds", *columns]], list(columns), periods)
+
+        results = {}
+        for column, forecast in forecasts.items():
+            variable = columns[column]
+            lower, upper = VARIABLE_BOUNDS.get(variable, (None, None))
+            if lower is not None or upper is not None:
+                forecast[["yhat", "yhat_lower", "yhat_upper"]] = np.clip(
+                    forecast[["yhat", "yhat_lower", "yhat_upper"]], lower, upper)
+            results[variable] = forecast
+        return results
 
 
 # wykres do zapisu
+    @traced("plot")
     def plot_forecast(self, forecast_df: pd.DataFrame, historical_df: pd.DataFrame = None,
-                      title: str = "Temperature Forecast", save_path: str = None):
-
-        plt.style.use(self.config.PLOT_STYLE)
-        fig, ax = plt.subplots(figsize=self.config.FIGURE_SIZE)
-
-        if historical_df is not None:
-            ax.plot(historical_df["ds"], historical_df["y"],
-                    label="Data Historyczna", color="gray", alpha=0.7, linewidth=1)
-
-        ax.plot(forecast_df["ds"], forecast_df["yhat"],
-                label="Prognoza", color="blue", linewidth=2)
-
-        ax.fill_between(forecast_df["ds"], forecast_df["yhat_lower"], forecast_df["yhat_upper"],
-                        color="lightblue", alpha=0.4, label="Przedzial ufnosci")
-
-        ax.set_xlabel("Data")
-        ax.set_ylabel("Temperatura (°C)")
-        ax.set_title(title)
-        ax.legend()
-        ax.grid(True, alpha=0.3)
-
-        plt.xticks(rotation=45)
-        plt.tight_layout()
+                      title: str = "Temperature Forecast", save_path: str = None,
+                      fmt: str = None, dpi: int = None) -> bytes:
+        """Wykres przez wspoldzielony renderer (figura-szablon + cache); zwraca bajty PNG/SVG albo JSON plotly"""
+        renderer = get_plot_renderer(self.config)
 
         # Save if needed
         if save_path:
             os.makedirs(os.path.dirname(save_path), exist_ok=True)
-            fig.savefig(save_path, dpi=300, bbox_inches='tight')
+            return renderer.save(save_path, forecast_df, historical_df, title, fmt, dpi)
 
-        return fig
+        return renderer.render(forecast_df, historical_df, title, fmt, dpi)
@@ -0,0 +1,381 @@
+﻿"""
+Tryb uslugi: harmonogram odswiezajacy prognozy skonfigurowanych lokalizacji i lokalne API JSON.
+
+    python service.py --port 8765
+    curl http://127.0.0.1:8765/forecast/krakow
+"""
+import argparse
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.parse import unquote
+
+from main import WeatherWise
+from utils.aggregator import get_aggregation_engine
+from utils.gazetteer import get_gazetteer, normalize_name, parse_coordinates
+from utils.instrumentation import get_tracer
+
+logger = logging.getLogger(__name__)
+
+
+def location_key(location: str, gazetteer=None) -> str:
+    """Nazwa znormalizowana, wspolrzedne przyciagniete do komorki siatki gazetera - '50.061,19.937'
+    i '50.06, 19.94' to ten sam wpis magazynu i harmonogramu"""
+    coordinates = parse_coordinates(location)
+    if coordinates is None:
+        return normalize_name(location)
+    if gazetteer is not None:
+        return gazetteer.snap(*coordinates)[0]
+    return f"{coordinates[0]:.2f}_{coordinates[1]:.2f}"
+
+
+class ForecastStore:
+    """Gotowe wyniki w pamieci (razem z zakodowanym JSON) i kopia na dysku na wypadek restartu"""
+
+    def __init__(self, directory: str, gazetteer=None):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.gazetteer = gazetteer
+        self._lock = threading.Lock()
+        self._records: Dict[str, dict] = {}
+        self._encoded: Dict[str, bytes] = {}
+        self._load()
+
+    def key(self, location: str) -> str:
+        return location_key(location, self.gazetteer)
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key.replace(' ', '_')}.json"
+
+    def _load(self) -> None:
+        for path in self.directory.glob("*.json"):
+            try:
+                record = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Pominieto uszkodzony wpis {path}: {e}")
+                continue
+            key = self.key(record["location"])
+            self._records[key] = record
+            self._encoded[key] = json.dumps(record).encode("utf-8")
+        if self._records:
+            logger.info(f"Wczytano {len(self._records)} zapisanych prognoz z {self.directory}")
+
+    def put(self, record: dict) -> None:
+        key = self.key(record["location"])
+        encoded = json.dumps(record).encode("utf-8")
+        with self._lock:
+            self._records[key] = record
+            self._encoded[key] = encoded
+
+        path = self._path(key)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_bytes(encoded)
+        os.replace(tmp_path, path)
+
+    def get(self, location: str) -> Optional[bytes]:
+        with self._lock:
+            return self._encoded.get(self.key(location))
+
+    def summary(self) -> List[dict]:
+        with self._lock:
+            return [
+                {"location": record["location"], "updated_at": record["updated_at"], "stale": record.get("stale", False)}
+                for record in self._records.values()
+            ]
+
+    def mark_stale(self, location: str, error: str) -> None:
+        with self._lock:
+            record = self._records.get(self.key(location))
+        if record is not None:
+            self.put({**record, "stale": True, "error": error})
+
+
+class RefreshScheduler:
+    """Jeden watek odswiezajacy lokalizacje po kolei; starty rozlozone co stagger_s, by nie zalewac dostawcow.
+    Cyklicznie odswiezane sa tylko lokalizacje z konfiguracji - pozostale (zapytania ad hoc) raz na zadanie,
+    nie czesciej niz co interval_s"""
+
+    def __init__(self, weather_app: WeatherWise, store: ForecastStore, locations: List[str],
+                 interval_s: float, stagger_s: float, max_backoff_s: float = 3600):
+        self.weather_app = weather_app
+        self.store = store
+        self.interval_s = interval_s
+        self.stagger_s = stagger_s
+        self.max_backoff_s = max_backoff_s
+
+        now = time.monotonic()
+        self._queue = [(now + i * stagger_s, location) for i, location in enumerate(locations)]
+        heapq.heapify(self._queue)
+        self._scheduled = {store.key(location) for location in locations}
+        self._refreshed_at: Dict[str, float] = {}
+        self._failures: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_run_at: Optional[float] = None
+        self.stats = {"refreshes": 0, "failures": 0}
+
+    def start(self) -> "RefreshScheduler":
+        self._thread = threading.Thread(target=self._run, name="forecast-scheduler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = None) -> None:
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def refresh_now(self, location: str) -> None:
+        """Odswiezenie poza kolejnoscia, nadal nie wczesniej niz stagger_s po poprzednim"""
+        key = self.store.key(location)
+        with self._lock:
+            self._queue = [(due, queued) for due, queued in self._queue if self.store.key(queued) != key]
+            heapq.heapify(self._queue)
+            heapq.heappush(self._queue, (time.monotonic(), location))
+        self._wakeup.set()
+
+    def refresh_if_expired(self, location: str) -> bool:
+        """Lokalizacje spoza harmonogramu: ponowne odswiezenie, gdy wynik jest starszy niz interval_s"""
+        key = self.store.key(location)
+        with self._lock:
+            if key in self._scheduled or any(self.store.key(queued) == key for _, queued in self._queue):
+                return False
+            refreshed_at = self._refreshed_at.get(key)
+        if refreshed_at is not None and time.monotonic() - refreshed_at < self.interval_s:
+            return False
+        self.refresh_now(location)
+        return True
+
+    def pending(self) -> List[dict]:
+        now = time.monotonic()
+        with self._lock:
+            return [{"location": location, "due_in_s": round(max(0.0, due - now), 1)}
+                    for due, location in sorted(self._queue)]
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            with self._lock:
+                due, location = self._queue[0] if self._queue else (None, None)
+
+            if due is None:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+
+            # Odstep miedzy kolejnymi odswiezeniami chroni limity dostawcow takze przy refresh_now
+            if self._last_run_at is not None:
+                due = max(due, self._last_run_at + self.stagger_s)
+            delay = due - time.monotonic()
+            if delay > 0:
+                self._wakeup.wait(delay)
+                self._wakeup.clear()
+                continue
+
+            with self._lock:
+                heapq.heappop(self._queue)
+            self._last_run_at = time.monotonic()
+            next_due = self._last_run_at + self._refresh(location)
+            key = self.store.key(location)
+            with self._lock:
+                if key in self._scheduled:
+                    heapq.heappush(self._queue, (next_due, location))
+                else:
+                    self._failures.pop(key, None)
+
+    def _refresh(self, location: str) -> float:
+        """Odswieza jedna lokalizacje; zwraca czas do nastepnego odswiezenia w sekundach"""
+        key = self.store.key(location)
+        try:
+            with get_tracer().span("service.refresh", location=location):
+                self.store.put(build_record(self.weather_app, location))
+        except Exception as e:
+            failures = self._failures.get(key, 0) + 1
+            self._failures[key] = failures
+            self.stats["failures"] += 1
+            self.store.mark_stale(location, str(e))
+            backoff = min(self.max_backoff_s, self.interval_s, 60 * 2 ** (failures - 1))
+            logger.error(f"Odswiezenie {location} nie powiodlo sie ({e}), ponowienie za {backoff:.0f}s")
+            return backoff
+
+        self._failures.pop(key, None)
+        self._refreshed_at[key] = time.monotonic()
+        self.stats["refreshes"] += 1
+        logger.info(f"Odswiezono prognoze dla {location}")
+        return self.interval_s
+
+
+def build_record(weather_app: WeatherWise, location: str) -> dict:
+    """Pelny potok dla lokalizacji jako slownik gotowy do serializacji JSON"""
+    weather_data = weather_app.fetch_all_data(location)
+    if not weather_data:
+        raise RuntimeError("Brak dostepnych danych pogodowych")
+
+    # Harmonogram odswieza te same lokalizacje - do podsumowan trafiaja tylko nowe i poprawione dni
+    engine = get_aggregation_engine(weather_app.config)
+    engine.ingest_many(weather_data)
+
+    merged = weather_app.merger.merge_series(weather_data, weights=weather_app.config.MERGE_SOURCE_WEIGHTS,
+                                             quality=weather_app.source_quality)
+    periods = weather_app.config.FORECAST_DAYS
+    forecast = weather_app.forecaster.forecast_temperature(merged, periods=periods, location=location)
+    variables = weather_app.forecaster.forecast_variables(merged, periods=periods, location=location)
+    # Kazde odswiezenie dopisuje wyniki do zbioru Parquet - odbiorcy czytaja je bez uslugi
+    run_id = weather_app.save_results(location, merged, {"temperature": forecast, **variables})
+
+    return {
+        "location": location,
+        "updated_at": datetime.now().isoformat(timespec="seconds"),
+        "stale": False,
+        "sources": [data.source for data in weather_data],
+        "summary": weather_app.aggregator.aggregate_weather_data(weather_data),
+        "statistics": engine.location_summary(location),
+        "quality": merged.attrs.get("quality", {}),
+        "run_id": run_id,
+        "history": [
+            {"date": row.ds.strftime("%Y-%m-%d"), "temperature": round(float(row.y), 2)}
+            for row in merged.tail(30).itertuples(index=False)
+        ],
+        "forecast": [
+            {"date": row.ds.strftime("%Y-%m-%d"), "temperature": round(float(row.yhat), 2),
+             "lower": round(float(row.yhat_lower), 2), "upper": round(float(row.yhat_upper), 2)}
+            for row in forecast.tail(periods).itertuples(index=False)
+        ],
+        "variables": {
+            variable: [
+                {"date": row.ds.strftime("%Y-%m-%d"), "value": round(float(row.yhat), 2),
+                 "lower": round(float(row.yhat_lower), 2), "upper": round(float(row.yhat_upper), 2)}
+                for row in frame.tail(periods).itertuples(index=False)
+            ]
+            for variable, frame in variables.items()
+        },
+    }
+
+
+class WeatherService:
+    """WeatherWise z cieplymi klientami i modelami, harmonogramem odswiezen i API HTTP"""
+
+    def __init__(self, locations: List[str] = None, host: str = None, port: int = None):
+        self.weather_app = WeatherWise()
+        config = self.weather_app.config
+        self.locations = locations or config.SERVICE_LOCATIONS or [name.title() for name in config.LOCATIONS]
+        self.store = ForecastStore(config.SERVICE_STORE_DIR, get_gazetteer(config))
+        self.scheduler = RefreshScheduler(
+            self.weather_app, self.store, self.locations,
+            interval_s=config.SERVICE_REFRESH_MINUTES * 60,
+            stagger_s=config.SERVICE_STAGGER_SECONDS
+        )
+        self.started_at = time.time()
+        self._server = ThreadingHTTPServer((host or config.SERVICE_HOST, port or config.SERVICE_PORT),
+                                           self._handler())
+        self._server.daemon_threads = True
+
+    def is_known(self, location: str) -> bool:
+        config = self.weather_app.config
+        if location.lower() in config.LOCATIONS:
+            return True
+        gazetteer = get_gazetteer(config)
+        return gazetteer is not None and gazetteer.resolve(location) is not None
+
+    @property
+    def address(self):
+        return self._server.server_address[:2]
+
+    def _handler(self):
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _send(self, status: int, body: bytes) -> None:
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_json(self, status: int, payload) -> None:
+                self._send(status, json.dumps(payload).encode("utf-8"))
+
+            def do_GET(self):
+                parts = [unquote(part) for part in self.path.split("?")[0].strip("/").split("/") if part]
+
+                if parts == ["health"]:
+                    self._send_json(200, {
+                        "status": "ok",
+                        "uptime_s": round(time.time() - service.started_at, 1),
+                        "scheduler": service.scheduler.stats,
+                        "pending": service.scheduler.pending(),
+                    })
+                elif parts == ["locations"]:
+                    self._send_json(200, service.store.summary())
+                elif len(parts) == 2 and parts[0] == "forecast":
+                    # Odczyt to tylko wyszukanie w slowniku - potok liczy harmonogram
+                    body = service.store.get(parts[1])
+                    if body is not None:
+                        # Wynik ad hoc starszy niz interwal odswiezany w tle - odpowiedz nie czeka
+                        service.scheduler.refresh_if_expired(parts[1])
+                        self._send(200, body)
+                    elif not service.is_known(parts[1]):
+                        self._send_json(404, {"location": parts[1], "error": "unknown location"})
+                    else:
+                        service.scheduler.refresh_now(parts[1])
+                        self._send_json(202, {"location": parts[1], "status": "scheduled"})
+                else:
+                    self._send_json(404, {"error": "not found"})
+
+            def do_POST(self):
+                parts = [unquote(part) for part in self.path.split("?")[0].strip("/").split("/") if part]
+                if len(parts) == 2 and parts[0] == "refresh" and service.is_known(parts[1]):
+                    service.scheduler.refresh_now(parts[1])
+                    self._send_json(202, {"location": parts[1], "status": "scheduled"})
+                else:
+                    self._send_json(404, {"error": "not found"})
+
+            def log_message(self, format, *args):
+                logger.debug(f"{self.address_string()} {format % args}")
+
+        return Handler
+
+    def start(self) -> "WeatherService":
+        self.scheduler.start()
+        threading.Thread(target=self._server.serve_forever, name="forecast-api", daemon=True).start()
+        host, port = self.address
+        logger.info(f"Usluga prognoz nasluchuje na http://{host}:{port} ({len(self.locations)} lokalizacji)")
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        self.scheduler.stop(timeout=5)
+        self.weather_app.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Usluga WeatherWise z harmonogramem odswiezania prognoz")
+    parser.add_argument("--host")
+    parser.add_argument("--port", type=int)
+    parser.add_argument("--locations", help="lista lokalizacji oddzielona przecinkami")
+    args = parser.parse_args()
+
+    locations = [item.strip() for item in args.locations.split(",") if item.strip()] if args.locations else None
+    service = WeatherService(locations, args.host, args.port).start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        logger.info("Zatrzymywanie uslugi")
+    finally:
+        service.stop()
+
+
+if __name__ == "__main__":
+    main()
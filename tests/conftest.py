@@ -0,0 +1,5 @@
+﻿import sys
+from pathlib import Path
+
+# Testy uruchamiane z dowolnego katalogu importuja pakiety projektu (api_clients, utils, models)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,105 @@
+﻿import numpy as np
+import pandas as pd
+import pytest
+
+from api_clients.base import WeatherAPIClient
+from config.settings import WeatherConfig
+from models.backtest import Backtester, rolling_origins
+
+
+def days(start, n):
+    return np.arange(np.datetime64(start, "D"), np.datetime64(start, "D") + n)
+
+
+def test_rolling_origins_step_back_from_last_full_horizon():
+    ds = days("2023-01-01", 100)
+    cutoffs = rolling_origins(ds, horizon=7, origins=3, step_days=10, min_train_days=30)
+    assert cutoffs == [np.datetime64("2023-03-14"), np.datetime64("2023-03-24"), np.datetime64("2023-04-03")]
+    # Po ostatnim odcieciu zostaje pelny horyzont
+    assert ds[-1] - cutoffs[-1] == np.timedelta64(7, "D")
+
+
+def test_rolling_origins_respect_min_train_days():
+    ds = days("2023-01-01", 100)
+    cutoffs = rolling_origins(ds, horizon=7, origins=10, step_days=10, min_train_days=50)
+    assert len(cutoffs) == 5
+    assert all((cutoff - ds[0]).astype(int) >= 50 for cutoff in cutoffs)
+    assert cutoffs == sorted(cutoffs)
+
+
+def test_rolling_origins_empty_series():
+    assert rolling_origins(np.array([], dtype="datetime64[D]"), 7, 3, 10, 0) == []
+
+
+def test_default_history_fits_all_origins():
+    config = WeatherConfig()
+    backtester = Backtester(config, workers=1)
+    horizon, origins, step_days, min_train_days = backtester.window()
+    ds = days("2020-01-01", backtester.history_days())
+    assert len(rolling_origins(ds, horizon, origins, step_days, min_train_days)) == config.BACKTEST_ORIGINS
+    assert backtester.history_days(origins=2, step_days=5, horizon=3, min_train_days=10) == 23
+
+
+def test_select_engine_handles_empty_summary():
+    assert Backtester.select_engine(pd.DataFrame()) is None
+    assert Backtester.select_engine(Backtester.summarize(pd.DataFrame(columns=["engine"]))) is None
+
+
+def test_select_engine_picks_cheapest_meeting_thresholds():
+    summary = pd.DataFrame({
+        "points": [100, 100, 0],
+        "mae": [1.0, 2.5, 0.1],
+        "rmse": [1.2, 3.0, 0.1],
+        "coverage": [0.9, 0.8, 1.0],
+        "fit_ms_mean": [800.0, 10.0, 1.0],
+    }, index=pd.Index(["prophet", "harmonic", "broken"], name="engine"))
+    assert Backtester.select_engine(summary) == "harmonic"
+    assert Backtester.select_engine(summary, max_mae=2.0) == "prophet"
+    assert Backtester.select_engine(summary, max_mae=0.5) is None
+
+
+def test_filled_days_are_not_scored():
+    ds = pd.date_range("2022-01-01", periods=400, freq="D")
+    position = np.arange(len(ds))
+    y = 10 + 8 * np.sin(2 * np.pi * position / 365.25)
+    filled = np.zeros(len(ds), dtype=bool)
+    filled[-7:-4] = True
+    series = pd.DataFrame({"ds": ds, "y": y, "filled": filled})
+
+    backtester = Backtester(WeatherConfig(), workers=1)
+    folds = backtester.run({"Krakow": series}, engines=["harmonic"], horizon=7, origins=1, step_days=30,
+                           min_train_days=300, measure_memory=False)
+
+    assert len(folds) == 1 and folds["error"].isna().all()
+    assert folds.loc[0, "points"] == 4
+    assert folds.loc[0, "mae"] == pytest.approx(0, abs=0.5)
+
+
+class StubClient(WeatherAPIClient):
+    def __init__(self):
+        self.config = WeatherConfig()
+        super().__init__("Stub")
+
+    def fetch(self, location):
+        raise NotImplementedError
+
+    def is_available(self):
+        return True
+
+    def _fetch_range(self, lat, lon, start, end):
+        raise NotImplementedError
+
+    def _fetch_hourly_range(self, lat, lon, start, end):
+        raise NotImplementedError
+
+
+def test_longer_history_does_not_touch_shared_client():
+    shared = StubClient()
+    days_before = shared.config.HISTORICAL_DAYS
+    longer = shared.with_history_days(days_before + 100)
+
+    assert longer is not shared and longer.config is not shared.config
+    assert longer.config.HISTORICAL_DAYS == days_before + 100
+    assert shared.config.HISTORICAL_DAYS == days_before
+    assert (shared.history_range()[1] - longer.history_range()[0]).days == days_before + 100
+    assert shared.with_history_days(days_before - 1) is shared
@@ -0,0 +1,136 @@
+﻿import asyncio
+
+import pytest
+import requests
+
+from api_clients.base import CircuitBreaker, HttpTransport
+from config.settings import WeatherConfig
+from exceptions.weather_exceptions import ProviderUnavailableError
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr("api_clients.base.time.monotonic", fake)
+    return fake
+
+
+def test_opens_after_threshold_failures(clock):
+    breaker = CircuitBreaker(threshold=3, reset_timeout=10)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+
+def test_success_resets_failure_count(clock):
+    breaker = CircuitBreaker(threshold=2, reset_timeout=10)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_allows_single_probe(clock):
+    breaker = CircuitBreaker(threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    clock.now += 10
+
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+
+
+def test_failed_probe_reopens(clock):
+    breaker = CircuitBreaker(threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    clock.now += 10
+    assert breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+
+def test_lost_probe_lets_next_probe_through(clock):
+    breaker = CircuitBreaker(threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    clock.now += 10
+    assert breaker.allow()
+
+    # Proba nigdy nie zglosila wyniku
+    clock.now += 9
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.allow()
+
+
+def _transport(session_get):
+    config = WeatherConfig()
+    config.HTTP_RETRIES = 0
+    config.HTTP_BREAKER_THRESHOLD = 1
+    config.HTTP_BREAKER_RESET_S = 10
+    config.HTTP_RATE_LIMITS = {}
+    transport = HttpTransport("Test", config)
+    transport.session.get = session_get
+    return transport
+
+
+def test_unexpected_exception_on_probe_reopens_breaker(clock):
+    def broken(*args, **kwargs):
+        raise requests.exceptions.ChunkedEncodingError("przerwany transfer")
+
+    transport = _transport(broken)
+    transport.breaker.record_failure()
+    clock.now += 10
+
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        transport.get_json("http://example.invalid")
+    assert transport.breaker.state == CircuitBreaker.OPEN
+
+    clock.now += 10
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        transport.get_json("http://example.invalid")
+
+
+def test_client_error_does_not_count_as_failure(clock):
+    class Response:
+        status_code = 404
+        content = b""
+        headers = {}
+
+        def raise_for_status(self):
+            raise requests.HTTPError("404")
+
+    transport = _transport(lambda *args, **kwargs: Response())
+    with pytest.raises(requests.HTTPError):
+        transport.get_json("http://example.invalid")
+    assert transport.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_guarded_records_cancellation(clock):
+    transport = _transport(None)
+    transport.breaker.record_failure()
+    clock.now += 10
+
+    with pytest.raises(asyncio.CancelledError):
+        with transport.guarded():
+            raise asyncio.CancelledError()
+    assert transport.breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(ProviderUnavailableError):
+        with transport.guarded():
+            pass
@@ -0,0 +1,115 @@
+﻿import threading
+import time
+
+import pytest
+import requests
+
+from api_clients.base import CircuitBreaker, HttpTransport
+from utils.deadline import _fetch_deadline, fetch_deadline, fetch_time_left
+from config.settings import WeatherConfig
+from utils.parallel_processor import ConcurrentFetchEngine
+
+
+def _transport(session_get, retries=0):
+    config = WeatherConfig()
+    config.HTTP_RETRIES = retries
+    config.HTTP_BACKOFF_BASE = 5
+    config.HTTP_BACKOFF_MAX = 5
+    config.HTTP_RATE_LIMITS = {}
+    transport = HttpTransport("Test", config)
+    transport.session.get = session_get
+    return transport
+
+
+class Response:
+    status_code = 200
+    content = b"{}"
+    headers = {}
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return {}
+
+
+def test_timeouts_are_clipped_to_deadline():
+    seen = []
+
+    def get(*args, timeout=None, **kwargs):
+        seen.append(timeout)
+        return Response()
+
+    transport = _transport(get)
+    with fetch_deadline(time.monotonic() + 1.0):
+        transport.get_json("http://example.invalid")
+    connect, read = seen[0]
+    assert connect <= 1.0 and read <= 1.0
+
+    transport.get_json("http://example.invalid")
+    assert seen[1] == (transport.connect_timeout, transport.read_timeout)
+
+
+def test_no_retry_past_deadline(monkeypatch):
+    calls = []
+
+    def get(*args, **kwargs):
+        calls.append(1)
+        raise requests.ConnectionError("brak polaczenia")
+
+    transport = _transport(get, retries=3)
+    transport.backoff = lambda attempt, retry_after=None: 5.0
+    sleeps = []
+    monkeypatch.setattr("api_clients.base.time.sleep", sleeps.append)
+    with fetch_deadline(time.monotonic() + 1.0), pytest.raises(requests.ConnectionError):
+        transport.get_json("http://example.invalid")
+    # Backoff (5 s) nie miesci sie przed terminem - jedna proba, bez czekania i porazka w bezpieczniku
+    assert len(calls) == 1
+    assert sleeps == []
+    assert transport.breaker._failures == 1
+
+
+def test_expired_deadline_skips_request_without_breaker_failure():
+    transport = _transport(lambda *args, **kwargs: pytest.fail("zapytanie po terminie"))
+    with fetch_deadline(time.monotonic() - 1), pytest.raises(requests.Timeout):
+        transport.get_json("http://example.invalid")
+    assert transport.breaker.state == CircuitBreaker.CLOSED and transport.breaker._failures == 0
+
+
+class BlockingClient:
+    """Klient, ktory zapisuje termin pobrania i czeka na zwolnienie przez test"""
+
+    def __init__(self, name, blocked=False):
+        self.name = name
+        self.deadline_at = None
+        self.release = threading.Event()
+        self.finished = threading.Event()
+        if not blocked:
+            self.release.set()
+
+    def fetch_coalesced(self, location):
+        self.deadline_at = _fetch_deadline.get()
+        self.release.wait()
+        self.finished.set()
+        return f"{self.name}:{location}"
+
+
+def test_engine_passes_deadline_to_fetch_and_stops_waiting():
+    engine = ConcurrentFetchEngine(max_workers=2, source_timeouts={"slow": 0.05}, default_timeout=30)
+    fast, slow = BlockingClient("fast"), BlockingClient("slow", blocked=True)
+    results = []
+    caller = threading.Thread(target=lambda: results.extend(engine.fetch([fast, slow], "Krakow")))
+    try:
+        caller.start()
+        # Wolny klient nadal czeka - fetch konczy sie tylko dlatego, ze silnik przestal czekac
+        caller.join(timeout=10)
+        assert not caller.is_alive()
+        assert results == ["fast:Krakow"]
+        assert not slow.finished.is_set()
+        # Oba terminy liczone od tego samego startu: roznica to roznica limitow zrodel
+        assert fast.deadline_at - slow.deadline_at == pytest.approx(30 - 0.05)
+    finally:
+        slow.release.set()
+        engine.shutdown(wait_for_running=True)
+    assert slow.finished.is_set()
+    assert fetch_time_left() is None
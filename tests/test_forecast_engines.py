@@ -0,0 +1,49 @@
+﻿import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from exceptions.weather_exceptions import InsufficientDataError
+from models.forecast_engines import HarmonicEngine, create_engine
+
+
+def series(level, days=400):
+    ds = pd.date_range("2022-01-01", periods=days, freq="D")
+    position = np.arange(days)
+    return pd.DataFrame({"ds": ds, "y": level + 8 * np.sin(2 * np.pi * position / 365.25)})
+
+
+def test_fit_forecast_returns_forecast_and_model():
+    engine = HarmonicEngine()
+    forecast, model = engine.fit_forecast(series(10), periods=7)
+    assert len(forecast) == 407
+    assert list(forecast.columns) == ["ds", "yhat", "yhat_lower", "yhat_upper"]
+    assert model["yearly_order"] == engine.yearly_order
+    pd.testing.assert_frame_equal(engine.forecast(series(10), periods=7), forecast)
+
+
+def test_shared_engine_keeps_models_per_call():
+    engine = create_engine("harmonic")
+    results = {}
+
+    def run(level):
+        for _ in range(20):
+            forecast, model = engine.fit_forecast(series(level), periods=7)
+            results.setdefault(level, []).append((forecast["yhat"].mean(), model["beta"][0]))
+
+    threads = [threading.Thread(target=run, args=(level,)) for level in (0, 50)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for level, runs in results.items():
+        for mean, intercept in runs:
+            assert mean == pytest.approx(level, abs=2)
+            assert intercept == pytest.approx(level, abs=2)
+
+
+def test_harmonic_needs_two_points():
+    with pytest.raises(InsufficientDataError):
+        HarmonicEngine().fit_forecast(series(0, days=1), periods=7)
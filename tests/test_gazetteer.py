@@ -0,0 +1,58 @@
+﻿import pytest
+
+from config.settings import WeatherConfig
+from utils.gazetteer import Gazetteer, Place, normalize_name, parse_coordinates
+
+
+@pytest.fixture(scope="module")
+def gazetteer():
+    config = WeatherConfig()
+    return Gazetteer.load(config.GAZETTEER_PATH, config.LOCATION_SNAP_DEG, config.LOCATION_NAME_MAX_KM)
+
+
+def test_normalize_name():
+    assert normalize_name("Kraków") == "krakow"
+    assert normalize_name("Bielsko-Biała") == "bielsko biala"
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("50.06,19.94", (50.06, 19.94)),
+    (" 50.06 ; 19.94 ", (50.06, 19.94)),
+    ("-33.9,151.2", (-33.9, 151.2)),
+    ("91,0", None),
+    ("Krakow", None),
+])
+def test_parse_coordinates(text, expected):
+    assert parse_coordinates(text) == expected
+
+
+def test_resolve_name_and_nearby_coordinates(gazetteer):
+    by_name = gazetteer.resolve("Kraków")
+    by_coordinates = gazetteer.resolve("50.061,19.937")
+    assert by_name is not None and by_coordinates is not None
+    assert by_coordinates.name == by_name.name
+    assert by_coordinates.key == gazetteer.resolve("50.06, 19.94").key
+
+
+def test_coordinates_anywhere_are_snapped(gazetteer):
+    # Open-Meteo obejmuje caly swiat - punkt daleko od miejscowosci gazetera dostaje wlasna nazwe
+    sydney = gazetteer.resolve("-33.87,151.21")
+    assert sydney is not None and sydney.name == "-33.87,151.21"
+    assert (sydney.key, sydney.lat, sydney.lon) == gazetteer.snap(-33.87, 151.21)
+    assert gazetteer.resolve("-33.88, 151.24").key == sydney.key
+
+
+def test_out_of_range_coordinates_are_rejected(gazetteer):
+    assert gazetteer.resolve("91,0") is None
+    assert gazetteer.resolve("50,181") is None
+
+
+def test_name_only_for_nearby_place():
+    gazetteer = Gazetteer([Place("A", 50.0, 20.0)], snap_deg=0.1, name_max_km=25)
+    assert gazetteer.resolve("50.1,20.1").name == "A"
+    assert gazetteer.resolve("51.0,20.0").name == "51.0,20.0"
+
+
+def test_empty_gazetteer_accepts_any_coordinates():
+    resolved = Gazetteer([]).resolve("40.71,-74.01")
+    assert resolved is not None and resolved.name == "40.71,-74.01"
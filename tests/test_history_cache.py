@@ -0,0 +1,78 @@
+﻿import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from api_clients.base import DAILY_FIELDS
+from utils.history_cache import MISSING_MERGE_DAYS, HistoryCache
+
+
+def daily(start, end, skip=()):
+    days = [day for day in pd.date_range(start, end, freq="D") if day.date() not in skip]
+    return pd.DataFrame({"date": days, **{field: np.arange(len(days), dtype=float) for field in DAILY_FIELDS}})
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return HistoryCache(str(tmp_path / "history.sqlite"), recent_days=3, recent_ttl_hours=6)
+
+
+def test_empty_cache_misses_whole_range(cache):
+    cached, missing = cache.lookup("OpenMeteo", "krakow", date(2023, 1, 1), date(2023, 1, 31))
+    assert cached.empty
+    assert missing == [(date(2023, 1, 1), date(2023, 1, 31))]
+    assert cache.stats()["fetches"] == 1
+
+
+def test_full_coverage_has_no_missing_ranges(cache):
+    cache.store("OpenMeteo", "krakow", daily("2023-01-01", "2023-01-31"))
+    cached, missing = cache.lookup("OpenMeteo", "krakow", date(2023, 1, 1), date(2023, 1, 31))
+    assert missing == []
+    assert len(cached) == 31
+    assert cache.stats()["hits"] == 31 and cache.stats()["fetches"] == 0
+
+
+def test_separate_gaps_are_separate_ranges(cache):
+    # Luka na poczatku, w srodku i na koncu - nie jeden zakres od pierwszej do ostatniej
+    cache.store("OpenMeteo", "krakow", daily("2023-01-05", "2023-12-20", skip={date(2023, 6, 15)}))
+    cached, missing = cache.lookup("OpenMeteo", "krakow", date(2023, 1, 1), date(2023, 12, 31))
+    assert missing == [
+        (date(2023, 1, 1), date(2023, 1, 4)),
+        (date(2023, 6, 15), date(2023, 6, 15)),
+        (date(2023, 12, 21), date(2023, 12, 31)),
+    ]
+    stats = cache.stats()
+    assert stats["hits"] == len(cached) == 349
+    assert stats["misses"] == 16 and stats["fetches"] == 3
+
+
+def test_gaps_close_together_are_merged(cache):
+    near = {date(2023, 1, 10), date(2023, 1, 10) + timedelta(days=MISSING_MERGE_DAYS)}
+    cache.store("OpenMeteo", "krakow", daily("2023-01-01", "2023-01-31", skip=near))
+    _, missing = cache.lookup("OpenMeteo", "krakow", date(2023, 1, 1), date(2023, 1, 31))
+    assert missing == [(min(near), max(near))]
+    # Dni z cache wewnatrz polaczonego zakresu beda pobrane ponownie - nie sa trafieniami
+    assert cache.stats()["hits"] == 31 - (MISSING_MERGE_DAYS + 1)
+
+
+def test_sources_and_locations_are_separate(cache):
+    cache.store("OpenMeteo", "krakow", daily("2023-01-01", "2023-01-10"))
+    _, missing = cache.lookup("Meteostat", "krakow", date(2023, 1, 1), date(2023, 1, 10))
+    assert missing == [(date(2023, 1, 1), date(2023, 1, 10))]
+    _, missing = cache.lookup("OpenMeteo", "gdansk", date(2023, 1, 1), date(2023, 1, 10))
+    assert missing == [(date(2023, 1, 1), date(2023, 1, 10))]
+
+
+def test_recent_days_expire_after_ttl(cache, monkeypatch):
+    today = datetime.now().date()
+    cache.store("OpenMeteo", "krakow", daily(today - timedelta(days=30), today))
+
+    _, missing = cache.lookup("OpenMeteo", "krakow", today - timedelta(days=30), today)
+    assert missing == []
+
+    later = time.time() + cache.recent_ttl + 1
+    monkeypatch.setattr("utils.history_cache.time.time", lambda: later)
+    _, missing = cache.lookup("OpenMeteo", "krakow", today - timedelta(days=30), today)
+    assert missing == [(today - timedelta(days=cache.recent_days), today)]
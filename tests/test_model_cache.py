@@ -0,0 +1,65 @@
+﻿import os
+import time
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+from models.model_cache import ForecastModelCache
+
+
+def series(start, days):
+    return pd.DataFrame({"ds": pd.date_range(start, periods=days, freq="D"), "y": range(days)})
+
+
+def fitted(start, days):
+    return SimpleNamespace(history=series(start, days))
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr("prophet.serialize.model_to_json", lambda model: "{}")
+    return ForecastModelCache(str(tmp_path), max_entries=2)
+
+
+def test_forecasts_are_evicted_from_memory_and_disk(cache):
+    for number in range(3):
+        cache.put_forecast(f"f{number}", 7, series("2024-01-01", 3))
+
+    assert cache.get_forecast("f0", 7) is None
+    assert sorted(path.name for path in (cache.directory / "forecasts").iterdir()) == \
+        ["prophet_f1_7.json", "prophet_f2_7.json"]
+    assert cache.get_forecast("f2", 7) is not None
+
+
+def test_models_are_bounded(cache):
+    for location in ("krakow", "gdansk", "poznan"):
+        cache.put_model(location, fitted("2024-01-01", 30))
+
+    assert list(cache._models) == ["gdansk", "poznan"]
+    assert sorted(path.name for path in (cache.directory / "models").iterdir()) == ["gdansk.json", "poznan.json"]
+    assert cache.get_model("krakow") is None
+
+
+def test_warm_start_only_for_extended_series(cache):
+    model = fitted("2024-01-01", 30)
+    cache.put_model("krakow", model)
+
+    assert cache.get_model("krakow", series("2024-01-01", 31)) is model
+    assert cache.get_model("krakow", series("2024-01-01", 30)) is model
+    # Inny poczatek albo krotszy szereg - model nie pasuje
+    assert cache.get_model("krakow", series("2024-01-02", 40)) is None
+    assert cache.get_model("krakow", series("2024-01-01", 20)) is None
+
+
+def test_old_files_are_pruned_on_start(tmp_path):
+    forecasts = tmp_path / "forecasts"
+    forecasts.mkdir()
+    now = time.time()
+    for number in range(4):
+        path = forecasts / f"prophet_f{number}_7.json"
+        path.write_text("{}", encoding="utf-8")
+        os.utime(path, (now + number, now + number))
+
+    ForecastModelCache(str(tmp_path), max_entries=2)
+    assert sorted(path.name for path in forecasts.iterdir()) == ["prophet_f2_7.json", "prophet_f3_7.json"]
@@ -0,0 +1,45 @@
+﻿import random
+import statistics
+
+import pytest
+
+from utils.aggregator import RollingWindow
+
+
+def test_median_matches_window_values():
+    rng = random.Random(7)
+    window = RollingWindow(30)
+    values = {}
+    day = 0
+    for _ in range(2000):
+        if values and rng.random() < 0.1:
+            # Korekta dnia w oknie - tez przez kopce mediany
+            corrected = rng.choice([d for d in values if d > day - window.days])
+            values[corrected] = float(rng.randint(-5, 5))
+            assert window.replace(corrected, values[corrected])
+        else:
+            day += rng.randint(1, 3)
+            values[day] = float(rng.randint(-5, 5)) if rng.random() < 0.5 else rng.gauss(0, 10)
+            window.push(day, values[day])
+
+        in_window = [value for d, value in values.items() if d > day - window.days]
+        summary = window.to_dict()
+        assert summary["count"] == len(in_window)
+        assert summary["median"] == pytest.approx(statistics.median(in_window), abs=0.01)
+
+
+def test_removed_values_do_not_accumulate():
+    window = RollingWindow(7)
+    for day in range(10000):
+        window.push(day, float(day % 11))
+    assert len(window._low) + len(window._high) <= 2 * len(window) + 32
+
+
+def test_window_emptied_by_gap():
+    window = RollingWindow(3)
+    window.push(0, 5.0)
+    window.push(1, 7.0)
+    window.advance(10)
+    assert window.to_dict()["median"] is None
+    window.push(11, 2.0)
+    assert window.to_dict()["median"] == 2.0
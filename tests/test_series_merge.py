@@ -0,0 +1,121 @@
+﻿from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from api_clients.base import WeatherData
+from config.settings import WeatherConfig
+from exceptions.weather_exceptions import InsufficientDataError
+from utils.quality import SourceQuality
+from utils.series_merge import MERGED_COLUMNS, MERGED_VARIABLES, TimeSeriesMerger
+
+
+def weather(source, dates, temperatures, **variables):
+    frame = pd.DataFrame({"date": pd.to_datetime(dates), "temperature": temperatures, **variables})
+    return WeatherData(source, "Warsaw", datetime(2024, 1, 1), series=frame)
+
+
+def reference(weather_data):
+    """Srednia i odchylenie z proby z pandas - wynik merge_series bez wag i oceny jakosci"""
+    frame = pd.concat([data.series_frame() for data in weather_data]).dropna(subset=["temperature"])
+    grouped = frame.groupby("date")["temperature"]
+    return grouped.mean(), grouped.count(), grouped.std()
+
+
+@pytest.fixture
+def sources():
+    rng = np.random.default_rng(7)
+    dates = pd.date_range("2023-01-01", periods=60, freq="D")
+    a = rng.normal(5, 3, len(dates))
+    b = rng.normal(5, 3, len(dates))
+    b[[3, 10]] = np.nan
+    return [
+        weather("a", dates, a, humidity=rng.uniform(40, 90, len(dates))),
+        # Drugie zrodlo zaczyna sie pozniej i ma powtorzony dzien
+        weather("b", list(dates[20:]) + [dates[30]], list(b[20:]) + [9.0]),
+        weather("c", dates[::2], rng.normal(5, 3, 30)),
+    ]
+
+
+def test_merge_matches_pandas_groupby(sources):
+    merged = TimeSeriesMerger.merge_series(sources)
+    mean, count, std = reference(sources)
+
+    assert list(merged.columns) == MERGED_COLUMNS
+    np.testing.assert_array_equal(merged["ds"].to_numpy(), mean.index.to_numpy())
+    np.testing.assert_allclose(merged["y"].to_numpy(), mean.to_numpy())
+    np.testing.assert_array_equal(merged["temperature_count"].to_numpy(), count.to_numpy())
+    np.testing.assert_allclose(merged["temperature_std"].to_numpy(), std.to_numpy(), equal_nan=True)
+    assert not merged["filled"].any()
+
+
+def test_small_windows_give_same_result(sources):
+    merged = TimeSeriesMerger.merge_series(sources)
+    chunks = pd.concat(TimeSeriesMerger.iter_merged(sources, window_days=7), ignore_index=True)
+    pd.testing.assert_frame_equal(chunks, merged)
+
+
+def test_weights_and_disabled_sources():
+    dates = pd.date_range("2023-01-01", periods=3, freq="D")
+    data = [weather("a", dates, [0.0, 0.0, 0.0]), weather("b", dates, [3.0, 3.0, 3.0]),
+            weather("c", dates, [100.0, 100.0, 100.0])]
+    merged = TimeSeriesMerger.merge_series(data, weights={"a": 2.0, "b": 1.0, "c": 0})
+    np.testing.assert_allclose(merged["y"].to_numpy(), [1.0, 1.0, 1.0])
+    np.testing.assert_array_equal(merged["temperature_count"].to_numpy(), [2, 2, 2])
+
+
+def test_variables_aligned_to_temperature_days():
+    dates = pd.date_range("2023-01-01", periods=4, freq="D")
+    data = [weather("a", dates, [1.0, np.nan, 3.0, 4.0], humidity=[50.0, 60.0, np.nan, 80.0])]
+    merged = TimeSeriesMerger.merge_series(data)
+    assert merged["ds"].dt.day.tolist() == [1, 3, 4]
+    np.testing.assert_allclose(merged["humidity"].to_numpy(), [50.0, np.nan, 80.0])
+    assert merged[[v for v in MERGED_VARIABLES if v != "humidity"]].isna().all().all()
+
+
+def test_no_data_raises():
+    with pytest.raises(InsufficientDataError):
+        TimeSeriesMerger.merge_series([WeatherData("a", "Warsaw", datetime(2024, 1, 1))])
+
+
+def test_fill_gaps_interpolates_and_flags_days():
+    config = WeatherConfig()
+    config.QUALITY_FLATLINE_DAYS = 0
+    dates = pd.to_datetime(["2023-01-01", "2023-01-02", "2023-01-05", "2023-01-06"])
+    data = [weather("a", dates, [1.0, 2.0, 5.0, 6.0]), weather("b", dates, [1.0, 2.0, 5.0, 6.0])]
+
+    merged = TimeSeriesMerger.merge_series(data, quality=SourceQuality(config))
+
+    assert len(merged) == 6
+    np.testing.assert_allclose(merged["y"].to_numpy(), [1, 2, 3, 4, 5, 6])
+    assert merged["filled"].tolist() == [False, False, True, True, False, False]
+    assert merged["temperature_count"].tolist() == [2, 2, 0, 0, 2, 2]
+    assert merged["filled"].dtype == bool
+    assert set(merged.attrs["quality"]) == {"a", "b"}
+
+
+def test_fill_gaps_only_fills_days_without_sources():
+    config = WeatherConfig()
+    config.QUALITY_FLATLINE_DAYS = 0
+    dates = pd.to_datetime(["2023-01-01", "2023-01-02", "2023-01-04"])
+    data = [weather("a", dates, [1.0, 2.0, 4.0], humidity=[50.0, np.nan, 80.0], precipitation=[1.0, 2.0, 4.0])]
+
+    merged = TimeSeriesMerger.merge_series(data, quality=SourceQuality(config)).set_index("ds")
+
+    gap, observed = pd.Timestamp("2023-01-03"), pd.Timestamp("2023-01-02")
+    assert merged.loc[gap, "filled"] and not merged.loc[observed, "filled"]
+    assert merged.loc[gap, "humidity"] == pytest.approx(70.0)
+    # Brak w dniu z pomiarem nie jest uzupelniany - nie mialby znacznika filled
+    assert np.isnan(merged.loc[observed, "humidity"])
+    # Opadu nie interpolujemy
+    assert np.isnan(merged.loc[gap, "precipitation"])
+    assert merged.loc[observed, "precipitation"] == 2.0
+
+
+def test_fill_gaps_disabled_keeps_gaps():
+    config = WeatherConfig()
+    config.QUALITY_FILL_GAPS = False
+    dates = pd.to_datetime(["2023-01-01", "2023-01-03"])
+    merged = TimeSeriesMerger.merge_series([weather("a", dates, [1.0, 3.0])], quality=SourceQuality(config))
+    assert len(merged) == 2 and not merged["filled"].any()
@@ -0,0 +1,43 @@
+﻿import pickle
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from api_clients.base import SERIES_DTYPE, HourlySeries, WeatherData
+
+
+def weather(series=..., **kwargs):
+    if series is ...:
+        series = pd.DataFrame({"date": pd.date_range("2024-01-01", periods=5, freq="D"),
+                               "temperature": [1.0, np.nan, 3.0, 4.0, 5.0], "humidity": [80.0] * 5})
+    return WeatherData("OpenMeteo", "Krakow", datetime(2024, 1, 6, 12), avg_temp=3.25, series=series, **kwargs)
+
+
+def test_equality_compares_values_not_arrays():
+    assert weather() == weather()
+    assert weather() != weather(humidity=50.0)
+    assert weather() != weather(series=None)
+    assert weather() != "Krakow"
+
+
+@pytest.mark.parametrize("protocol", [2, pickle.HIGHEST_PROTOCOL])
+def test_pickle_round_trip(protocol):
+    data = weather(hourly=HourlySeries(np.arange(3, dtype=np.int64) * 3600, {"temperature": [1.0, 2.0, 3.0]}))
+    restored = pickle.loads(pickle.dumps(data, protocol=protocol))
+    assert restored == data
+    assert restored.series.dtype == SERIES_DTYPE
+    np.testing.assert_array_equal(restored.hourly.values["temperature"], [1.0, 2.0, 3.0])
+
+
+def test_missing_series_stays_none():
+    restored = pickle.loads(pickle.dumps(weather(series=None), protocol=pickle.HIGHEST_PROTOCOL))
+    assert restored.series is None
+    assert restored.series_frame() is None
+
+
+def test_empty_series_stays_empty():
+    empty = np.empty(0, dtype=SERIES_DTYPE)
+    restored = WeatherData.from_bytes(weather(series=empty).to_bytes())
+    assert restored.series is not None and len(restored.series) == 0
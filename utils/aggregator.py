@@ -1,6 +1,12 @@
-﻿from typing import List, Dict, Optional
-from api_clients.base import WeatherData
+﻿import heapq
+from collections import deque
+from typing import List, Dict, Iterable, Optional, Tuple
+from api_clients.base import SERIES_VARIABLES, WeatherData
+import math
 import statistics
+import threading
+
+import numpy as np
 
 
 class WeatherAggregator:
@@ -30,3 +36,528 @@ class WeatherAggregator:
                 result[f"{field}_count"] = 0
 
         return result
+
+
+def _rounded(value: Optional[float], digits: int = 2) -> Optional[float]:
+    return None if value is None or value != value else round(float(value), digits)
+
+
+class RunningStats:
+    """Momenty Welforda z min/max; laczenie dwoch podsumowan wzorem Chana"""
+    __slots__ = ("count", "mean", "m2", "min", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def push(self, value: float) -> None:
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def push_many(self, values: np.ndarray) -> None:
+        if len(values) == 0:
+            return
+        batch = RunningStats()
+        batch.count = len(values)
+        batch.mean = float(values.mean())
+        batch.m2 = float(((values - batch.mean) ** 2).sum())
+        batch.min, batch.max = float(values.min()), float(values.max())
+        self.merge(batch)
+
+    def remove(self, value: float) -> None:
+        """Odwrotnosc push (korekta wartosci); min/max zostaja - obejmuja wszystkie widziane wartosci"""
+        if self.count <= 1:
+            self.count, self.mean, self.m2 = 0, 0.0, 0.0
+            return
+        delta = value - self.mean
+        self.count -= 1
+        self.mean -= delta / self.count
+        self.m2 = max(0.0, self.m2 - delta * (value - self.mean))
+
+    def merge(self, other: "RunningStats") -> "RunningStats":
+        if other.count == 0:
+            return self
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.m2 += other.m2 + delta * delta * self.count * other.count / total
+        self.mean += delta * other.count / total
+        self.count = total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    @property
+    def std(self) -> Optional[float]:
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else None
+
+    def to_dict(self) -> Dict[str, Optional[float]]:
+        if self.count == 0:
+            return {"count": 0, "mean": None, "std": None, "min": None, "max": None}
+        return {"count": self.count, "mean": _rounded(self.mean), "std": _rounded(self.std),
+                "min": _rounded(self.min), "max": _rounded(self.max)}
+
+
+class TDigest:
+    """Scalajacy t-digest (funkcja skali k1) - przyblizone kwantyle w stalej pamieci, laczalny miedzy zrodlami"""
+    __slots__ = ("compression", "means", "weights", "_buffer", "count", "min", "max")
+
+    def __init__(self, compression: float = 100):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self._buffer: List[float] = []
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float) -> None:
+        self._buffer.append(value)
+        self.count += 1
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if len(self._buffer) >= 5 * self.compression:
+            self._compress()
+
+    def add_many(self, values: np.ndarray) -> None:
+        if len(values) == 0:
+            return
+        self._buffer.extend(values.tolist())
+        self.count += len(values)
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self._compress()
+
+    def merge(self, other: "TDigest") -> "TDigest":
+        other._compress()
+        if other.count == 0:
+            return self
+        self._compress()
+        self.means = np.concatenate([self.means, other.means])
+        self.weights = np.concatenate([self.weights, other.weights])
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress(force=True)
+        return self
+
+    def _scale(self, q: float) -> float:
+        return self.compression / (2 * math.pi) * math.asin(2 * q - 1)
+
+    def _scale_inverse(self, k: float) -> float:
+        return (math.sin(min(k * 2 * math.pi / self.compression, math.pi / 2)) + 1) / 2
+
+    def _compress(self, force: bool = False) -> None:
+        if not self._buffer and not force:
+            return
+        means = np.concatenate([self.means, np.asarray(self._buffer, dtype=np.float64)])
+        weights = np.concatenate([self.weights, np.ones(len(self._buffer))])
+        self._buffer = []
+        if len(means) == 0:
+            return
+
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order].tolist(), weights[order].tolist()
+        total = sum(weights)
+
+        merged_means, merged_weights = [means[0]], [weights[0]]
+        cumulative = 0.0
+        limit = total * self._scale_inverse(self._scale(0.0) + 1)
+        for mean, weight in zip(means[1:], weights[1:]):
+            if cumulative + merged_weights[-1] + weight <= limit:
+                merged_weights[-1] += weight
+                merged_means[-1] += (mean - merged_means[-1]) * weight / merged_weights[-1]
+            else:
+                cumulative += merged_weights[-1]
+                limit = total * self._scale_inverse(self._scale(cumulative / total) + 1)
+                merged_means.append(mean)
+                merged_weights.append(weight)
+
+        self.means = np.array(merged_means)
+        self.weights = np.array(merged_weights)
+
+    def quantile(self, q: float) -> Optional[float]:
+        self._compress()
+        if self.count == 0:
+            return None
+        if len(self.means) == 1:
+            return float(self.means[0])
+        # Interpolacja miedzy srodkami centroidow, skrajne odcinki do min/max
+        centers = np.cumsum(self.weights) - self.weights / 2
+        return float(np.interp(q * self.count, np.r_[0.0, centers, self.count],
+                               np.r_[self.min, self.means, self.max]))
+
+
+class RollingWindow:
+    """Ostatnie `days` dni kalendarzowych: sumy i min/max aktualizowane w O(1) (zamortyzowane) na dzien,
+    mediana w O(log okno) - dwa kopce z leniwym usuwaniem"""
+    __slots__ = ("days", "_entries", "_shift", "_sum", "_sum_sq", "_min", "_max",
+                 "_low", "_high", "_low_size", "_high_size", "_delayed")
+
+    def __init__(self, days: int):
+        self.days = days
+        self._entries: deque = deque()
+        # Sumy liczone wzgledem przesuniecia - bez utraty precyzji dla cisnienia ~1000 hPa
+        self._shift: Optional[float] = None
+        self._sum = 0.0
+        self._sum_sq = 0.0
+        # Monotoniczne kolejki (dzien, wartosc) dla min i max
+        self._min: deque = deque()
+        self._max: deque = deque()
+        # Mediana: dolna polowa okna w kopcu max (wartosci zanegowane), gorna w kopcu min. Wartosci usuniete
+        # z okna zostaja w kopcach do chwili, gdy trafia na wierzch (_delayed: wartosc -> liczba do usuniecia)
+        self._low: List[float] = []
+        self._high: List[float] = []
+        self._low_size = 0
+        self._high_size = 0
+        self._delayed: Dict[float, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def last_day(self) -> Optional[int]:
+        return self._entries[-1][0] if self._entries else None
+
+    def push(self, day: int, value: float) -> None:
+        """Nowy dzien (pozniejszy niz dotychczasowe) i usuniecie dni spoza okna"""
+        if self._shift is None:
+            self._shift = value
+        self._entries.append((day, value))
+        self._add(value)
+        while self._min and self._min[-1][1] >= value:
+            self._min.pop()
+        self._min.append((day, value))
+        while self._max and self._max[-1][1] <= value:
+            self._max.pop()
+        self._max.append((day, value))
+        self.advance(day)
+
+    def advance(self, day: int) -> None:
+        """Przesuwa koniec okna na `day` - takze gdy zmienna nie ma wartosci w najnowszych dniach"""
+        while self._entries and self._entries[0][0] <= day - self.days:
+            old_day, old_value = self._entries.popleft()
+            self._discard(old_value)
+            if self._min[0][0] == old_day:
+                self._min.popleft()
+            if self._max[0][0] == old_day:
+                self._max.popleft()
+        self._compact_if_stale()
+
+    def replace(self, day: int, value: float) -> bool:
+        """Korekta wartosci dnia juz obecnego w oknie (ponowne pobranie ostatnich dni)"""
+        for i in range(len(self._entries) - 1, -1, -1):
+            entry_day, old_value = self._entries[i]
+            if entry_day == day:
+                break
+            if entry_day < day:
+                return False
+        else:
+            return False
+
+        self._entries[i] = (day, value)
+        self._discard(old_value)
+        self._add(value)
+        # Rzadka sciezka - odbudowa kolejek min/max w O(okno)
+        self._min.clear()
+        self._max.clear()
+        for entry_day, entry_value in self._entries:
+            while self._min and self._min[-1][1] >= entry_value:
+                self._min.pop()
+            self._min.append((entry_day, entry_value))
+            while self._max and self._max[-1][1] <= entry_value:
+                self._max.pop()
+            self._max.append((entry_day, entry_value))
+        self._compact_if_stale()
+        return True
+
+    def _add(self, value: float) -> None:
+        shifted = value - self._shift
+        self._sum += shifted
+        self._sum_sq += shifted * shifted
+        if not self._low_size or value <= -self._low[0]:
+            heapq.heappush(self._low, -value)
+            self._low_size += 1
+        else:
+            heapq.heappush(self._high, value)
+            self._high_size += 1
+        self._rebalance()
+
+    def _discard(self, value: float) -> None:
+        shifted = value - self._shift
+        self._sum -= shifted
+        self._sum_sq -= shifted * shifted
+        self._delayed[value] = self._delayed.get(value, 0) + 1
+        if value <= -self._low[0]:
+            self._low_size -= 1
+            if value == -self._low[0]:
+                self._prune(self._low, -1)
+        else:
+            self._high_size -= 1
+            if value == self._high[0]:
+                self._prune(self._high, 1)
+        self._rebalance()
+
+    def _prune(self, heap: List[float], sign: int) -> None:
+        """Zdejmuje z wierzchu kopca wartosci juz usuniete z okna"""
+        while heap:
+            value = sign * heap[0]
+            pending = self._delayed.get(value)
+            if not pending:
+                return
+            if pending == 1:
+                del self._delayed[value]
+            else:
+                self._delayed[value] = pending - 1
+            heapq.heappop(heap)
+
+    def _rebalance(self) -> None:
+        # Dolna polowa ma tyle samo wartosci co gorna albo jedna wiecej
+        if self._low_size > self._high_size + 1:
+            heapq.heappush(self._high, -heapq.heappop(self._low))
+            self._low_size -= 1
+            self._high_size += 1
+            self._prune(self._low, -1)
+        elif self._low_size < self._high_size:
+            heapq.heappush(self._low, -heapq.heappop(self._high))
+            self._low_size += 1
+            self._high_size -= 1
+            self._prune(self._high, 1)
+
+    def _compact_if_stale(self) -> None:
+        """Odbudowa kopcow z wartosci okna, gdy usuniete wartosci zalegaja gleboko w kopcach - pamiec
+        pozostaje O(okno), koszt rozkladany na usuniecia"""
+        if len(self._low) + len(self._high) <= 2 * len(self._entries) + 32:
+            return
+        values = sorted(value for _, value in self._entries)
+        half = (len(values) + 1) // 2
+        self._low = [-value for value in reversed(values[:half])]
+        self._high = values[half:]
+        self._low_size, self._high_size = half, len(values) - half
+        self._delayed.clear()
+
+    def _median(self) -> float:
+        if self._low_size > self._high_size:
+            return -self._low[0]
+        return (-self._low[0] + self._high[0]) / 2
+
+    def to_dict(self) -> Dict[str, Optional[float]]:
+        count = len(self._entries)
+        if count == 0:
+            return {"count": 0, "mean": None, "std": None, "min": None, "max": None, "sum": None, "median": None}
+        mean_shifted = self._sum / count
+        variance = max(0.0, (self._sum_sq - count * mean_shifted ** 2) / (count - 1)) if count > 1 else None
+        return {
+            "count": count,
+            "mean": _rounded(mean_shifted + self._shift),
+            "std": _rounded(math.sqrt(variance)) if variance is not None else None,
+            "min": _rounded(self._min[0][1]),
+            "max": _rounded(self._max[0][1]),
+            "sum": _rounded(self._sum + count * self._shift),
+            "median": _rounded(self._median()),
+        }
+
+    @staticmethod
+    def merged(windows: Iterable["RollingWindow"]) -> Dict[str, Optional[float]]:
+        """Podsumowanie kilku okien (np. zrodel jednej lokalizacji) bez ich modyfikacji"""
+        values = [value for window in windows for _, value in window._entries]
+        if not values:
+            return RollingWindow(0).to_dict()
+        array = np.asarray(values)
+        return {
+            "count": len(values),
+            "mean": _rounded(array.mean()),
+            "std": _rounded(array.std(ddof=1)) if len(values) > 1 else None,
+            "min": _rounded(array.min()),
+            "max": _rounded(array.max()),
+            "sum": _rounded(array.sum()),
+            "median": _rounded(np.median(array)),
+        }
+
+
+class FieldSummary:
+    """Biezace podsumowanie jednej zmiennej jednego zrodla: calej historii i okien kroczacych"""
+    __slots__ = ("stats", "digest", "windows")
+
+    def __init__(self, windows: Tuple[int, ...], compression: float):
+        self.stats = RunningStats()
+        self.digest = TDigest(compression)
+        self.windows = {days: RollingWindow(days) for days in windows}
+
+    def push(self, day: int, value: float) -> None:
+        self.stats.push(value)
+        self.digest.add(value)
+        for window in self.windows.values():
+            window.push(day, value)
+
+    def revise(self, day: int, old_value: float, value: float) -> None:
+        # t-digest nie obsluguje usuwania - korekta trafia do momentow i okien, kwantyle historii sa przyblizone
+        self.stats.remove(old_value)
+        self.stats.push(value)
+        for window in self.windows.values():
+            window.replace(day, value)
+
+
+class AggregationEngine:
+    """Laczalne podsumowania (lokalizacja, zrodlo, zmienna); kazde odswiezenie przetwarza tylko nowe dni"""
+
+    def __init__(self, windows: Tuple[int, ...] = (7, 30, 365), compression: float = 100):
+        self.windows = tuple(sorted(windows))
+        self.compression = compression
+        self._summaries: Dict[Tuple[str, str, str], FieldSummary] = {}
+        # Ostatnie wartosci dni z zakresu najdluzszego okna - do wykrywania korekt
+        self._recent: Dict[Tuple[str, str], Dict[int, np.ndarray]] = {}
+        self._last_day: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+        self.stats = {"days_ingested": 0, "days_revised": 0}
+
+    @staticmethod
+    def location_key(location: str) -> str:
+        return location.strip().lower()
+
+    def _summary(self, location: str, source: str, field: str) -> FieldSummary:
+        key = (location, source, field)
+        if key not in self._summaries:
+            self._summaries[key] = FieldSummary(self.windows, self.compression)
+        return self._summaries[key]
+
+    def ingest(self, data: WeatherData) -> int:
+        """Dolacza dni pozniejsze niz dotychczas widziane i korekty dni z okna; zwraca liczbe nowych dni"""
+        if data.series is None or len(data.series) == 0:
+            return 0
+
+        location = self.location_key(data.location)
+        key = (location, data.source)
+        series = data.series
+        days = series["day"].astype(np.int64)
+        fields = list(SERIES_VARIABLES)
+
+        with self._lock:
+            last_day = self._last_day.get(key)
+            recent = self._recent.setdefault(key, {})
+            horizon = int(days.max()) - self.windows[-1]
+
+            if last_day is None:
+                fresh = np.ones(len(days), dtype=bool)
+            else:
+                fresh = days > last_day
+                self._revise(location, data.source, recent, days[~fresh], series[~fresh], fields)
+
+            new_days, new_rows = days[fresh], series[fresh]
+            if len(new_days):
+                order = np.argsort(new_days, kind="stable")
+                new_days, new_rows = new_days[order], new_rows[order]
+                bulk = last_day is None
+
+                for field in fields:
+                    values = new_rows[field].astype(np.float64)
+                    valid = ~np.isnan(values)
+                    summary = self._summary(location, data.source, field)
+                    if bulk:
+                        # Pierwsze zaladowanie: momenty i digest wektorowo, do okien tylko ich zakres
+                        summary.stats.push_many(values[valid])
+                        summary.digest.add_many(values[valid])
+                        tail = valid & (new_days > horizon)
+                        for day, value in zip(new_days[tail].tolist(), values[tail].tolist()):
+                            for window in summary.windows.values():
+                                window.push(day, value)
+                    else:
+                        for day, value in zip(new_days[valid].tolist(), values[valid].tolist()):
+                            summary.push(day, value)
+
+                for day, row in zip(new_days.tolist(), new_rows):
+                    if day > horizon:
+                        recent[day] = np.array([row[field] for field in fields])
+                self._last_day[key] = int(new_days[-1])
+                self.stats["days_ingested"] += len(new_days)
+
+                # Okna wszystkich zmiennych zrodla koncza sie na jego najnowszym dniu
+                for field in fields:
+                    for window in self._summary(location, data.source, field).windows.values():
+                        window.advance(self._last_day[key])
+
+            for day in [day for day in recent if day <= horizon]:
+                del recent[day]
+
+        return len(new_days)
+
+    def _revise(self, location: str, source: str, recent: Dict[int, np.ndarray], days: np.ndarray,
+                rows: np.ndarray, fields: List[str]) -> None:
+        for day, row in zip(days.tolist(), rows):
+            previous = recent.get(day)
+            if previous is None:
+                continue
+            current = np.array([row[field] for field in fields])
+            changed = ~((previous == current) | (np.isnan(previous) & np.isnan(current)))
+            if not changed.any():
+                continue
+            for i in np.flatnonzero(changed):
+                old_value, value = float(previous[i]), float(current[i])
+                # Pojawienie sie lub znikniecie wartosci to rzadki przypadek - pomijamy go w podsumowaniach
+                if old_value == old_value and value == value:
+                    self._summary(location, source, fields[i]).revise(day, old_value, value)
+            recent[day] = current
+            self.stats["days_revised"] += 1
+
+    def ingest_many(self, weather_data_list: Iterable[WeatherData]) -> int:
+        return sum(self.ingest(data) for data in weather_data_list)
+
+    def summary(self, location: str, field: str, source: str = None) -> Dict:
+        """Podsumowanie zmiennej dla zrodla albo polaczone ze wszystkich zrodel lokalizacji"""
+        location = self.location_key(location)
+        with self._lock:
+            summaries = [summary for (loc, src, name), summary in self._summaries.items()
+                         if loc == location and name == field and (source is None or src == source)]
+            if not summaries:
+                return {}
+
+            stats, digest = RunningStats(), TDigest(self.compression)
+            for summary in summaries:
+                stats.merge(summary.stats)
+                digest.merge(summary.digest)
+
+            result = stats.to_dict()
+            result.update({
+                "median": _rounded(digest.quantile(0.5)),
+                "p10": _rounded(digest.quantile(0.1)),
+                "p90": _rounded(digest.quantile(0.9)),
+                "windows": {
+                    f"{days}d": (summaries[0].windows[days].to_dict() if len(summaries) == 1 else
+                                 RollingWindow.merged(summary.windows[days] for summary in summaries))
+                    for days in self.windows
+                },
+            })
+            return result
+
+    def location_summary(self, location: str) -> Dict[str, Dict]:
+        return {field: self.summary(location, field) for field in SERIES_VARIABLES}
+
+    def clear(self, location: str = None) -> None:
+        with self._lock:
+            if location is None:
+                self._summaries.clear()
+                self._recent.clear()
+                self._last_day.clear()
+                return
+            location = self.location_key(location)
+            for store in (self._summaries, self._recent, self._last_day):
+                for key in [key for key in store if key[0] == location]:
+                    del store[key]
+
+
+_shared_engine: Optional[AggregationEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_aggregation_engine(config) -> AggregationEngine:
+    global _shared_engine
+    with _engine_lock:
+        if _shared_engine is None:
+            _shared_engine = AggregationEngine(tuple(config.AGGREGATION_WINDOWS), config.AGGREGATION_COMPRESSION)
+        return _shared_engine
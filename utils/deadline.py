@@ -0,0 +1,24 @@
+﻿import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+# Termin (time.monotonic) biezacego pobrania ustawiany przez ConcurrentFetchEngine - watku puli nie da sie
+# przerwac z zewnatrz, wiec to transport skraca timeouty i przestaje ponawiac po jego uplywie.
+# Osobny, lekki modul: parallel_processor jest importowany przy starcie i nie moze ciagnac api_clients.base
+_fetch_deadline: ContextVar[Optional[float]] = ContextVar("fetch_deadline", default=None)
+
+
+@contextmanager
+def fetch_deadline(deadline_at: Optional[float]):
+    """Zapytania HTTP w bloku koncza sie najpozniej o deadline_at (None = bez terminu)"""
+    token = _fetch_deadline.set(deadline_at)
+    try:
+        yield
+    finally:
+        _fetch_deadline.reset(token)
+
+
+def fetch_time_left() -> Optional[float]:
+    deadline_at = _fetch_deadline.get()
+    return None if deadline_at is None else deadline_at - time.monotonic()
@@ -0,0 +1,275 @@
+﻿import csv
+import logging
+import math
+import re
+import threading
+import unicodedata
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+# Litery, ktorych NFKD nie rozklada na litere bazowa i znak diakrytyczny
+_TRANSLITERATION = str.maketrans({"ł": "l", "Ł": "L", "ø": "o", "Ø": "O", "đ": "d", "Đ": "D", "ß": "ss"})
+_SEPARATORS = re.compile(r"[\s\-_'.]+")
+_COORDINATES = re.compile(r"^\s*(-?\d+(?:\.\d+)?)\s*[,;]\s*(-?\d+(?:\.\d+)?)\s*$")
+
+# Kolumny zrzutu GeoNames (allCountries.txt, PL.txt, cities500.txt ...)
+_GEONAMES_COLUMNS = 19
+_GEONAMES_NAME, _GEONAMES_ASCII, _GEONAMES_ALTERNATE = 1, 2, 3
+_GEONAMES_LAT, _GEONAMES_LON, _GEONAMES_CLASS, _GEONAMES_COUNTRY, _GEONAMES_POPULATION = 4, 5, 6, 8, 14
+
+
+def normalize_name(name: str) -> str:
+    """'Kraków' -> 'krakow', 'Bielsko-Biała' -> 'bielsko biala'"""
+    name = unicodedata.normalize("NFKD", name.translate(_TRANSLITERATION))
+    name = "".join(char for char in name if not unicodedata.combining(char))
+    return _SEPARATORS.sub(" ", name.casefold()).strip()
+
+
+def parse_coordinates(text: str) -> Optional[Tuple[float, float]]:
+    """'50.06,19.94' albo '50.06; 19.94' -> (lat, lon); None dla nazw i wspolrzednych spoza zakresu"""
+    match = _COORDINATES.match(text)
+    if not match:
+        return None
+    lat, lon = float(match.group(1)), float(match.group(2))
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
+
+
+def haversine_km(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    lat1, lon1 = math.radians(lat), math.radians(lon)
+    lat2, lon2 = np.radians(lats), np.radians(lons)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+@dataclass(frozen=True)
+class Place:
+    name: str
+    lat: float
+    lon: float
+    country: str = ""
+    population: int = 0
+
+
+@dataclass(frozen=True)
+class ResolvedLocation:
+    # key wspolny dla punktow z tej samej komorki siatki - po nim deduplikuje cache i pobieranie wsadowe
+    key: str
+    name: str
+    lat: float
+    lon: float
+
+
+class GridIndex:
+    """Siatka komorek cell_deg x cell_deg do wyszukiwania najblizszych punktow"""
+
+    def __init__(self, lats: np.ndarray, lons: np.ndarray, cell_deg: float = 0.5):
+        self.cell_deg = cell_deg
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self._cells: Dict[Tuple[int, int], np.ndarray] = {}
+        # Kolumny zawijaja sie na antypoludniku (-180 == 180)
+        self._columns = int(round(360 / cell_deg))
+
+        rows = np.floor(self.lats / cell_deg).astype(np.int64)
+        cols = np.floor(self.lons / cell_deg).astype(np.int64) % self._columns
+        order = np.lexsort((cols, rows))
+        keys = np.stack([rows[order], cols[order]], axis=1)
+        if len(keys):
+            starts = np.flatnonzero(np.r_[True, np.any(keys[1:] != keys[:-1], axis=1)])
+            for start, end in zip(starts, np.r_[starts[1:], len(order)]):
+                self._cells[(int(keys[start, 0]), int(keys[start, 1]))] = order[start:end]
+        self._max_ring = int(math.ceil(360 / cell_deg))
+
+    def _ring(self, row: int, col: int, ring: int) -> List[np.ndarray]:
+        if ring == 0:
+            cell = self._cells.get((row, col))
+            return [] if cell is None else [cell]
+
+        found = []
+        for r in range(row - ring, row + ring + 1):
+            step = 1 if r in (row - ring, row + ring) else 2 * ring
+            for c in range(col - ring, col + ring + 1, step):
+                cell = self._cells.get((r, c % self._columns))
+                if cell is not None:
+                    found.append(cell)
+        return found
+
+    def nearest(self, lat: float, lon: float, k: int = 1,
+                max_km: Optional[float] = None) -> List[Tuple[int, float]]:
+        """Indeksy i odleglosci (km) k najblizszych punktow, rosnaco"""
+        if not self._cells:
+            return []
+
+        row, col = int(math.floor(lat / self.cell_deg)), int(math.floor(lon / self.cell_deg)) % self._columns
+        candidates = []
+        best: Optional[np.ndarray] = None
+
+        for ring in range(self._max_ring + 1):
+            # Najblizszy punkt pierscienia jest co najmniej (ring - 1) komorek dalej; dlugosc skraca sie z cos(lat)
+            ring_km = max(0, ring - 1) * self.cell_deg * KM_PER_DEGREE * \
+                math.cos(math.radians(min(89.0, abs(lat) + ring * self.cell_deg)))
+            if best is not None and len(best) >= k and ring_km > best[-1]:
+                break
+            if max_km is not None and ring_km > max_km:
+                break
+
+            cells = self._ring(row, col, ring)
+            if not cells:
+                continue
+            candidates.extend(cells)
+            # Szerokie pierscienie moga po zawinieciu odwiedzic te same komorki
+            indices = np.unique(np.concatenate(candidates))
+            distances = haversine_km(lat, lon, self.lats[indices], self.lons[indices])
+            order = np.argsort(distances, kind="stable")[:k]
+            candidates = [indices[order]]
+            best = distances[order]
+
+        if best is None:
+            return []
+        result = [(int(index), float(distance)) for index, distance in zip(candidates[0], best)]
+        if max_km is not None:
+            result = [(index, distance) for index, distance in result if distance <= max_km]
+        return result
+
+
+class Gazetteer:
+    """Miejscowosci z pliku (GeoNames albo TSV z naglowkiem) z indeksem nazw i indeksem przestrzennym"""
+
+    def __init__(self, places: List[Place], snap_deg: float = 0.1, name_max_km: float = 25.0):
+        self.places = places
+        self.snap_deg = snap_deg
+        self.name_max_km = name_max_km
+        self._by_name: Dict[str, int] = {}
+
+        # Nazwy glowne maja pierwszenstwo przed alternatywnymi; przy konflikcie wygrywa wieksza populacja
+        ranked = sorted(range(len(places)), key=lambda i: -places[i].population)
+        for index in ranked:
+            self._by_name.setdefault(normalize_name(places[index].name), index)
+
+        self.index = GridIndex(np.array([place.lat for place in places]), np.array([place.lon for place in places]))
+
+    @classmethod
+    def load(cls, path: str, snap_deg: float = 0.1, name_max_km: float = 25.0) -> "Gazetteer":
+        places, alternates = cls._read(cls._resolve_path(path))
+        gazetteer = cls(places, snap_deg, name_max_km)
+        for index in sorted(alternates, key=lambda i: -places[i].population):
+            for name in alternates[index]:
+                gazetteer._by_name.setdefault(normalize_name(name), index)
+        logger.info(f"Zaladowano {len(places)} miejscowosci z {path}")
+        return gazetteer
+
+    @staticmethod
+    def _resolve_path(path: str) -> Path:
+        candidate = Path(path)
+        if not candidate.is_absolute() and not candidate.exists():
+            candidate = PROJECT_ROOT / candidate
+        return candidate
+
+    @staticmethod
+    def _read(path: Path) -> Tuple[List[Place], Dict[int, List[str]]]:
+        places: List[Place] = []
+        alternates: Dict[int, List[str]] = {}
+
+        with open(path, encoding="utf-8", newline="") as handle:
+            reader = csv.reader(handle, delimiter="\t", quoting=csv.QUOTE_NONE)
+            header = None
+            for row in reader:
+                if not row:
+                    continue
+                if header is None and row[0] == "name":
+                    header = {column: i for i, column in enumerate(row)}
+                    continue
+
+                try:
+                    if header is not None:
+                        name, ascii_name = row[header["name"]], row[header.get("asciiname", header["name"])]
+                        alternate = row[header["alternatenames"]] if "alternatenames" in header else ""
+                        lat, lon = float(row[header["latitude"]]), float(row[header["longitude"]])
+                        country = row[header["country_code"]] if "country_code" in header else ""
+                        population = int(row[header["population"]] or 0) if "population" in header else 0
+                    elif len(row) >= _GEONAMES_COLUMNS:
+                        # Ze zrzutow GeoNames bierzemy tylko miejscowosci (klasa P)
+                        if row[_GEONAMES_CLASS] != "P":
+                            continue
+                        name, ascii_name = row[_GEONAMES_NAME], row[_GEONAMES_ASCII]
+                        alternate = row[_GEONAMES_ALTERNATE]
+                        lat, lon = float(row[_GEONAMES_LAT]), float(row[_GEONAMES_LON])
+                        country = row[_GEONAMES_COUNTRY]
+                        population = int(row[_GEONAMES_POPULATION] or 0)
+                    else:
+                        continue
+                except (ValueError, IndexError, KeyError):
+                    continue
+
+                alternates[len(places)] = [ascii_name] + [item for item in alternate.split(",") if item]
+                places.append(Place(name, lat, lon, country, population))
+
+        return places, alternates
+
+    def __len__(self) -> int:
+        return len(self.places)
+
+    def lookup(self, name: str) -> Optional[Place]:
+        index = self._by_name.get(normalize_name(name))
+        return None if index is None else self.places[index]
+
+    def nearest(self, lat: float, lon: float, k: int = 1, max_km: Optional[float] = None) -> List[Tuple[Place, float]]:
+        return [(self.places[index], distance) for index, distance in self.index.nearest(lat, lon, k, max_km)]
+
+    def snap(self, lat: float, lon: float) -> Tuple[str, float, float]:
+        """Srodek komorki siatki snap_deg zawierajacej punkt oraz jej klucz"""
+        if self.snap_deg <= 0:
+            return f"{lat:.4f}_{lon:.4f}", lat, lon
+        row, col = math.floor(lat / self.snap_deg), math.floor(lon / self.snap_deg)
+        digits = max(0, -math.floor(math.log10(self.snap_deg))) + 1
+        snapped_lat = round((row + 0.5) * self.snap_deg, digits)
+        snapped_lon = round((col + 0.5) * self.snap_deg, digits)
+        return f"{snapped_lat:.{digits}f}_{snapped_lon:.{digits}f}", snapped_lat, snapped_lon
+
+    def resolve(self, location: str) -> Optional[ResolvedLocation]:
+        """Nazwa miejscowosci albo dowolne wspolrzedne 'lat,lon' -> punkt przyciagniety do komorki siatki;
+        gazeter nadaje wspolrzednym tylko nazwe najblizszej miejscowosci (do name_max_km)"""
+        if _COORDINATES.match(location):
+            coordinates = parse_coordinates(location)
+            if coordinates is None:
+                return None
+            lat, lon = coordinates
+            nearest = self.nearest(lat, lon, max_km=self.name_max_km)
+            name = nearest[0][0].name if nearest else location.strip()
+        else:
+            place = self.lookup(location)
+            if place is None:
+                return None
+            lat, lon, name = place.lat, place.lon, place.name
+
+        key, snapped_lat, snapped_lon = self.snap(lat, lon)
+        return ResolvedLocation(key, name, snapped_lat, snapped_lon)
+
+
+_shared_gazetteers: Dict[str, Gazetteer] = {}
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer(config) -> Optional[Gazetteer]:
+    """Jedna instancja na plik; None gdy plik nie istnieje"""
+    path = config.GAZETTEER_PATH
+    with _gazetteer_lock:
+        if path not in _shared_gazetteers:
+            try:
+                _shared_gazetteers[path] = Gazetteer.load(path, config.LOCATION_SNAP_DEG,
+                                                          config.LOCATION_NAME_MAX_KM)
+            except OSError as e:
+                logger.error(f"Nie udalo sie wczytac gazetera {path}: {e}")
+                return None
+        return _shared_gazetteers[path]
@@ -0,0 +1,159 @@
+﻿import sqlite3
+import threading
+import time
+import logging
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from api_clients.base import DAILY_FIELDS
+
+logger = logging.getLogger(__name__)
+
+# Brakujace zakresy rozdzielone krotsza seria dni z cache pobieramy jednym zapytaniem
+MISSING_MERGE_DAYS = 7
+
+
+class HistoryCache:
+    """Lokalny magazyn dziennych obserwacji kluczowany (zrodlo, lokalizacja, data)"""
+
+    def __init__(self, path: str, recent_days: int = 3, recent_ttl_hours: float = 6):
+        self.path = Path(path)
+        self.recent_days = recent_days
+        self.recent_ttl = recent_ttl_hours * 3600
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stale": 0, "lookups": 0, "fetches": 0}
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            columns = ", ".join(f"{field} REAL" for field in DAILY_FIELDS)
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS observations ("
+                f"source TEXT NOT NULL, location TEXT NOT NULL, date TEXT NOT NULL, "
+                f"{columns}, fetched_at REAL NOT NULL, "
+                f"PRIMARY KEY (source, location, date))"
+            )
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(str(self.path), timeout=30)
+
+    @staticmethod
+    def missing_ranges(expected: np.ndarray, present: np.ndarray) -> List[Tuple[date, date]]:
+        """Ciagle zakresy dni bez danych; luki dzielone mniej niz MISSING_MERGE_DAYS dniami z cache sa laczone"""
+        positions = np.flatnonzero(~present)
+        if len(positions) == 0:
+            return []
+        breaks = np.flatnonzero(np.diff(positions) > MISSING_MERGE_DAYS) + 1
+        starts = positions[np.r_[0, breaks]]
+        ends = positions[np.r_[breaks - 1, len(positions) - 1]]
+        return [(expected[first], expected[last]) for first, last in zip(starts.tolist(), ends.tolist())]
+
+    def lookup(self, source: str, location: str, start: date,
+               end: date) -> Tuple[pd.DataFrame, List[Tuple[date, date]]]:
+        """Zwraca (dane z cache, brakujace zakresy dat) - lista jest pusta gdy cache pokrywa calosc"""
+        with self._connect() as conn:
+            cached = pd.read_sql_query(
+                f"SELECT date, {', '.join(DAILY_FIELDS)}, fetched_at FROM observations "
+                f"WHERE source = ? AND location = ? AND date BETWEEN ? AND ? ORDER BY date",
+                conn,
+                params=(source, location, start.isoformat(), end.isoformat())
+            )
+
+        cached["date"] = pd.to_datetime(cached["date"])
+
+        # Ostatnie dni sa poprawiane przez dostawcow, wiec traktujemy je jako przeterminowane po TTL
+        now = time.time()
+        recent_from = pd.Timestamp(datetime.now().date() - timedelta(days=self.recent_days))
+        expired = (cached["date"] >= recent_from) & (now - cached["fetched_at"] > self.recent_ttl)
+        valid_days = set(cached.loc[~expired, "date"].dt.date)
+
+        expected = pd.date_range(start, end, freq="D").date
+        present = np.fromiter((day in valid_days for day in expected), dtype=bool, count=len(expected))
+        missing = self.missing_ranges(expected, present)
+        # Dni z cache wewnatrz pobieranych zakresow i tak przyjda z API
+        served = present.copy()
+        for first, last in missing:
+            served[(expected >= first) & (expected <= last)] = False
+        served = int(served.sum())
+
+        with self._lock:
+            self._stats["lookups"] += 1
+            self._stats["hits"] += served
+            self._stats["misses"] += len(expected) - served
+            self._stats["stale"] += int(expired.sum())
+            self._stats["fetches"] += len(missing)
+
+        return cached.drop(columns=["fetched_at"]), missing
+
+    def store(self, source: str, location: str, df: pd.DataFrame) -> None:
+        if df.empty:
+            return
+
+        fetched_at = time.time()
+        rows = [
+            (source, location, day.strftime("%Y-%m-%d"),
+             *[None if pd.isna(value) else float(value) for value in values],
+             fetched_at)
+            for day, *values in df[["date"] + DAILY_FIELDS].itertuples(index=False)
+        ]
+
+        placeholders = ", ".join("?" * (len(DAILY_FIELDS) + 4))
+        with self._connect() as conn:
+            conn.executemany(
+                f"INSERT OR REPLACE INTO observations "
+                f"(source, location, date, {', '.join(DAILY_FIELDS)}, fetched_at) VALUES ({placeholders})",
+                rows
+            )
+        logger.debug(f"Zapisano {len(rows)} dni dla {source}/{location} w cache")
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self._stats)
+        requested = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = round(stats["hits"] / requested, 4) if requested else 0.0
+        return stats
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            for key in self._stats:
+                self._stats[key] = 0
+
+    def clear(self, source: str = None, location: str = None) -> None:
+        query = "DELETE FROM observations WHERE 1 = 1"
+        params = []
+        if source is not None:
+            query += " AND source = ?"
+            params.append(source)
+        if location is not None:
+            query += " AND location = ?"
+            params.append(location)
+        with self._connect() as conn:
+            conn.execute(query, params)
+
+
+_shared_caches: Dict[str, HistoryCache] = {}
+
+
+def get_history_cache(config) -> Optional[HistoryCache]:
+    """Jedna instancja cache na sciezke, wspoldzielona przez wszystkich klientow"""
+    if not config.CACHE_ENABLED:
+        return None
+    if config.CACHE_PATH not in _shared_caches:
+        _shared_caches[config.CACHE_PATH] = HistoryCache(
+            config.CACHE_PATH,
+            recent_days=config.CACHE_RECENT_DAYS,
+            recent_ttl_hours=config.CACHE_RECENT_TTL_HOURS
+        )
+    return _shared_caches[config.CACHE_PATH]
@@ -0,0 +1,112 @@
+﻿import importlib.util
+import logging
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from api_clients.base import HOURLY_FIELDS, HourlySeries
+
+logger = logging.getLogger(__name__)
+
+
+class HourlyStore:
+    """Godzinowe serie na dysku jako pliki Arrow IPC, czytane przez mapowanie pamieci"""
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(source: str, location: str) -> str:
+        return re.sub(r"[^a-z0-9_-]+", "-", f"{source}_{location}".lower())
+
+    def _generations(self, source: str, location: str) -> List[Path]:
+        # Kazdy zapis tworzy nowy plik z numerem generacji - zmapowanego pliku nie da sie podmienic w Windows
+        return sorted(self.directory.glob(f"{self._key(source, location)}.*.arrow"),
+                      key=lambda path: int(path.suffixes[-2][1:]))
+
+    def read(self, source: str, location: str) -> HourlySeries:
+        generations = self._generations(source, location)
+        if not generations:
+            return HourlySeries.empty()
+
+        import pyarrow as pa
+
+        table = pa.ipc.open_file(pa.memory_map(str(generations[-1]), "r")).read_all()
+        # Kolumny bez wartosci null w jednym fragmencie - to_numpy zwraca widok na zmapowany plik
+        return HourlySeries(
+            table.column("time").to_numpy(),
+            {field: table.column(field).to_numpy() for field in HOURLY_FIELDS if field in table.column_names}
+        )
+
+    def write(self, source: str, location: str, series: HourlySeries) -> None:
+        import pyarrow as pa
+
+        table = pa.table({"time": pa.array(series.timestamps, type=pa.int64()),
+                          **{field: pa.array(series.values[field], type=pa.float32()) for field in HOURLY_FIELDS}})
+
+        with self._lock:
+            generation = time.time_ns()
+            path = self.directory / f"{self._key(source, location)}.{generation}.arrow"
+            tmp_path = path.with_suffix(".tmp")
+            with pa.OSFile(str(tmp_path), "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            os.replace(tmp_path, path)
+
+            for old in self._generations(source, location)[:-1]:
+                try:
+                    old.unlink()
+                except OSError:
+                    # Plik wciaz zmapowany przez inny odczyt - zostanie usuniety przy kolejnym zapisie
+                    pass
+
+        logger.debug(f"Zapisano {len(series)} godzin dla {source}/{location} ({series.nbytes / 1024:.0f} KiB)")
+
+    def is_fresh(self, source: str, location: str, ttl_hours: float) -> bool:
+        generations = self._generations(source, location)
+        if not generations:
+            return False
+        written_at = int(generations[-1].suffixes[-2][1:]) / 1e9
+        return time.time() - written_at <= ttl_hours * 3600
+
+    def clear(self, source: str = None, location: str = None) -> None:
+        if source is None:
+            pattern = "*.arrow"
+        elif location is None:
+            pattern = f"{self._key(source, '')}*.arrow"
+        else:
+            pattern = f"{self._key(source, location)}.*.arrow"
+        for path in self.directory.glob(pattern):
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+
+_shared_stores: Dict[str, HourlyStore] = {}
+
+
+def get_hourly_store(config) -> Optional[HourlyStore]:
+    """Jedna instancja magazynu na katalog; None poza trybem godzinowym lub bez pyarrow"""
+    if config.RESOLUTION != "hourly" or not config.HOURLY_STORE_ENABLED:
+        return None
+    if importlib.util.find_spec("pyarrow") is None:
+        logger.warning("Brak pakietu pyarrow - dane godzinowe beda trzymane tylko w pamieci")
+        return None
+    if config.HOURLY_STORE_DIR not in _shared_stores:
+        _shared_stores[config.HOURLY_STORE_DIR] = HourlyStore(config.HOURLY_STORE_DIR)
+    return _shared_stores[config.HOURLY_STORE_DIR]
@@ -0,0 +1,225 @@
+﻿import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field, asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Atrybuty przenoszone do etykiet Prometheusa (lokalizacja celowo pominieta - zbyt duza krotnosc)
+LABEL_KEYS = ("source", "engine")
+
+
+def peak_rss_bytes() -> int:
+    """Szczytowe zuzycie pamieci procesu (high-water mark)"""
+    try:
+        import resource
+        # Linux raportuje ru_maxrss w KB
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except ImportError:
+        import psutil
+        info = psutil.Process(os.getpid()).memory_info()
+        return getattr(info, "peak_wset", info.rss)
+
+
+@dataclass
+class SpanRecord:
+    name: str
+    path: str
+    started_at: float
+    duration_s: float = 0.0
+    cpu_s: float = 0.0
+    peak_rss_bytes: int = 0
+    pid: int = 0
+    thread: str = ""
+    error: Optional[str] = None
+    attributes: Dict = field(default_factory=dict)
+
+    def set(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def add(self, key: str, value: float) -> None:
+        self.attributes[key] = self.attributes.get(key, 0) + value
+
+
+class JsonLinesExporter:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def export(self, record: SpanRecord) -> None:
+        line = json.dumps(asdict(record), default=str)
+        with self._lock, open(self.path, "a", encoding="utf-8") as handle:
+            handle.write(line + "\n")
+
+
+class PrometheusExporter:
+    """Agreguje spany do metryk w formacie tekstowym Prometheusa; opcjonalnie wystawia endpoint /metrics"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._spans: Dict[Tuple, Dict[str, float]] = {}
+        self._bytes: Dict[str, float] = {}
+        self._server = None
+
+    def export(self, record: SpanRecord) -> None:
+        labels = (("span", record.name),) + tuple(
+            (key, str(record.attributes[key])) for key in LABEL_KEYS if key in record.attributes
+        )
+        with self._lock:
+            stats = self._spans.setdefault(labels, {"count": 0, "errors": 0, "duration": 0.0, "cpu": 0.0, "peak": 0})
+            stats["count"] += 1
+            stats["errors"] += record.error is not None
+            stats["duration"] += record.duration_s
+            stats["cpu"] += record.cpu_s
+            stats["peak"] = max(stats["peak"], record.peak_rss_bytes)
+
+            if "bytes" in record.attributes and "source" in record.attributes:
+                source = str(record.attributes["source"])
+                self._bytes[source] = self._bytes.get(source, 0) + record.attributes["bytes"]
+
+    @staticmethod
+    def _labels(labels: Tuple) -> str:
+        return ",".join(f'{key}="{value}"' for key, value in labels)
+
+    def render(self) -> str:
+        with self._lock:
+            spans = {labels: dict(stats) for labels, stats in self._spans.items()}
+            source_bytes = dict(self._bytes)
+
+        lines = [
+            "# HELP weatherwise_span_duration_seconds Wall time spent in pipeline stages",
+            "# TYPE weatherwise_span_duration_seconds summary",
+        ]
+        for labels, stats in spans.items():
+            lines.append(f"weatherwise_span_duration_seconds_count{{{self._labels(labels)}}} {stats['count']}")
+            lines.append(f"weatherwise_span_duration_seconds_sum{{{self._labels(labels)}}} {stats['duration']:.6f}")
+
+        lines += ["# HELP weatherwise_span_cpu_seconds_total CPU time spent in pipeline stages",
+                  "# TYPE weatherwise_span_cpu_seconds_total counter"]
+        lines += [f"weatherwise_span_cpu_seconds_total{{{self._labels(labels)}}} {stats['cpu']:.6f}"
+                  for labels, stats in spans.items()]
+
+        lines += ["# HELP weatherwise_span_errors_total Failed pipeline stages",
+                  "# TYPE weatherwise_span_errors_total counter"]
+        lines += [f"weatherwise_span_errors_total{{{self._labels(labels)}}} {stats['errors']}"
+                  for labels, stats in spans.items()]
+
+        lines += ["# HELP weatherwise_span_peak_rss_bytes Process peak RSS observed at the end of a stage",
+                  "# TYPE weatherwise_span_peak_rss_bytes gauge"]
+        lines += [f"weatherwise_span_peak_rss_bytes{{{self._labels(labels)}}} {stats['peak']}"
+                  for labels, stats in spans.items()]
+
+        lines += ["# HELP weatherwise_source_bytes_total Bytes received per data source",
+                  "# TYPE weatherwise_source_bytes_total counter"]
+        lines += [f'weatherwise_source_bytes_total{{source="{source}"}} {value:.0f}'
+                  for source, value in source_bytes.items()]
+
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        exporter = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = exporter.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
+        logger.info(f"Metryki Prometheus dostepne pod http://{host}:{self._server.server_port}/metrics")
+        return self._server
+
+
+class Tracer:
+    """Zagniezdzone spany etapow potoku z czasem monotonicznym, CPU i pamiecia szczytowa"""
+
+    def __init__(self):
+        self.exporters: List = []
+        # Stos w kontekscie zamiast w watku - osobny dla kazdego watku i kazdego zadania asyncio
+        self._stack: ContextVar[Tuple[SpanRecord, ...]] = ContextVar(f"spans_{id(self)}", default=())
+
+    def add_exporter(self, exporter) -> None:
+        self.exporters.append(exporter)
+
+    def current(self) -> Optional[SpanRecord]:
+        stack = self._stack.get()
+        return stack[-1] if stack else None
+
+    @contextmanager
+    def span(self, name: str, parent: Optional[SpanRecord] = None, **attributes) -> Iterator[SpanRecord]:
+        """parent pozwala podpiac span z watku roboczego pod span watku, ktory zlecil prace"""
+        stack = self._stack.get()
+        parent = parent if parent is not None else (stack[-1] if stack else None)
+
+        record = SpanRecord(
+            name=name,
+            path=f"{parent.path}/{name}" if parent is not None else name,
+            started_at=time.time(),
+            pid=os.getpid(),
+            thread=threading.current_thread().name,
+            attributes=dict(attributes)
+        )
+
+        token = self._stack.set(stack + (record,))
+        started = time.perf_counter()
+        cpu_started = time.thread_time()
+        try:
+            yield record
+        except BaseException as e:
+            record.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            record.duration_s = time.perf_counter() - started
+            record.cpu_s = time.thread_time() - cpu_started
+            record.peak_rss_bytes = peak_rss_bytes()
+            self._stack.reset(token)
+            self._export(record)
+
+    def _export(self, record: SpanRecord) -> None:
+        for exporter in self.exporters:
+            try:
+                exporter.export(record)
+            except Exception as e:
+                logger.warning(f"Eksport spanu {record.name} nie powiodl sie: {e}")
+
+
+_tracer = Tracer()
+_configured = False
+
+
+def get_tracer() -> Tracer:
+    return _tracer
+
+
+def configure_exporters(config) -> None:
+    """Podlacza eksportery z konfiguracji - tylko raz na proces"""
+    global _configured
+    if _configured:
+        return
+    _configured = True
+
+    if config.METRICS_JSONL_PATH:
+        _tracer.add_exporter(JsonLinesExporter(config.METRICS_JSONL_PATH))
+    if config.METRICS_PROMETHEUS_PORT is not None:
+        exporter = PrometheusExporter()
+        exporter.serve(config.METRICS_PROMETHEUS_PORT)
+        _tracer.add_exporter(exporter)
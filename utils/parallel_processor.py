@@ -1,12 +1,22 @@
-﻿from multiprocessing import Pool, cpu_count
-from typing import Callable, Iterable, Any
+﻿import logging
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from multiprocessing import Pool, cpu_count
+from typing import Callable, Iterable, Any, Dict, Iterator, List, Optional
+
+from utils.deadline import fetch_deadline
+from utils.instrumentation import get_tracer
+
+logger = logging.getLogger(__name__)
+
 
 def fetch_single_client(client_and_location):
     client, location = client_and_location
     try:
         return client.fetch(location)
     except Exception as e:
-        print(f"Błąd z {client.name}: {e}")
+        logger.error(f"Błąd z {client.name}: {e}")
         return None
 
 class ParallelWeatherProcessor:
@@ -19,3 +29,109 @@ class ParallelWeatherProcessor:
             results = pool.map(func, args_list)
 
         return results
+
+
+class ConcurrentFetchEngine:
+    """Pula watkow do pobierania danych z API, wspoldzielona przez caly czas zycia aplikacji"""
+
+    def __init__(self, max_workers: int = 8, source_timeouts: Dict[str, float] = None,
+                 default_timeout: float = 30, deadline: float = None):
+        self.source_timeouts = source_timeouts or {}
+        self.default_timeout = default_timeout
+        self.deadline = deadline
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="weather-fetch")
+
+    def timeout_for(self, source: str) -> float:
+        return self.source_timeouts.get(source, self.default_timeout)
+
+    def iter_fetch(self, clients: List, location: str, deadline: Optional[float] = None) -> Iterator[Any]:
+        """Zwraca wyniki w kolejnosci ukonczenia; zrodla po czasie sa pomijane.
+
+        Limit zrodla i deadline tylko koncza czekanie na wynik - dzialajacego watku nie da sie przerwac.
+        Zapytania HTTP (HttpTransport) dostaja ten sam termin przez fetch_deadline i same koncza sie
+        najpozniej wtedy; biblioteki z wlasnym klientem HTTP (meteostat) moga pracowac dluzej w tle."""
+        started = time.monotonic()
+        deadline = self.deadline if deadline is None else deadline
+        deadline_at = started + deadline if deadline is not None else float("inf")
+
+        parent = get_tracer().current()
+        futures, expires = {}, {}
+        for client in clients:
+            expires_at = min(started + self.timeout_for(client.name), deadline_at)
+            future = self._executor.submit(self._traced_fetch, client, location, parent, expires_at)
+            futures[future] = client
+            expires[future] = expires_at
+        pending = set(futures)
+
+        while pending:
+            now = time.monotonic()
+            for future in [f for f in pending if not f.done() and now >= expires[f]]:
+                pending.discard(future)
+                # Usuwa tylko zadania czekajace w kolejce puli; uruchomione koncza sie na terminie transportu
+                future.cancel()
+                logger.warning(f"Przekroczono limit czasu dla {futures[future].name} ({location})")
+
+            if not pending:
+                break
+
+            wait_for = max(0.0, min(expires[f] for f in pending) - now)
+            done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                client = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error(f"Błąd z {client.name}: {e}")
+                    continue
+                logger.info(f"{client.name} zakonczone po {time.monotonic() - started:.3f}s")
+                yield result
+
+    @staticmethod
+    def _traced_fetch(client, location: str, parent, expires_at: float):
+        with fetch_deadline(expires_at), \
+                get_tracer().span("fetch", parent=parent, source=client.name, location=location):
+            return client.fetch_coalesced(location)
+
+    def fetch(self, clients: List, location: str, deadline: Optional[float] = None) -> list:
+        return [result for result in self.iter_fetch(clients, location, deadline) if result is not None]
+
+    def iter_batch(self, clients: List, locations: List[str], deadline: Optional[float] = None) -> Iterator[Any]:
+        """Uruchamia fetch_many kazdego klienta w osobnym watku i przekazuje wyniki w miare naplywania"""
+        deadline_at = time.monotonic() + deadline if deadline is not None else None
+        results = queue.Queue()
+        finished = object()
+        parent = get_tracer().current()
+
+        def drain(client):
+            try:
+                with fetch_deadline(deadline_at), \
+                        get_tracer().span("fetch_many", parent=parent, source=client.name, locations=len(locations)):
+                    for result in client.fetch_many(locations):
+                        results.put(result)
+            except Exception as e:
+                logger.error(f"Błąd z {client.name}: {e}")
+            finally:
+                results.put(finished)
+
+        for client in clients:
+            self._executor.submit(drain, client)
+
+        remaining = len(clients)
+        while remaining:
+            timeout = None if deadline_at is None else deadline_at - time.monotonic()
+            try:
+                if timeout is not None and timeout <= 0:
+                    raise queue.Empty
+                result = results.get(timeout=timeout)
+            except queue.Empty:
+                logger.warning(f"Przekroczono limit czasu pobierania wsadowego ({remaining} zrodel w toku)")
+                return
+
+            if result is finished:
+                remaining -= 1
+            elif result is not None:
+                yield result
+
+    def shutdown(self, wait_for_running: bool = False) -> None:
+        self._executor.shutdown(wait=wait_for_running, cancel_futures=True)
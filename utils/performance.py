@@ -1,29 +1,30 @@
-﻿import time
-import functools
-import psutil
-import os
+﻿import functools
+import logging
 
+from utils.instrumentation import get_tracer
+
+logger = logging.getLogger(__name__)
+
+
+def traced(name: str = None, **attributes):
+    """Dekorator otwierajacy span instrumentacji wokol wywolania funkcji"""
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with get_tracer().span(span_name, **attributes) as span:
+                result = func(*args, **kwargs)
+            logger.debug(f"{span_name} zajelo {span.duration_s:.3f}s (CPU {span.cpu_s:.3f}s)")
+            return result
+        return wrapper
+    return decorator
+
+
+# Zachowane dla zgodnosci - pomiary trafiaja teraz do spanow zamiast na stdout
 def measure_time(func):
-    @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-        start = time.time()
-        result = func(*args, **kwargs)
-        end = time.time()
-        print(f"{func.__name__} zajelo {end - start:.3f}s")
-        return result
-    return wrapper
+    return traced()(func)
+
 
 def profile_function(func):
-    @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-        process = psutil.Process(os.getpid())
-        before_mem = process.memory_info().rss / (1024 * 1024)
-        before_cpu = psutil.cpu_percent(interval=None)
-
-        result = func(*args, **kwargs)
-
-        after_mem = process.memory_info().rss / (1024 * 1024)
-        after_cpu = psutil.cpu_percent(interval=None)
-        print(f"{func.__name__} – RAM: {after_mem - before_mem:.2f} MB | CPU: {after_cpu:.2f}%")
-        return result
-    return wrapper
+    return traced()(func)
@@ -0,0 +1,236 @@
+﻿import logging
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+logger = logging.getLogger(__name__)
+
+# Skala MAD -> odchylenie standardowe dla rozkladu normalnego
+MAD_SCALE = 1.4826
+# Minimalna liczba wspolnych dni do oceny przesuniecia zrodla
+MIN_LAG_OVERLAP = 30
+# Kolumny bez interpolacji w dniach bez zrodla: temperature_std to rozrzut pomiarow, a opadu nie da sie
+# wywnioskowac z sasiednich dni
+NOT_INTERPOLATED = ("temperature_std", "precipitation")
+
+# (dni jako int64 od epoki, wartosci [dzien x zmienna] z temperatura w kolumnie 0, wagi wierszy)
+SourceRun = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+
+def nanmedian(values: np.ndarray, axis: int) -> np.ndarray:
+    """Mediana macierzy 2D z pominieciem NaN - bez ostrzezen dla pustych wierszy i kilka razy szybsza od numpy"""
+    ordered = np.sort(values, axis=axis)
+    if axis == 0:
+        ordered = ordered.T
+    # NaN trafiaja na koniec - srodkowe elementy wsrod count pierwszych (dla nieparzystej liczby sa tym samym)
+    count = np.count_nonzero(~np.isnan(ordered), axis=1)
+    rows = np.arange(len(ordered))
+    last = np.maximum(count - 1, 0)
+    median = (ordered[rows, last // 2] + ordered[rows, np.minimum(count // 2, last)]) / 2
+    median[count == 0] = np.nan
+    return median
+
+
+def robust_z(residuals: np.ndarray, min_scale: float) -> np.ndarray:
+    """|r - mediana| / (1.4826 * MAD) kolumnami; brak danych daje z = 0 (bez kary)"""
+    center = nanmedian(residuals, axis=0)
+    deviation = np.abs(residuals - center)
+    scale = np.maximum(MAD_SCALE * nanmedian(deviation, axis=0), min_scale)
+    z = deviation / scale
+    return np.where(np.isnan(z), 0.0, z)
+
+
+class SourceQuality:
+    """Ocena zrodel dzien po dniu na wyrownanych tablicach: przesuniecie, zamrozone wartosci, odstajace dni, luki"""
+
+    def __init__(self, config):
+        self.z_soft = config.QUALITY_Z_SOFT
+        self.z_reject = config.QUALITY_Z_REJECT
+        self.max_lag_days = config.QUALITY_MAX_LAG_DAYS
+        self.flatline_days = config.QUALITY_FLATLINE_DAYS
+        self.stale_days = config.QUALITY_STALE_DAYS
+        self.min_scale = config.QUALITY_MIN_SCALE
+        self.fill_gaps_enabled = config.QUALITY_FILL_GAPS
+
+    @staticmethod
+    def _align(runs: List[SourceRun]) -> Tuple[np.ndarray, int]:
+        """Macierz temperatur [dzien x zrodlo] od najwczesniejszego dnia; brak pomiaru = NaN"""
+        first = min(int(days[0]) for days, _, _ in runs)
+        last = max(int(days[-1]) for days, _, _ in runs)
+        aligned = np.full((last - first + 1, len(runs)), np.nan)
+        for s, (days, values, _) in enumerate(runs):
+            aligned[days - first, s] = values[:, 0]
+        return aligned, first
+
+    def _lag_scores(self, x: np.ndarray, reference: np.ndarray) -> np.ndarray:
+        """Korelacja par (x[d + lag], reference[d]) dla lag = -max..max naraz; przyrosty dzienne znosza sezonowosc"""
+        lag = self.max_lag_days
+        if len(x) <= 2 * lag:
+            return np.full(2 * lag + 1, np.nan)
+        # Wiersz j macierzy to x przesuniete o j - lag; wspolny zakres dni dla wszystkich przesuniec
+        present_x = ~np.isnan(x)
+        shifted = sliding_window_view(np.where(present_x, x, 0.0), len(x) - 2 * lag)
+        shifted_mask = sliding_window_view(present_x.astype(np.float64), len(x) - 2 * lag)
+        center = reference[lag:len(reference) - lag]
+        present_r = ~np.isnan(center)
+        r = np.where(present_r, center, 0.0)
+        m = present_r.astype(np.float64)
+
+        n = shifted_mask @ m
+        sum_x, sum_r = shifted @ m, shifted_mask @ r
+        sum_xx, sum_rr, sum_xr = (shifted * shifted) @ m, shifted_mask @ (r * r), shifted @ r
+        with np.errstate(invalid="ignore", divide="ignore"):
+            covariance = sum_xr - sum_x * sum_r / n
+            variance = (sum_xx - sum_x ** 2 / n) * (sum_rr - sum_r ** 2 / n)
+            scores = covariance / np.sqrt(variance)
+        scores[(n < MIN_LAG_OVERLAP) | ~(variance > 0)] = np.nan
+        return scores
+
+    def _lags(self, aligned: np.ndarray, base_weights: List[float], sources: List[str]) -> np.ndarray:
+        """Przesuniecie (dni) kazdego zrodla wzgledem mediany pozostalych; 0 gdy brak wyraznej poprawy"""
+        n_sources = aligned.shape[1]
+        lags = np.zeros(n_sources, dtype=np.int64)
+        if n_sources < 2 or self.max_lag_days <= 0:
+            return lags
+
+        increments = np.diff(aligned, axis=0)
+        candidates = np.zeros(n_sources, dtype=np.int64)
+        # Przy dwoch zrodlach wynik drugiego to lustro pierwszego - liczymy raz
+        for s in range(1 if n_sources == 2 else n_sources):
+            others = np.delete(increments, s, axis=1)
+            reference = others[:, 0] if others.shape[1] == 1 else nanmedian(others, axis=1)
+            scores = self._lag_scores(increments[:, s], reference)
+            zero = scores[self.max_lag_days]
+            if np.isnan(zero) or np.isnan(scores).all():
+                continue
+            best = int(np.nanargmax(scores))
+            if best != self.max_lag_days and scores[best] > 0.5 and scores[best] - zero > 0.2:
+                candidates[s] = best - self.max_lag_days
+        if n_sources == 2:
+            candidates[1] = -candidates[0]
+
+        if n_sources == 2 and candidates.any():
+            # Dwa zrodla widza to samo przesuniecie z przeciwnym znakiem - poprawiamy zrodlo o nizszej wadze
+            if base_weights[0] == base_weights[1]:
+                logger.warning(f"Zrodla {sources[0]} i {sources[1]} sa przesuniete o {abs(candidates[0])} dni "
+                               f"wzgledem siebie - nie da sie ustalic ktore, bez korekty")
+                return lags
+            shifted = int(np.argmin(base_weights))
+            lags[shifted] = candidates[shifted]
+            return lags
+        return candidates
+
+    def _flatline(self, days: np.ndarray, temperature: np.ndarray) -> np.ndarray:
+        """Wiersze powtarzajace te sama wartosc przez >= flatline_days kolejnych dni (poza pierwszym)"""
+        flagged = np.zeros(len(days), dtype=bool)
+        if self.flatline_days < 2 or len(days) < self.flatline_days:
+            return flagged
+        same = (np.diff(temperature) == 0) & (np.diff(days) == 1)
+        edges = np.flatnonzero(np.diff(np.r_[0, same.astype(np.int8), 0]))
+        for start, end in zip(edges[::2], edges[1::2]):
+            if end - start >= self.flatline_days - 1:
+                flagged[start + 1:end + 1] = True
+        return flagged
+
+    def _z(self, aligned: np.ndarray) -> np.ndarray:
+        """Odstawanie dnia: od mediany zrodel i od wlasnych sasiednich dni"""
+        n_sources = aligned.shape[1]
+        spikes = np.full_like(aligned, np.nan)
+        spikes[1:-1] = aligned[1:-1] - (aligned[:-2] + aligned[2:]) / 2
+        z_temporal = robust_z(spikes, self.min_scale)
+        if n_sources == 1:
+            return z_temporal
+
+        z_cross = robust_z(aligned - nanmedian(aligned, axis=1)[:, None], self.min_scale)
+        if n_sources >= 3:
+            return z_cross
+        # Przy dwoch zrodlach rozbieznosc obciaza oba - winne jest to, ktore odstaje tez od wlasnych sasiadow
+        return np.minimum(z_cross, z_temporal)
+
+    def assess(self, runs: List[SourceRun], sources: List[str]) -> Tuple[List[SourceRun], Dict[str, dict]]:
+        """Skoryguj przesuniete zrodla i przemnoz wagi wierszy przez ocene jakosci; zwraca tez raport"""
+        aligned, first = self._align(runs)
+        base_weights = [float(weights.max()) if len(weights) else 0.0 for _, _, weights in runs]
+
+        lags = self._lags(aligned, base_weights, sources)
+        if lags.any():
+            runs = [(days - lag, values, weights) for (days, values, weights), lag in zip(runs, lags)]
+            aligned, first = self._align(runs)
+        last = first + len(aligned) - 1
+
+        z = self._z(aligned)
+        multiplier = np.where(z <= self.z_soft, 1.0, self.z_soft / np.maximum(z, 1e-12))
+        multiplier[z > self.z_reject] = 0.0
+
+        assessed, report = [], {}
+        for s, (days, values, weights) in enumerate(runs):
+            row_multiplier = multiplier[days - first, s]
+            flatline = self._flatline(days, values[:, 0])
+            row_multiplier[flatline] = 0.0
+            assessed.append((days, values, weights * row_multiplier))
+
+            covered = 1 + int(np.count_nonzero(np.diff(days)))
+            report[sources[s]] = {
+                "lag_days": int(lags[s]),
+                "gap_days": int(days[-1] - days[0] + 1 - covered),
+                "end_lag_days": int(last - days[-1]),
+                "flatline_days": int(flatline.sum()),
+                "rejected_days": int((row_multiplier == 0).sum()),
+                "downweighted_days": int(((row_multiplier > 0) & (row_multiplier < 1)).sum()),
+                "score": round(float(row_multiplier.mean()), 4),
+            }
+            if lags[s]:
+                logger.warning(f"Zrodlo {sources[s]} przesuniete o {int(lags[s])} dni - daty skorygowane")
+            if report[sources[s]]["end_lag_days"] >= self.stale_days:
+                logger.warning(f"Zrodlo {sources[s]} nieaktualne: konczy sie "
+                               f"{report[sources[s]]['end_lag_days']} dni przed pozostalymi")
+        return assessed, report
+
+    def fill_gaps(self, merged: pd.DataFrame) -> pd.DataFrame:
+        """Dni bez zadnego zrodla dodane z wartosciami interpolowanymi liniowo; maja filled = True
+        i temperature_count = 0. Interpolowane sa tylko te dni - braki w dniach z pomiarem zostaja NaN,
+        wiec filled wskazuje dokladnie wartosci, ktore nie sa pomiarem (opad w tych dniach to NaN)"""
+        if not self.fill_gaps_enabled or merged.empty:
+            return merged
+
+        days = merged["ds"].to_numpy().astype("datetime64[D]").astype(np.int64)
+        full = np.arange(days[0], days[-1] + 1)
+        if len(full) == len(days):
+            return merged
+
+        position = full - days[0]
+        rows = days - days[0]
+        gaps = np.ones(len(full), dtype=bool)
+        gaps[rows] = False
+        result = {"ds": full.astype("datetime64[D]").astype("datetime64[ns]")}
+        for column in merged.columns:
+            if column == "ds":
+                continue
+            source = merged[column].to_numpy()
+            if column == "temperature_count":
+                result[column] = np.zeros(len(full), dtype=source.dtype)
+                result[column][rows] = source
+                continue
+            if column == "filled":
+                result[column] = gaps.copy()
+                result[column][rows] = source
+                continue
+            values = np.full(len(full), np.nan)
+            values[rows] = source
+            if column not in NOT_INTERPOLATED:
+                # Kolumny calkiem puste (zmienna bez zadnego zrodla) zostaja NaN - nie ma z czego interpolowac
+                known = ~np.isnan(values)
+                if known.any():
+                    values[gaps] = np.interp(position[gaps], position[known], values[known])
+            result[column] = values
+
+        filled = pd.DataFrame(result, columns=merged.columns)
+        filled.attrs.update(merged.attrs)
+        return filled
+
+
+def create_source_quality(config):
+    """Ocena jakosci zrodel dla merge_series; None gdy wylaczona w konfiguracji"""
+    return SourceQuality(config) if config.QUALITY_ENABLED else None
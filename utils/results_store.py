@@ -0,0 +1,191 @@
+﻿import importlib.util
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from datetime import date, datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from utils.gazetteer import normalize_name
+from utils.series_merge import MERGED_VARIABLES
+
+logger = logging.getLogger(__name__)
+
+FORECASTS = "forecasts"
+HISTORY = "history"
+
+
+class ResultsStore:
+    """Prognozy i scalone historie z kazdego przebiegu jako zbiory Parquet partycjonowane location/run_date"""
+
+    def __init__(self, directory: str, compression: str = "zstd", history_days: Optional[int] = None):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.compression = compression
+        self.history_days = history_days
+
+    @staticmethod
+    def location_key(location: str) -> str:
+        """'Kraków' -> 'krakow', '50.06,19.94' -> '50-06-19-94' - nazwa katalogu partycji"""
+        return re.sub(r"[^a-z0-9_-]+", "-", normalize_name(location)).strip("-") or "unknown"
+
+    @staticmethod
+    def _schemas():
+        import pyarrow as pa
+
+        forecasts = pa.schema([
+            ("run_id", pa.string()), ("run_at", pa.timestamp("s")), ("engine", pa.string()),
+            ("variable", pa.string()), ("ds", pa.date32()), ("horizon", pa.int16()),
+            ("yhat", pa.float32()), ("yhat_lower", pa.float32()), ("yhat_upper", pa.float32()),
+        ])
+        history = pa.schema(
+            [("run_id", pa.string()), ("run_at", pa.timestamp("s")), ("ds", pa.date32()), ("y", pa.float32()),
+             ("temperature_count", pa.int32()), ("temperature_std", pa.float32()), ("filled", pa.bool_())]
+            + [(column, pa.float32()) for column in MERGED_VARIABLES]
+        )
+        return {FORECASTS: forecasts, HISTORY: history}
+
+    @staticmethod
+    def _partitioning():
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+
+        return ds.partitioning(pa.schema([("location", pa.string()), ("run_date", pa.date32())]), flavor="hive")
+
+    def _write(self, kind: str, location_key: str, run_at: datetime, table) -> Path:
+        import pyarrow.parquet as pq
+
+        partition = self.directory / kind / f"location={location_key}" / f"run_date={run_at:%Y-%m-%d}"
+        partition.mkdir(parents=True, exist_ok=True)
+        # Nazwy plikow rosna z czasem zapisu - najnowszy przebieg to ostatni plik partycji
+        path = partition / f"part-{time.time_ns()}-{uuid.uuid4().hex[:8]}.parquet"
+        # Plik tymczasowy z kropka - odczyt zbioru pomija go, dopoki zapis nie zostanie zakonczony
+        tmp_path = partition / f".{path.name}.tmp"
+        pq.write_table(table, str(tmp_path), compression=self.compression)
+        os.replace(tmp_path, path)
+        return path
+
+    def write_run(self, location: str, history: Optional[pd.DataFrame], forecasts: Dict[str, pd.DataFrame],
+                  periods: int, engines: Dict[str, str] = None, run_at: datetime = None) -> str:
+        """Dopisuje horyzont prognoz (temperatura i pozostale zmienne) oraz historie jednego przebiegu"""
+        import pyarrow as pa
+
+        schemas = self._schemas()
+        run_at = (run_at or datetime.now()).replace(microsecond=0)
+        run_id = uuid.uuid4().hex
+        key = self.location_key(location)
+        engines = engines or {}
+
+        frames = {variable: frame.tail(periods) for variable, frame in forecasts.items() if frame is not None}
+        if frames:
+            lengths = [len(frame) for frame in frames.values()]
+            total = sum(lengths)
+            table = pa.table({
+                "run_id": pa.array([run_id] * total, type=pa.string()),
+                "run_at": pa.array(np.full(total, np.datetime64(run_at, "s")), type=pa.timestamp("s")),
+                "engine": pa.array([engines.get(variable) for variable, n in zip(frames, lengths) for _ in range(n)],
+                                   type=pa.string()),
+                "variable": pa.array([variable for variable, n in zip(frames, lengths) for _ in range(n)],
+                                     type=pa.string()),
+                "ds": pa.array(np.concatenate([frame["ds"].to_numpy().astype("datetime64[D]")
+                                               for frame in frames.values()]), type=pa.date32()),
+                "horizon": pa.array(np.concatenate([np.arange(1, n + 1) for n in lengths]), type=pa.int16()),
+                **{column: pa.array(np.concatenate([frame[column].to_numpy(dtype=np.float32)
+                                                    for frame in frames.values()]), type=pa.float32())
+                   for column in ("yhat", "yhat_lower", "yhat_upper")},
+            }, schema=schemas[FORECASTS])
+            self._write(FORECASTS, key, run_at, table)
+
+        if history is not None and len(history):
+            if self.history_days:
+                history = history.tail(self.history_days)
+            n = len(history)
+            columns = {
+                "run_id": pa.array([run_id] * n, type=pa.string()),
+                "run_at": pa.array(np.full(n, np.datetime64(run_at, "s")), type=pa.timestamp("s")),
+                "ds": pa.array(history["ds"].to_numpy().astype("datetime64[D]"), type=pa.date32()),
+            }
+            for field in schemas[HISTORY]:
+                if field.name in columns:
+                    continue
+                values = history[field.name].to_numpy() if field.name in history.columns else np.full(n, np.nan)
+                # Brak wartosci zapisywany jako null, nie NaN - filtry is_valid() dzialaja na statystykach grup
+                columns[field.name] = pa.array(values, type=field.type, from_pandas=True)
+            self._write(HISTORY, key, run_at, pa.table(columns, schema=schemas[HISTORY]))
+
+        logger.debug(f"Zapisano wyniki przebiegu {run_id[:8]} dla {location}")
+        return run_id
+
+    def _latest_file(self, kind: str, location: str) -> Optional[Path]:
+        location_dir = self.directory / kind / f"location={self.location_key(location)}"
+        if not location_dir.is_dir():
+            return None
+        for partition in sorted(location_dir.glob("run_date=*"), reverse=True):
+            files = sorted(partition.glob("part-*.parquet"), key=lambda path: int(path.stem.split("-")[1]))
+            if files:
+                return files[-1]
+        return None
+
+    def latest(self, kind: str, location: str) -> Optional[pd.DataFrame]:
+        """Ostatni przebieg dla lokalizacji - odczyt jednego pliku wskazanego przez katalogi partycji"""
+        import pyarrow.parquet as pq
+
+        path = self._latest_file(kind, location)
+        if path is None:
+            return None
+        return pq.read_table(str(path)).to_pandas(date_as_object=False)
+
+    def latest_forecast(self, location: str, variable: str = "temperature") -> Optional[pd.DataFrame]:
+        frame = self.latest(FORECASTS, location)
+        if frame is None:
+            return None
+        return frame[frame["variable"] == variable].reset_index(drop=True) if variable else frame
+
+    def read(self, kind: str, location: str = None, since: date = None, until: date = None,
+             columns: List[str] = None, predicate=None) -> pd.DataFrame:
+        """Odczyt z predykatami: lokalizacja i daty przebiegow odcinaja partycje, predicate (wyrazenie pyarrow)
+        pomija grupy wierszy po statystykach, np. ds.field('variable') == 'humidity'"""
+        import pyarrow.dataset as ds
+
+        root = self.directory / kind
+        if not root.is_dir():
+            return self._schemas()[kind].empty_table().to_pandas(date_as_object=False)
+
+        expression = predicate
+        conditions = []
+        if location is not None:
+            conditions.append(ds.field("location") == self.location_key(location))
+        if since is not None:
+            conditions.append(ds.field("run_date") >= since)
+        if until is not None:
+            conditions.append(ds.field("run_date") <= until)
+        for condition in conditions:
+            expression = condition if expression is None else expression & condition
+
+        dataset = ds.dataset(str(root), format="parquet", partitioning=self._partitioning())
+        return dataset.to_table(columns=columns, filter=expression).to_pandas(date_as_object=False)
+
+
+_shared_stores: Dict[str, ResultsStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_results_store(config) -> Optional[ResultsStore]:
+    """Jedna instancja na katalog; None gdy zapis wylaczony lub brak pyarrow"""
+    if not config.RESULTS_ENABLED:
+        return None
+    if importlib.util.find_spec("pyarrow") is None:
+        logger.warning("Brak pakietu pyarrow - wyniki przebiegow nie beda zapisywane")
+        return None
+    with _stores_lock:
+        if config.RESULTS_DIR not in _shared_stores:
+            _shared_stores[config.RESULTS_DIR] = ResultsStore(
+                config.RESULTS_DIR, config.RESULTS_COMPRESSION, config.RESULTS_HISTORY_DAYS
+            )
+        return _shared_stores[config.RESULTS_DIR]
@@ -1,41 +1,195 @@
-﻿import pandas as pd
-from typing import List, Optional
-from api_clients.base import WeatherData
+﻿import hashlib
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from api_clients.base import SERIES_VARIABLES, WeatherData
 from exceptions.weather_exceptions import InsufficientDataError
+from utils.performance import traced
+from utils.quality import SourceQuality
+
+# Pozostale zmienne dzienne jako kolumny wyrownane do dni z temperatura (y)
+MERGED_VARIABLES = [variable for variable in SERIES_VARIABLES if variable != "temperature"]
+# filled = dzien bez zadnego zrodla, uzupelniony interpolacja (SourceQuality.fill_gaps) - nie jest pomiarem
+MERGED_COLUMNS = ["ds", "y", "temperature_count", "temperature_std", "filled"] + MERGED_VARIABLES
+
+# Dlugosc okna scalania w dniach - pamiec stanu nie zalezy od liczby zrodel ani dlugosci historii
+MERGE_WINDOW_DAYS = 4096
+
+# (dni jako int64 od epoki, wartosci [dzien x zmienna] z temperatura w kolumnie 0, wagi wierszy)
+SourceRun = Tuple[np.ndarray, np.ndarray, np.ndarray]
 
 
 class TimeSeriesMerger:
     @staticmethod
-    def merge_series(weather_data_list: List[WeatherData]) -> pd.DataFrame:
-        series_list = []
+    def fingerprint(weather_data_list: List[WeatherData]) -> str:
+        """Skrot wejscia merge_series - identyczne dane ze zrodel daja identyczny klucz"""
+        digest = hashlib.sha1()
+        for data in sorted(weather_data_list, key=lambda item: item.source):
+            digest.update(data.source.encode("utf-8"))
+            if data.series is not None and len(data.series) > 0:
+                digest.update(np.ascontiguousarray(data.series).tobytes())
+        return digest.hexdigest()
+
+    @staticmethod
+    def _source_run(data: WeatherData, weight: float, variables: List[str]) -> Optional[SourceRun]:
+        """Posortowane po dacie tablice jednego zrodla bez dni z brakujaca temperatura"""
+        if data.series is None or len(data.series) == 0:
+            return None
 
+        # Bufor szeregu z WeatherData: dni od epoki i kolumny zmiennych bez konwersji przez pandas
+        days = data.series["day"].astype(np.int64)
+        values = np.column_stack([data.series[variable] for variable in variables]).astype(np.float64, copy=False)
+
+        valid = ~np.isnan(values[:, 0])
+        if not valid.all():
+            days, values = days[valid], values[valid]
+        if len(days) == 0:
+            return None
+
+        # Zrodla sa zwykle juz uporzadkowane po dacie - sortujemy tylko gdy trzeba
+        if np.any(days[1:] < days[:-1]):
+            order = np.argsort(days, kind="stable")
+            days, values = days[order], values[order]
+
+        return days, values, np.full(len(days), weight)
+
+    @staticmethod
+    def _source_runs(weather_data_list: List[WeatherData], weights: Optional[Dict[str, float]],
+                     variables: List[str]) -> Tuple[List[SourceRun], List[str]]:
+        """Tablice wszystkich zrodel i ich nazwy; zrodla z waga <= 0 sa pomijane"""
+        weights = weights or {}
+        runs, sources = [], []
         for data in weather_data_list:
-            if not data.series:
+            weight = float(weights.get(data.source, 1.0))
+            if weight <= 0:
                 continue
+            run = TimeSeriesMerger._source_run(data, weight, variables)
+            if run is not None:
+                runs.append(run)
+                sources.append(data.source)
+        return runs, sources
+
+    @staticmethod
+    def _layers(offsets: np.ndarray, values: np.ndarray,
+                weights: np.ndarray) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """Dzieli fragment zrodla na warstwy bez powtorzonych dni (powtorzenia w jednym zrodle sa rzadkie)"""
+        repeated = offsets[1:] == offsets[:-1]
+        if not repeated.any():
+            yield offsets, values, weights
+            return
 
-            df = pd.DataFrame(data.series)
-            if df.empty:
+        positions = np.arange(len(offsets))
+        group_start = np.maximum.accumulate(np.where(np.r_[True, ~repeated], positions, 0))
+        rank = positions - group_start
+        for layer in range(rank.max() + 1):
+            mask = rank == layer
+            yield offsets[mask], values[mask], weights[mask]
+
+    @staticmethod
+    def _merge_windows(runs: List[SourceRun],
+                       window_days: int) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+        """K-drozne scalanie posortowanych zrodel oknami dat z wazonym algorytmem Welforda (jedno przejscie)"""
+        first_day = min(int(days[0]) for days, _, _ in runs)
+        last_day = max(int(days[-1]) for days, _, _ in runs)
+        n_variables = runs[0][1].shape[1]
+        cursors = [0] * len(runs)
+
+        for window_start in range(first_day, last_day + 1, window_days):
+            window_end = window_start + window_days
+            # Stan [dzien x zmienna] - wszystkie zmienne aktualizowane tymi samymi operacjami wektorowymi
+            shape = (window_days, n_variables)
+            count = np.zeros(shape, dtype=np.int64)
+            weight_sum = np.zeros(shape)
+            weight_sq_sum = np.zeros(shape)
+            mean = np.zeros(shape)
+            m2 = np.zeros(shape)
+
+            for i, (days, values, weights) in enumerate(runs):
+                cursor = cursors[i]
+                stop = cursor + int(np.searchsorted(days[cursor:], window_end))
+                if stop == cursor:
+                    continue
+                cursors[i] = stop
+
+                for offsets, x, weight in TimeSeriesMerger._layers(days[cursor:stop] - window_start,
+                                                                   values[cursor:stop], weights[cursor:stop]):
+                    # Brak wartosci (NaN) i wiersze odrzucone przez ocene jakosci (waga 0) nie zmieniaja stanu
+                    present = ~np.isnan(x) & (weight > 0)[:, None]
+                    w = np.where(present, weight[:, None], 0.0)
+                    count[offsets] += present
+                    weight_sum[offsets] += w
+                    weight_sq_sum[offsets] += w * w
+                    delta = np.where(present, x - mean[offsets], 0.0)
+                    mean[offsets] += np.divide(w, weight_sum[offsets], out=np.zeros_like(w),
+                                               where=weight_sum[offsets] > 0) * delta
+                    m2[offsets] += w * delta * np.where(present, x - mean[offsets], 0.0)
+
+            filled = np.flatnonzero(count[:, 0])
+            if len(filled) == 0:
                 continue
 
-            # Spr czy nazwy kolumn sa prawidlowe
-            if "date" in df.columns and "temperature" in df.columns:
-                df["date"] = pd.to_datetime(df["date"])
-                df = df.dropna(subset=["temperature"])
-                series_list.append(df[["date", "temperature"]])
+            means = mean[filled]
+            means[count[filled] == 0] = np.nan
+            yield (filled + window_start, means, count[filled, 0],
+                   TimeSeriesMerger._sample_std(m2[filled, 0], weight_sum[filled, 0], weight_sq_sum[filled, 0],
+                                                count[filled, 0]))
 
-        if not series_list:
-            raise InsufficientDataError("Brak dostepnych danych z zakresow czasowych z zrodla")
+    @staticmethod
+    def _sample_std(m2: np.ndarray, weight_sum: np.ndarray, weight_sq_sum: np.ndarray,
+                    count: np.ndarray) -> np.ndarray:
+        # Wagi niezawodnosci: dla wag rownych 1 to zwykle odchylenie z proby (ddof=1), jak w pandas
+        denominator = weight_sum - weight_sq_sum / weight_sum
+        valid = (count > 1) & (denominator > 0)
+        std = np.full(len(m2), np.nan)
+        std[valid] = np.sqrt(np.maximum(m2[valid], 0.0) / denominator[valid])
+        return std
+
+    @staticmethod
+    def iter_merged(weather_data_list: List[WeatherData], weights: Optional[Dict[str, float]] = None,
+                    window_days: int = MERGE_WINDOW_DAYS, variables: Optional[List[str]] = None,
+                    quality: Optional[SourceQuality] = None) -> Iterator[pd.DataFrame]:
+        """Scalone fragmenty szeregu emitowane okno po oknie w kolejnosci dat"""
+        variables = MERGED_VARIABLES if variables is None else [v for v in MERGED_VARIABLES if v in variables]
+        runs, sources = TimeSeriesMerger._source_runs(weather_data_list, weights, ["temperature"] + variables)
+        if not runs:
+            return
 
-        # Laczenie i oblcizanie sredniej dla nakladajacych sie dat
-        merged = pd.concat(series_list).groupby("date", as_index=False).agg({
-            "temperature": ["mean", "count", "std"]
-        })
+        report = None
+        if quality is not None:
+            # Wagi wierszy przemnozone przez ocene jakosci zrodla w danym dniu (0 = dzien odrzucony)
+            runs, report = quality.assess(runs, sources)
 
-        # Flatten column names
-        merged.columns = ["date", "temperature_mean", "temperature_count", "temperature_std"]
-        merged = merged.sort_values("date").reset_index(drop=True)
+        columns = MERGED_COLUMNS[:5] + variables
+        for days, mean, count, std in TimeSeriesMerger._merge_windows(runs, window_days):
+            # Nazwy kolumn zgodne z Prophet
+            chunk = pd.DataFrame({
+                "ds": days.astype("datetime64[D]").astype("datetime64[ns]"),
+                "y": mean[:, 0],
+                "temperature_count": count,
+                "temperature_std": std,
+                "filled": np.zeros(len(days), dtype=bool),
+                **{variable: mean[:, i + 1] for i, variable in enumerate(variables)},
+            }, columns=columns)
+            if report is not None:
+                chunk.attrs["quality"] = report
+            yield chunk
 
-        # Rename for Prophet compatibility
-        merged = merged.rename(columns={"date": "ds", "temperature_mean": "y"})
+    @staticmethod
+    @traced("merge")
+    def merge_series(weather_data_list: List[WeatherData], weights: Optional[Dict[str, float]] = None,
+                     variables: Optional[List[str]] = None,
+                     quality: Optional[SourceQuality] = None) -> pd.DataFrame:
+        # Laczenie i oblcizanie sredniej dla nakladajacych sie dat - wynik juz posortowany po dacie
+        chunks = list(TimeSeriesMerger.iter_merged(weather_data_list, weights, variables=variables, quality=quality))
+
+        if not chunks:
+            raise InsufficientDataError("Brak dostepnych danych z zakresow czasowych z zrodla")
 
-        return merged
\ No newline at end of file
+        merged = chunks[0] if len(chunks) == 1 else pd.concat(chunks, ignore_index=True)
+        if quality is None:
+            return merged
+        # Raport jakosci w attrs (concat go nie przenosi); brakujace dni uzupelnione dla prognozy
+        merged.attrs["quality"] = chunks[0].attrs.get("quality", {})
+        return quality.fill_gaps(merged)
@@ -0,0 +1,127 @@
+﻿import asyncio
+import logging
+import threading
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "followers")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """Laczy rownoczesne wywolania o tym samym kluczu: liczy jedno, wynik dostaja wszyscy oczekujacy"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._stats = {"calls": 0, "executions": 0, "coalesced": 0}
+
+    def do(self, key: Hashable, func: Callable[..., Any], *args, **kwargs) -> Tuple[Any, bool]:
+        """Zwraca (wynik, czy_od_innego_wywolania); wspoldzielonego wyniku nie nalezy modyfikowac"""
+        with self._lock:
+            self._stats["calls"] += 1
+            call = self._calls.get(key)
+            if call is not None:
+                call.followers += 1
+                self._stats["coalesced"] += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self._stats["executions"] += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func(*args, **kwargs)
+        except BaseException as e:
+            # Oczekujacy dostaja ten sam wyjatek - bez ponawiania przez kazdego z nich
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            if call.followers:
+                logger.debug(f"{self.name}: wynik {key} przekazany {call.followers} oczekujacym")
+            call.done.set()
+
+        return call.result, False
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+
+class AsyncSingleFlight:
+    """SingleFlight dla korutyn: wspolne zadanie asyncio, anulowanie jednego oczekujacego nie przerywa pozostalych"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+        self._stats = {"calls": 0, "executions": 0, "coalesced": 0}
+
+    async def do(self, key: Hashable, func: Callable[..., Any], *args, **kwargs) -> Tuple[Any, bool]:
+        """func zwraca korutyne; wynik (wynik, czy_od_innego_wywolania) jak w SingleFlight.do"""
+        self._stats["calls"] += 1
+        task = self._tasks.get(key)
+        if task is not None and task.get_loop() is asyncio.get_running_loop():
+            self._stats["coalesced"] += 1
+            return await asyncio.shield(task), True
+
+        self._stats["executions"] += 1
+        task = asyncio.ensure_future(func(*args, **kwargs))
+        self._tasks[key] = task
+        task.add_done_callback(lambda done: self._finished(key, done))
+        return await asyncio.shield(task), False
+
+    def _finished(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        # Zadanie moglo zostac bez oczekujacych (np. po przekroczeniu czasu) - wyjatek nie trafia do logu petli
+        if not task.cancelled():
+            task.exception()
+
+    def in_flight(self) -> int:
+        return len(self._tasks)
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self._stats)
+
+
+_groups: Dict[str, SingleFlight] = {}
+_groups_lock = threading.Lock()
+
+
+def get_singleflight(name: str) -> SingleFlight:
+    """Wspolna grupa na proces - laczenie dziala miedzy watkami (sesje Streamlit, pula pobierania)"""
+    with _groups_lock:
+        if name not in _groups:
+            _groups[name] = SingleFlight(name)
+        return _groups[name]
+
+
+_async_groups: Dict[str, AsyncSingleFlight] = {}
+
+
+def get_async_singleflight(name: str) -> AsyncSingleFlight:
+    with _groups_lock:
+        if name not in _async_groups:
+            _async_groups[name] = AsyncSingleFlight(name)
+        return _async_groups[name]